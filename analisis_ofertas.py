@@ -0,0 +1,216 @@
+"""
+Análisis de ofertas con OpenAI: memoizado, concurrente y opcionalmente por lotes.
+
+El prompt sólo depende del precio de sucursal, el precio dominante y el margen, así que
+la respuesta se guarda por esa llave normalizada (con TTL) y se reutiliza entre ciclos.
+Las llamadas que faltan se hacen en paralelo bajo un token bucket, o empaquetadas en
+una sola petición que regresa un veredicto por oferta en JSON. Todo se resuelve antes
+de empezar a notificar.
+
+El cliente es inyectable: cualquier objeto con `chat.completions.create(...)` al estilo
+del SDK de OpenAI sirve, lo que permite probar contra un cliente falso local.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from limitador import TokenBucket
+from metricas import span
+
+ANALISIS_CACHE_FILE = "analisis_cache.json"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+CACHE_TTL = 7 * 24 * 3600  # segundos
+MAX_WORKERS = 4
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "60"))
+# 0 = una petición por oferta; N > 0 = hasta N ofertas por petición
+BATCH_SIZE = int(os.getenv("OPENAI_BATCH_SIZE", "0"))
+NO_DISPONIBLE = "Análisis no disponible."
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def prompt_key(precio, precio_dominante, margen):
+    return f"{precio:.2f}|{precio_dominante:.2f}|{margen:.2f}"
+
+
+def build_prompt(precio, precio_dominante, margen):
+    return f"""
+Analiza la siguiente oferta de un producto en distintas sucursales y determina si vale la pena comprarlo para reventa.
+Precio de sucursal: ${precio:,.2f}
+Precio dominante (más repetido): {precio_dominante}
+Margen calculado: ${margen:,.2f}
+¿Es una buena oportunidad? Responde con 'Sí' o 'No' y justifica brevemente (máx 20 palabras).
+"""
+
+
+def build_batch_prompt(casos):
+    """casos: lista de (id, precio, precio_dominante, margen)."""
+    lineas = "\n".join(
+        f"- id {i}: precio de sucursal ${precio:,.2f}, precio dominante ${dominante:,.2f}, margen ${margen:,.2f}"
+        for i, precio, dominante, margen in casos
+    )
+    return f"""
+Analiza las siguientes ofertas de productos en distintas sucursales y determina, para cada una, si vale la pena comprarla para reventa.
+{lineas}
+Responde sólo con JSON de la forma {{"veredictos": [{{"id": <id>, "respuesta": "<Sí o No y justificación breve, máx 20 palabras>"}}]}}, un elemento por oferta.
+"""
+
+
+def default_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+class OfferAnalyzer:
+    def __init__(self, client=None, model=OPENAI_MODEL, cache_path=ANALISIS_CACHE_FILE,
+                 ttl=CACHE_TTL, max_workers=MAX_WORKERS,
+                 requests_per_minute=REQUESTS_PER_MINUTE, batch_size=BATCH_SIZE):
+        self._client = client
+        self.model = model
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(requests_per_minute / 60.0, capacity=max_workers)
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.cache = None  # key -> (respuesta, timestamp)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = default_client()
+        return self._client
+
+    # --- Caché ---
+
+    def _load(self):
+        if self.cache is not None:
+            return
+        self.cache = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    self.cache = {k: tuple(v) for k, v in json.load(f).items()}
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Advertencia: no se pudo leer {self.cache_path}: {e}")
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        now = time.time()
+        vigentes = {k: v for k, v in self.cache.items() if now - v[1] < self.ttl}
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(vigentes, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def cached(self, key):
+        with self.lock:
+            self._load()
+            entry = self.cache.get(key)
+        if entry and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def _store(self, key, respuesta):
+        with self.lock:
+            self.cache[key] = (respuesta, time.time())
+
+    # --- Llamadas ---
+
+    def _complete(self, prompt, max_tokens, json_mode=False):
+        self.bucket.acquire()
+        kwargs = {}
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        with span("openai", mode="lote" if json_mode else "individual"):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=0.5,
+                **kwargs
+            )
+        return response.choices[0].message.content.strip()
+
+    def analyze_one(self, precio, precio_dominante, margen):
+        key = prompt_key(precio, precio_dominante, margen)
+        respuesta = self.cached(key)
+        if respuesta is not None:
+            return respuesta
+        try:
+            respuesta = self._complete(build_prompt(precio, precio_dominante, margen), max_tokens=50)
+        except Exception as e:
+            print(f"Error OpenAI: {e}")
+            return NO_DISPONIBLE
+        self._store(key, respuesta)
+        return respuesta
+
+    def _analyze_batch(self, casos):
+        """casos: {key: (precio, dominante, margen)}. Regresa las llaves que no se resolvieron."""
+        keys = list(casos)
+        numerados = [(i, *casos[key]) for i, key in enumerate(keys)]
+        try:
+            contenido = self._complete(
+                build_batch_prompt(numerados), max_tokens=60 * len(keys), json_mode=True
+            )
+            veredictos = json.loads(contenido).get("veredictos", [])
+        except Exception as e:
+            print(f"Error OpenAI (lote de {len(keys)}): {e}")
+            return keys
+
+        resueltas = set()
+        for veredicto in veredictos:
+            try:
+                key = keys[int(veredicto["id"])]
+                respuesta = str(veredicto["respuesta"]).strip()
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            if respuesta:
+                self._store(key, respuesta)
+                resueltas.add(key)
+        return [key for key in keys if key not in resueltas]
+
+    def analyze_all(self, deals):
+        """
+        Analiza todas las ofertas (Productos con precio_dominante y margen) antes del
+        envío. Regresa {deal_id: respuesta}.
+        """
+        casos = {}
+        deal_keys = {}
+        en_cache = 0
+        for p in deals:
+            key = prompt_key(p.precio, p.precio_dominante, p.margen)
+            deal_keys[p.deal_id] = key
+            if self.cached(key) is None:
+                casos[key] = (p.precio, p.precio_dominante, p.margen)
+            else:
+                en_cache += 1
+
+        if casos:
+            print(f"Análisis IA: {en_cache} ofertas resueltas en caché, {len(casos)} consultas por hacer.")
+            pendientes = list(casos)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                if self.batch_size > 0:
+                    lotes = [
+                        {key: casos[key] for key in pendientes[i:i + self.batch_size]}
+                        for i in range(0, len(pendientes), self.batch_size)
+                    ]
+                    # Lo que un lote no resolvió se pide de forma individual
+                    pendientes = [key for sobrantes in executor.map(self._analyze_batch, lotes) for key in sobrantes]
+                list(executor.map(lambda key: self.analyze_one(*casos[key]), pendientes))
+            with self.lock:
+                self._save()
+
+        return {deal_id: self.cached(key) or NO_DISPONIBLE for deal_id, key in deal_keys.items()}
+
+
+def get_analyzer():
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = OfferAnalyzer()
+        return _analyzer
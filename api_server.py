@@ -1,20 +1,175 @@
-from flask import Flask, request, jsonify
-import threading
+from flask import Flask, request, jsonify, Response
+from werkzeug.http import unquote_etag
 import sys
 import os
+import datetime
 
 # Añadir el directorio del proyecto al path para importar main_orchestrator
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from main_orchestrator import main_orchestrator
+from gestor_jobs import get_job_manager
+from indice_consultas import get_index, paginate, model_lookup_key
+from metricas import render_metrics
+from modelos_canonicos import get_model_index
+from historial_precios import get_price_history, WINDOW_DAYS
 
 app = Flask(__name__)
 
 @app.route('/run_scraper', methods=['POST'])
 def run_scraper():
-    # Ejecutar main_orchestrator en un hilo separado para no bloquear la respuesta HTTP
-    thread = threading.Thread(target=main_orchestrator)
-    thread.start()
-    return jsonify({"message": "Scraper iniciado en segundo plano."}), 202
+    # Una sola ejecución a la vez: si ya hay una en curso se regresa esa misma
+    body = request.get_json(silent=True) or {}
+    modo = body.get("modo", request.args.get("modo", "programado"))
+    try:
+        job, creado = get_job_manager().submit(modo)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if creado:
+        message = "Scraper iniciado en segundo plano."
+        status = 202
+    else:
+        message = "Ya hay una ejecución en curso; se regresa la existente."
+        status = 200
+    return jsonify({"message": message, "job": job.to_dict(detalle=False)}), status
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": [job.to_dict(detalle=False) for job in get_job_manager().list()]})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    return jsonify(job.to_dict(detalle=False)), 202
+
+MAX_PER_PAGE = 500
+
+def page_args():
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        per_page = min(MAX_PER_PAGE, max(1, int(request.args.get("per_page", 50))))
+    except ValueError:
+        return None
+    return page, per_page
+
+def indexed_response(request_key, build):
+    """
+    Respuesta JSON desde el índice en memoria con ETag / If-None-Match y gzip.
+    """
+    index = get_index()
+    if index is None:
+        return jsonify({"error": "Aún no hay un ciclo completado."}), 503
+
+    etag = index.etag(request_key)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    # If-None-Match es una lista de etiquetas (o `*`); se comparan en modo débil (RFC 9110)
+    if request.if_none_match.contains_weak(unquote_etag(etag)[0]):
+        return Response(status=304, headers=headers)
+
+    rendered = index.render(request_key, lambda: build(index))
+    if rendered is None:
+        return jsonify({"error": "No encontrado."}), 404
+    body, compressed = rendered
+    if compressed is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = compressed
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=200, mimetype="application/json", headers=headers)
+
+@app.route('/deals', methods=['GET'])
+def list_deals():
+    paging = page_args()
+    if paging is None:
+        return jsonify({"error": "page y per_page deben ser enteros."}), 400
+    page, per_page = paging
+    return indexed_response(
+        f"deals|{page}|{per_page}",
+        lambda index: paginate(index.deals, page, per_page)
+    )
+
+@app.route('/models/prices', methods=['GET'])
+def model_prices():
+    marca = request.args.get("marca", "")
+    modelo = request.args.get("modelo", "")
+    if not modelo:
+        return jsonify({"error": "El parámetro modelo es obligatorio."}), 400
+    paging = page_args()
+    if paging is None:
+        return jsonify({"error": "page y per_page deben ser enteros."}), 400
+    page, per_page = paging
+    # Las variantes de captura llevan al mismo modelo canónico
+    canonical = get_model_index().lookup(marca, modelo)
+    key = model_lookup_key(*(canonical[1] if canonical else (marca, modelo)))
+
+    def build(index):
+        model = index.models.get(key)
+        if model is None:
+            return None
+        data = paginate(model["precios"], page, per_page)
+        data.update({k: model[k] for k in ("marca", "modelo", "precio_dominante")})
+        return data
+
+    return indexed_response(f"model|{key[0]}|{key[1]}|{page}|{per_page}", build)
+
+@app.route('/stores/<id_sucursal>/inventory', methods=['GET'])
+def store_inventory(id_sucursal):
+    paging = page_args()
+    if paging is None:
+        return jsonify({"error": "page y per_page deben ser enteros."}), 400
+    page, per_page = paging
+
+    def build(index):
+        items = index.stores.get(id_sucursal)
+        if items is None:
+            return None
+        data = paginate(items, page, per_page)
+        data["id_sucursal"] = id_sucursal
+        return data
+
+    return indexed_response(f"store|{id_sucursal}|{page}|{per_page}", build)
+
+@app.route('/models/history', methods=['GET'])
+def model_history():
+    marca = request.args.get("marca", "")
+    modelo = request.args.get("modelo", "")
+    if not modelo:
+        return jsonify({"error": "El parámetro modelo es obligatorio."}), 400
+    try:
+        dias = int(request.args.get("dias", WINDOW_DAYS))
+    except ValueError:
+        return jsonify({"error": "dias debe ser entero."}), 400
+    canonical = get_model_index().lookup(marca, modelo)
+    stats = get_price_history().rolling_prices(dias, [canonical[0]]).get(canonical[0]) if canonical else None
+    if stats is None:
+        return jsonify({"error": "No encontrado."}), 404
+    data = stats.to_dict()
+    data.update({"marca": canonical[1][0], "modelo": canonical[1][1], "dias": dias})
+    return jsonify(data)
+
+@app.route('/skus/<sku>/history', methods=['GET'])
+def sku_history(sku):
+    try:
+        dias = int(request.args["dias"]) if "dias" in request.args else None
+    except ValueError:
+        return jsonify({"error": "dias debe ser entero."}), 400
+    history = get_price_history().sku_history(sku, request.args.get("id_sucursal"), dias)
+    if not history:
+        return jsonify({"error": "No encontrado."}), 404
+    return jsonify({"sku": sku, "precios": [
+        {"fecha": datetime.datetime.fromtimestamp(ts).isoformat(), "id_sucursal": id_sucursal, "precio": precio}
+        for ts, id_sucursal, precio in history
+    ]})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     # Asegurarse de que el entorno virtual esté activado si se ejecuta directamente
@@ -0,0 +1,250 @@
+"""
+Benchmark del arranque en frío de efectimundo.py: tiempo de importación y de cada
+subcomando en un proceso nuevo, contra el sitio local (sitio_local.py) y snapshots
+sintéticos en un directorio temporal.
+
+Casos:
+- python:    intérprete vacío (referencia; los demás se reportan también por encima de él).
+- import:    `import efectimundo`.
+- raspar:    una sucursal, dos familias, contra el catálogo local.
+- detectar:  un snapshot sintético a JSON de ofertas.
+- replay:    el mismo snapshot con snapshots_corrida.
+- notificar: un JSON de ofertas vacío (el piso del subcomando, sin red).
+- servir:    hasta la primera respuesta de /metrics.
+
+Cada caso corre una vez más con `python -X importtime` para sumar el tiempo de
+importación y ver qué módulos cargó. Es una regresión (código de salida 1):
+- que un caso cargue alguno de sus módulos prohibidos (p. ej. `detectar` con requests
+  u OpenAI, `servir` con el motor de scraping);
+- con --base, que el tiempo por encima del intérprete vacío supere el de la base en más
+  de --tolerancia (fracción) y --holgura (ms).
+
+Uso:
+    python benchmarks/bench_arranque.py [--repeticiones 5] [--filas 20000]
+                                        [--base BASE.json] [--guardar BASE.json] [--json SALIDA]
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitio_local import LocalSite
+from snapshots_corrida import FIELDS
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "efectimundo.py")
+SCRAPE_FAMILIES = "CELULARES,TABLETAS"
+SERVE_TIMEOUT = 30.0
+
+# Lo que carga el envío, el scraping y el API; ningún caso debe cargar lo de los otros
+# (importar cache_imagenes es barato: el archivo de la caché se lee en su primer uso)
+SENDING = {"notificador_slack", "cola_slack", "analisis_ofertas", "openai"}
+SCRAPING = {"motor_scraping", "scraper_completo", "requests"}
+CYCLE = {"main_orchestrator", "pipeline_ofertas", "cola_trabajo", "programador_sondeo"}
+SERVING = {"flask", "api_server", "gestor_jobs"}
+HEAVY = {"numpy", "urllib.request", "dotenv"}
+
+FORBIDDEN = {
+    "python": set(),
+    "import": SENDING | SCRAPING | CYCLE | SERVING | HEAVY | {"producto", "modelos_canonicos", "cache_imagenes"},
+    "raspar": SENDING | CYCLE | SERVING | {"numpy", "deteccion_ofertas", "historial_precios"},
+    "detectar": SENDING | SCRAPING | CYCLE | SERVING | {"urllib.request"},
+    "replay": SENDING | SCRAPING | CYCLE | SERVING | {"urllib.request"},
+    "notificar": SCRAPING | CYCLE | SERVING | {"numpy", "openai"},
+    "servir": SENDING | SCRAPING | CYCLE,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_snapshot(path, rows, models=2000, stores=90):
+    """Snapshot sintético: la mayoría al precio de lista del modelo, unos pocos rebajados."""
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for n in range(rows):
+            model = (n * 7919) % models
+            precio = 500 + (model % 97) * 100.0 - (300 if n % 53 == 0 else 0)
+            store = 100 + n % stores
+            writer.writerow((f"P{n}", f"Marca {model % 40}", f"Modelo {model}", "Artículo", repr(precio),
+                             f"Sucursal {store}", str(store)))
+
+
+def parse_importtime(stderr):
+    """(ms de importación de primer nivel, módulos cargados) de la salida de -X importtime."""
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue   # encabezado
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+class StartupBench:
+    def __init__(self, workdir, site, rows):
+        self.workdir = workdir
+        self.site = site
+        self.snapshot = os.path.join(workdir, "corrida.csv.gz")
+        write_snapshot(self.snapshot, rows)
+        self.deals = os.path.join(workdir, "vacias.json")
+        with open(self.deals, "w", encoding="utf-8") as f:
+            json.dump([], f)
+        with open(os.path.join(workdir, "stores.json"), "w", encoding="utf-8") as f:
+            json.dump({"101": "Sucursal 1"}, f)
+        # Sin caché de páginas ni planificador, para que cada `raspar` haga el mismo trabajo
+        self.env = dict(os.environ, CATALOG_URL=site.catalog_url, SLACK_WEBHOOK_URL=site.slack_url,
+                        CACHE_PAGINAS="0", SCRAPER_PLANIFICADOR="0", PYTHONDONTWRITEBYTECODE="1")
+        self.env.pop("PYTHONPROFILEIMPORTTIME", None)
+
+    def command(self, name):
+        cli = [sys.executable, CLI]
+        return {
+            "python": [sys.executable, "-c", "pass"],
+            "import": [sys.executable, "-c", f"import sys; sys.path.insert(0, {os.path.dirname(CLI)!r}); import efectimundo"],
+            "raspar": cli + ["raspar", "101", "--familias", SCRAPE_FAMILIES,
+                             "--salida", os.path.join(self.workdir, "sucursal.csv.gz")],
+            "detectar": cli + ["detectar", self.snapshot, "--salida", os.path.join(self.workdir, "ofertas.json")],
+            "replay": cli + ["replay", self.snapshot, "--top", "0"],
+            "notificar": cli + ["notificar", self.deals, "--espera", "0"],
+        }[name]
+
+    def run(self, name, importtime=False):
+        """(segundos, stderr) de una ejecución en frío."""
+        if name == "servir":
+            return self.run_server(importtime)
+        argv = self.command(name)
+        if importtime:
+            argv = [argv[0], "-X", "importtime"] + argv[1:]
+        start = time.perf_counter()
+        result = subprocess.run(argv, cwd=self.workdir, env=self.env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} terminó con {result.returncode}:\n{result.stderr[-2000:]}")
+        return wall, result.stderr
+
+    def run_server(self, importtime):
+        port = free_port()
+        argv = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+            [CLI, "servir", "--host", "127.0.0.1", "--port", str(port)]
+        url = f"http://127.0.0.1:{port}/metrics"
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=self.workdir, env=self.env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        try:
+            while True:
+                try:
+                    with urllib.request.urlopen(url, timeout=1) as response:
+                        response.read()
+                    break
+                except OSError:
+                    if proc.poll() is not None or time.perf_counter() - start > SERVE_TIMEOUT:
+                        raise RuntimeError(f"servir no respondió en {url}")
+                    time.sleep(0.005)
+            wall = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            _, stderr = proc.communicate()
+        return wall, stderr
+
+    def measure(self, name, repeticiones):
+        walls = sorted(self.run(name)[0] for _ in range(repeticiones))
+        _, stderr = self.run(name, importtime=True)
+        import_ms, modules = parse_importtime(stderr)
+        return {
+            "caso": name,
+            "ms_min": round(walls[0] * 1000, 1),
+            "ms_mediana": round(walls[len(walls) // 2] * 1000, 1),
+            "ms_importacion": round(import_ms, 1),
+            "modulos": len(modules),
+            "prohibidos": sorted(modules & FORBIDDEN[name]),
+        }
+
+
+def compare(results, base, tolerancia, holgura):
+    """Lista de regresiones contra los resultados de una corrida anterior."""
+    previous = {r["caso"]: r for r in base["resultados"]}
+    failures = []
+    for r in results:
+        old = previous.get(r["caso"])
+        if old is None or r["caso"] == "python":
+            continue
+        limit = old["ms_sobre_python"] * (1 + tolerancia) + holgura
+        if r["ms_sobre_python"] > limit:
+            failures.append(f"{r['caso']}: {r['ms_sobre_python']:.1f} ms sobre el intérprete "
+                            f"(base {old['ms_sobre_python']:.1f} ms, límite {limit:.1f} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del arranque en frío de efectimundo.py")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--filas", type=int, default=20000, help="Filas del snapshot sintético")
+    parser.add_argument("--casos", default=",".join(FORBIDDEN))
+    parser.add_argument("--base", help="Resultados guardados con --guardar contra los que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    parser.add_argument("--holgura", type=float, default=30.0, help="Milisegundos de ruido tolerados")
+    parser.add_argument("--guardar", help="Archivo donde guardar estos resultados como base")
+    parser.add_argument("--json", help="Archivo donde guardar los resultados")
+    args = parser.parse_args()
+
+    casos = args.casos.split(",")
+    if "python" not in casos:
+        casos.insert(0, "python")
+    site = LocalSite(rows_per_family=120, seed=1).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_arranque_") as workdir:
+            bench = StartupBench(workdir, site, args.filas)
+            for name in casos:
+                results.append(bench.measure(name, args.repeticiones))
+    finally:
+        site.stop()
+
+    python_ms = results[0]["ms_min"]
+    failures = []
+    print(f"{'caso':<10} {'min':>9} {'mediana':>9} {'s/python':>9} {'import':>9} {'módulos':>8}")
+    for r in results:
+        r["ms_sobre_python"] = round(r["ms_min"] - python_ms, 1)
+        print(f"{r['caso']:<10} {r['ms_min']:>7.1f}ms {r['ms_mediana']:>7.1f}ms {r['ms_sobre_python']:>7.1f}ms "
+              f"{r['ms_importacion']:>7.1f}ms {r['modulos']:>8}")
+        if r["prohibidos"]:
+            failures.append(f"{r['caso']} cargó {', '.join(r['prohibidos'])}")
+
+    summary = {"python": sys.version.split()[0], "resultados": results}
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            failures.extend(compare(results, json.load(f), args.tolerancia, args.holgura))
+    for path in (args.guardar, args.json):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+
+    if failures:
+        print("\nRegresiones:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nSin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Benchmark del ciclo completo y de cada etapa contra el sitio local (sitio_local.py).
+
+Etapas:
+- extraccion: TableExtractor + build_store_products sobre las páginas, sin red.
+- scraping:   ScrapeEngine.scrape_stores contra el catálogo local.
+- deteccion:  detect_grouped_deals sobre los productos raspados.
+- envio:      send_deals (imágenes, análisis con OpenAI local y outbox a Slack local)
+              hasta que el outbox queda vacío.
+- ciclo:      main_orchestrator.run_cycle de punta a punta, también hasta vaciar el outbox.
+- replay:     detección fuera de línea sobre el snapshot que dejó la etapa ciclo.
+
+Cada etapa reporta tiempo, peticiones/s, filas/s y memoria pico (tracemalloc). Las
+etapas con estado (cachés, snapshot, outbox) arrancan en frío en un directorio temporal.
+
+Uso:
+    python benchmarks/bench_ciclo.py [--fixtures DIR] [--stores N] [--latencia S]
+                                     [--error-rate F] [--etapas a,b] [--json SALIDA]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitio_local import LocalSite
+
+import scraper_completo
+import motor_scraping
+import notificador_slack
+import procesador_ofertas
+import analisis_ofertas
+import cache_imagenes
+import cola_slack
+import snapshot_skus
+import main_orchestrator
+import modelos_canonicos
+import historial_precios
+import snapshots_corrida
+from planificador_consultas import FetchPlanner
+from cache_paginas import PageCache
+from extractor_tabla import TableExtractor
+from deteccion_ofertas import detect_grouped_deals
+from scraper_completo import build_store_products, total_pages_for
+
+ETAPAS = ("extraccion", "scraping", "deteccion", "envio", "ciclo", "replay")
+# Familias configuradas en modo sintético; el sitio local tiene además otras que no se piden
+SYNTHETIC_FAMILIES = ["CELULARES", "LAPTOP Y MINI LAPTOP", "CONSOLAS DE JUEGOS", "TABLETAS", "AUDIFONOS", "SMARTWATCH"]
+
+
+class Bench:
+    def __init__(self, site, stores, familias, workdir, memoria=True, planificador=False, corridas=1,
+                 cache_paginas=False):
+        self.site = site
+        self.stores = stores
+        self.familias = familias
+        self.workdir = workdir
+        self.memoria = memoria
+        self.corridas = corridas
+        # El planificador conserva lo aprendido entre etapas y corridas
+        self.planner = FetchPlanner(os.path.join(workdir, "plan_consultas.db")) if planificador else None
+        self.page_cache = PageCache(os.path.join(workdir, "paginas_cache.db")) if cache_paginas else None
+        modelos_canonicos._index = modelos_canonicos.CanonicalModelIndex(os.path.join(workdir, "modelos_canonicos.db"))
+        historial_precios._history = historial_precios.PriceHistory(os.path.join(workdir, "historial_precios"))
+        self.snapshot_dir = os.path.join(workdir, "snapshots_corrida")
+        # run_cycle importa RunSnapshotWriter al correr: se sustituye en su módulo
+        writer = snapshots_corrida.RunSnapshotWriter
+        snapshots_corrida.RunSnapshotWriter = lambda: writer(self.snapshot_dir)
+        self.products = []
+        self.results = []
+
+    def point_to_site(self):
+        scraper_completo.CATALOG_URL = self.site.catalog_url
+        motor_scraping.CATALOG_URL = self.site.catalog_url
+        notificador_slack.SLACK_WEBHOOK_URL = self.site.slack_url
+        # El horario de envío no aplica al medir
+        procesador_ofertas.END_SEND_HOUR = 24
+
+    def fresh_state(self, name):
+        """Cachés, snapshot y outbox nuevos en un subdirectorio propio de la etapa."""
+        from openai import OpenAI
+
+        directory = os.path.join(self.workdir, name)
+        os.makedirs(directory, exist_ok=True)
+        cache_imagenes._cache = cache_imagenes.ImageCache(os.path.join(directory, "imagenes_cache.json"))
+        analisis_ofertas._analyzer = analisis_ofertas.OfferAnalyzer(
+            client=OpenAI(base_url=self.site.openai_base_url, api_key="local"),
+            cache_path=os.path.join(directory, "analisis_cache.json"),
+            requests_per_minute=60000,
+        )
+        if cola_slack._delivery is not None:
+            cola_slack._delivery.stop()
+        cola_slack._delivery = cola_slack.SlackDelivery(
+            os.path.join(directory, "outbox_slack.db"), messages_per_minute=60000
+        ).start()
+        snapshot_skus._store = snapshot_skus.SnapshotStore(os.path.join(directory, "snapshots_skus.db"))
+        main_orchestrator.expected_model_stores.clear()
+        motor_scraping._engine = motor_scraping.ScrapeEngine(
+            session=motor_scraping.build_session(), planner=self.planner, page_cache=self.page_cache
+        )
+
+    def measure(self, name, fn):
+        self.fresh_state(name)
+        self.site.reset_counts()
+        if self.memoria:
+            tracemalloc.start()
+        start = time.perf_counter()
+        rows = fn()
+        wall = time.perf_counter() - start
+        peak = 0
+        if self.memoria:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        requests_made = sum(v for k, v in self.site.counts.items() if "_" not in k)
+        result = {
+            "etapa": name,
+            "segundos": round(wall, 3),
+            "peticiones": requests_made,
+            "peticiones_por_segundo": round(requests_made / wall, 1) if wall else 0.0,
+            "filas": rows,
+            "filas_por_segundo": round(rows / wall, 1) if wall else 0.0,
+            "memoria_pico_mb": round(peak / 2**20, 1),
+            "detalle_peticiones": dict(self.site.counts),
+        }
+        self.results.append(result)
+        print(f"{name:<11} {result['segundos']:>8.3f}s  {requests_made:>6} pet  "
+              f"{result['peticiones_por_segundo']:>8.1f} pet/s  {rows:>8} filas  "
+              f"{result['filas_por_segundo']:>10.1f} filas/s  {result['memoria_pico_mb']:>7.1f} MB")
+        return result
+
+    # --- Etapas ---
+
+    def catalog_pages(self):
+        """{(id_sucursal, familia): [tabla de cada página]} desde el sitio local, sin HTTP."""
+        pages = {}
+        for id_sucursal in self.stores:
+            for familia in self.familias:
+                first = json.loads(self.site.catalog_page(id_sucursal, familia, 1))
+                if not first.get("tabla"):
+                    continue
+                tablas = [first["tabla"]]
+                for pagina in range(2, total_pages_for(first) + 1):
+                    data = json.loads(self.site.catalog_page(id_sucursal, familia, pagina))
+                    if data.get("tabla"):
+                        tablas.append(data["tabla"])
+                pages[(id_sucursal, familia)] = tablas
+        return pages
+
+    def stage_extraccion(self):
+        pages = self.catalog_pages()
+
+        def run():
+            total = 0
+            for (id_sucursal, _), tablas in pages.items():
+                extractor = TableExtractor.from_html(tablas[0])
+                rows = [row for tabla in tablas for row in extractor.rows(tabla)]
+                total += len(build_store_products(extractor.columns, rows, id_sucursal, self.stores[id_sucursal]))
+            return total
+
+        return self.measure("extraccion", run)
+
+    def stage_scraping(self):
+        def run():
+            self.products = []
+            engine = motor_scraping.get_engine()
+            for _, _, products in engine.scrape_stores(self.stores, self.familias):
+                self.products.extend(products)
+            return len(self.products)
+
+        for corrida in range(1, self.corridas + 1):
+            self.measure("scraping" if self.corridas == 1 else f"scraping#{corrida}", run)
+
+    def grouped(self):
+        groups = {}
+        for p in self.products:
+            groups.setdefault(p.model_key, []).append(p)
+        return groups
+
+    def stage_deteccion(self):
+        def run():
+            detect_grouped_deals(self.grouped(), procesador_ofertas.MIN_DOMINANT_FREQ,
+                                 procesador_ofertas.MIN_PROFIT_THRESHOLD)
+            return len(self.products)
+
+        return self.measure("deteccion", run)
+
+    def stage_envio(self):
+        _, deals = detect_grouped_deals(self.grouped(), procesador_ofertas.MIN_DOMINANT_FREQ,
+                                        procesador_ofertas.MIN_PROFIT_THRESHOLD)
+
+        def run():
+            procesador_ofertas.send_deals(list(deals))
+            cola_slack._delivery.wait_idle()
+            return len(deals)
+
+        return self.measure("envio", run)
+
+    def stage_ciclo(self):
+        def run():
+            aggregator = main_orchestrator.run_cycle(self.stores, self.familias)
+            cola_slack._delivery.wait_idle()
+            return aggregator.total_products
+
+        return self.measure("ciclo", run)
+
+    def stage_replay(self):
+        paths = snapshots_corrida.list_snapshots(self.snapshot_dir)[-1:]
+        rows = sum(len(chunk) for path in paths for chunk in snapshots_corrida.read_snapshot(path))
+
+        def run():
+            snapshots_corrida.replay(paths, procesador_ofertas.MIN_DOMINANT_FREQ,
+                                     procesador_ofertas.MIN_PROFIT_THRESHOLD)
+            return rows
+
+        return self.measure("replay", run)
+
+
+def load_scenario(args):
+    if args.fixtures:
+        with open(os.path.join(args.fixtures, "stores.json"), encoding="utf-8") as f:
+            stores = json.load(f)
+        with open(os.path.join(args.fixtures, "familias.json"), encoding="utf-8") as f:
+            familias = json.load(f)
+    else:
+        stores = {str(100 + i): f"Sucursal {i}" for i in range(args.stores)}
+        familias = SYNTHETIC_FAMILIES
+    if args.stores and len(stores) > args.stores:
+        stores = dict(list(stores.items())[:args.stores])
+    return stores, familias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del ciclo contra el sitio local")
+    parser.add_argument("--fixtures", help="Directorio grabado con grabar_fixtures.py (por defecto, sintético)")
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--filas", type=int, default=600, help="Filas por familia en modo sintético")
+    parser.add_argument("--latencia", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--etapas", default=",".join(ETAPAS))
+    parser.add_argument("--sin-memoria", action="store_true", help="No medir memoria (tracemalloc agrega overhead)")
+    parser.add_argument("--planificador", action="store_true", help="Usar el planificador de consultas")
+    parser.add_argument("--corridas", type=int, default=1, help="Repeticiones de la etapa scraping")
+    parser.add_argument("--cache-paginas", action="store_true", help="Usar la caché de páginas entre corridas")
+    parser.add_argument("--json", help="Archivo donde guardar los resultados")
+    args = parser.parse_args()
+
+    etapas = [e for e in args.etapas.split(",") if e]
+    invalidas = set(etapas) - set(ETAPAS)
+    if invalidas:
+        parser.error(f"Etapas inválidas: {', '.join(sorted(invalidas))}")
+    # deteccion y envio trabajan sobre lo que raspó scraping
+    if {"deteccion", "envio"} & set(etapas) and "scraping" not in etapas:
+        etapas.insert(0, "scraping")
+    # replay lee el snapshot que escribe ciclo
+    if "replay" in etapas and "ciclo" not in etapas:
+        etapas.append("ciclo")
+
+    stores, familias = load_scenario(args)
+    site = LocalSite(args.fixtures, args.latencia, args.jitter, args.error_rate,
+                     rows_per_family=args.filas, seed=7).start()
+    with tempfile.TemporaryDirectory(prefix="bench_ciclo_") as workdir:
+        bench = Bench(site, stores, familias, workdir, memoria=not args.sin_memoria,
+                      planificador=args.planificador, corridas=args.corridas,
+                      cache_paginas=args.cache_paginas)
+        bench.point_to_site()
+        print(f"{len(stores)} sucursales x {len(familias)} familias; latencia {args.latencia}s, "
+              f"errores {args.error_rate:.0%}; sitio local en {site.url}")
+        for etapa in ETAPAS:
+            if etapa in etapas:
+                getattr(bench, f"stage_{etapa}")()
+        if cola_slack._delivery is not None:
+            cola_slack._delivery.stop()
+    site.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(bench.results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: detección de ofertas con dict + Counter (original) contra la versión
+vectorizada de deteccion_ofertas.
+
+Uso:
+    python benchmarks/bench_deteccion.py [--rows N] [--models M] [--repeat R]
+
+Por defecto mide 10x el catálogo actual (~150k filas: 93 sucursales x 11 familias).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deteccion_ofertas import detect_deals
+
+MIN_DOMINANT_FREQ = 3
+MIN_PROFIT_THRESHOLD = 100.0
+CATALOG_ROWS = 150_000
+
+
+def synthetic_columns(rows, models, stores=93, seed=7):
+    rng = np.random.default_rng(seed)
+    # La mitad de las filas cae en el 5% de modelos más populares
+    populares = max(1, models // 20)
+    model_ids = np.where(
+        rng.random(rows) < 0.5,
+        rng.integers(0, populares, rows),
+        rng.integers(0, models, rows)
+    ).astype(np.int64)
+    base = 500 + (np.arange(models) % 97) * 100.0
+    # La mayoría al precio de lista; unos pocos con rebaja
+    ruido = rng.choice([0, -50, -150, -300, 100], size=rows, p=[0.9, 0.04, 0.03, 0.01, 0.02])
+    prices = base[model_ids] + ruido
+    store_ids = rng.integers(0, stores, rows)
+    return model_ids, prices, store_ids
+
+
+def legacy_detect(model_ids, prices):
+    """Algoritmo original: agrupar en dict, Counter por modelo y recontar por oferta."""
+    deals_by_model = {}
+    for model_id, precio in zip(model_ids.tolist(), prices.tolist()):
+        deals_by_model.setdefault(model_id, []).append(precio)
+
+    deals = []
+    for model_id, precios in deals_by_model.items():
+        if len(precios) < 2:
+            continue
+        precio_dominante, frecuencia = Counter(precios).most_common(1)[0]
+        if frecuencia < MIN_DOMINANT_FREQ:
+            continue
+        for precio in precios:
+            if precio < precio_dominante and precio_dominante - precio >= MIN_PROFIT_THRESHOLD:
+                deals.append((model_id, precio, precio_dominante - precio))
+    deals.sort(key=lambda d: d[2], reverse=True)
+
+    # El ciclo de envío recalculaba el Counter del modelo por cada oferta
+    for model_id, _, _ in deals:
+        Counter(deals_by_model[model_id]).most_common(1)
+    return len(deals)
+
+
+def vector_detect(model_ids, prices, store_ids):
+    return len(detect_deals(model_ids, prices, store_ids, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD))
+
+
+def bench(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10 * CATALOG_ROWS)
+    parser.add_argument("--models", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="No medir el algoritmo original")
+    args = parser.parse_args()
+
+    model_ids, prices, store_ids = synthetic_columns(args.rows, args.models)
+    print(f"Filas: {args.rows:,}  Modelos: {args.models:,}")
+
+    ofertas, segundos = bench(vector_detect, model_ids, prices, store_ids, repeat=args.repeat)
+    print(f"{'vectorizado':12s} {ofertas:8d} ofertas  {segundos * 1000:9.1f} ms  {args.rows / segundos:12,.0f} filas/s")
+
+    if not args.skip_legacy:
+        ofertas_legacy, segundos = bench(legacy_detect, model_ids, prices, repeat=args.repeat)
+        print(f"{'original':12s} {ofertas_legacy:8d} ofertas  {segundos * 1000:9.1f} ms  {args.rows / segundos:12,.0f} filas/s")
+        if ofertas_legacy != ofertas:
+            print("ADVERTENCIA: el número de ofertas no coincide.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Benchmark: TableParser (original) contra TableExtractor sobre páginas del catálogo.
+
+Uso:
+    python benchmarks/bench_extractor.py [--pages DIR] [--repeat N]
+
+DIR contiene respuestas JSON grabadas de consulta_catalogo.php (una por archivo, con la
+llave `tabla`). Sin --pages se generan páginas sintéticas con el mismo formato.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper_completo import TableParser
+from extractor_tabla import TableExtractor, PROJECTED_COLUMNS
+
+HEADERS = ["Prenda / Sku Lote", "Sucursal", "Ramo", "Tipo", "Familia", "Marca", "Modelo",
+           "Descripción", "Precio Venta", "Precio Promoción", "Estatus"]
+
+
+def synthetic_page(page_number, familia="CELULARES", rows=50):
+    body = []
+    for i in range(rows):
+        n = (page_number - 1) * rows + i
+        descripcion = "Pantalla estrellada, equipo DAÑADO" if n % 17 == 0 else f"Equipo {n % 13} con cargador &amp; caja"
+        precio = 2500 + (n % 9) * 150
+        cells = [f"{100000 + n}-1", "Sucursal", "ELECTRONICA", "USADO", familia, "Samsung",
+                 f"Galaxy A{n % 40}", descripcion, f"${precio + 500:,.2f}", f"${precio:,.2f}", "DISPONIBLE"]
+        body.append("<tr>" + "".join(f"<td class=\"text-center\">{c}</td>" for c in cells) + "</tr>")
+    head = "<tr>" + "".join(f"<th>{h}</th>" for h in HEADERS) + "</tr>"
+    return f"<table class=\"table\"><thead>{head}</thead><tbody>{''.join(body)}</tbody></table>"
+
+
+def load_pages(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("tabla"):
+            pages.append(data["tabla"])
+    return pages
+
+
+def run_table_parser(pages):
+    """Ruta original: TableParser nuevo por página + dict por fila + filtro de dañados."""
+    rows_out = 0
+    for tabla in pages:
+        parser = TableParser()
+        parser.feed(tabla)
+        headers = parser.headers
+        for row in parser.rows:
+            product_dict = {headers[j]: item for j, item in enumerate(row)}
+            descripcion = product_dict.get("Descripción", "").lower()
+            tipo = product_dict.get("Tipo", "").lower()
+            if "dañado" in descripcion or "dañado" in tipo:
+                continue
+            rows_out += 1
+    return rows_out
+
+
+def run_extractor(pages):
+    rows_out = 0
+    extractor = TableExtractor.from_html(pages[0])
+    for tabla in pages:
+        for _ in extractor.rows(tabla):
+            rows_out += 1
+    return rows_out
+
+
+def check_equivalence(pages):
+    """Compara las columnas proyectadas de ambos parsers; regresa el número de diferencias."""
+    extractor = TableExtractor.from_html(pages[0])
+    diferencias = 0
+    for tabla in pages:
+        parser = TableParser()
+        parser.feed(tabla)
+        esperadas = []
+        for row in parser.rows:
+            d = {parser.headers[j]: item for j, item in enumerate(row)}
+            if "dañado" in d.get("Descripción", "").lower() or "dañado" in d.get("Tipo", "").lower():
+                continue
+            esperadas.append(tuple(d.get(c, "") for c in PROJECTED_COLUMNS))
+        obtenidas = list(extractor.rows(tabla))
+        diferencias += sum(1 for a, b in zip(esperadas, obtenidas) if a != b)
+        diferencias += abs(len(esperadas) - len(obtenidas))
+    return diferencias
+
+
+def bench(fn, pages, repeat):
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn(pages)
+        best = min(best, time.perf_counter() - start)
+    return rows, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="Directorio con respuestas JSON grabadas")
+    parser.add_argument("--synthetic", type=int, default=200, help="Páginas sintéticas si no hay --pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = load_pages(args.pages)
+        origen = args.pages
+    else:
+        pages = [synthetic_page(p) for p in range(1, args.synthetic + 1)]
+        origen = "sintéticas"
+    if not pages:
+        print("No hay páginas para medir.")
+        return 1
+
+    print(f"Páginas: {len(pages)} ({origen})")
+    diferencias = check_equivalence(pages)
+    print(f"Diferencias entre parsers en columnas proyectadas: {diferencias}")
+
+    for nombre, fn in (("TableParser", run_table_parser), ("TableExtractor", run_extractor)):
+        rows, seconds = bench(fn, pages, args.repeat)
+        print(f"{nombre:15s} {rows:8d} filas  {seconds * 1000:9.1f} ms  {rows / seconds:12,.0f} filas/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
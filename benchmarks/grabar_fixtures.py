@@ -0,0 +1,114 @@
+"""
+Modo grabación: raspa el catálogo real con el motor de scraping y guarda cada respuesta
+de consulta_catalogo.php y de guardayMuestaImagenes como fixture, para reproducirlas
+después con sitio_local.py.
+
+Estructura del directorio:
+    DIR/catalogo/<id_sucursal>__<familia>__<pagina>.json   (cuerpo tal cual)
+    DIR/imagenes/<sku>.json
+
+Los archivos de catalogo/ también sirven como --pages de bench_extractor.py.
+
+Uso:
+    python benchmarks/grabar_fixtures.py DIR [--stores N] [--familias F1,F2] [--imagenes N]
+"""
+import argparse
+import json
+import os
+import sys
+from urllib.parse import urlsplit, parse_qs, quote
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _safe(value):
+    return quote(str(value), safe="")
+
+
+def catalog_fixture_path(directory, id_sucursal, familia, pagina):
+    return os.path.join(directory, "catalogo", f"{_safe(id_sucursal)}__{_safe(familia)}__{int(pagina)}.json")
+
+
+def image_fixture_path(directory, sku):
+    return os.path.join(directory, "imagenes", f"{_safe(sku)}.json")
+
+
+class RecordingSession(requests.Session):
+    """Sesión que escribe en `directory` cada respuesta 200 del catálogo o de imágenes."""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.recorded = 0
+        os.makedirs(os.path.join(directory, "catalogo"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "imagenes"), exist_ok=True)
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        response = super().request(method, url, params=params, data=data, **kwargs)
+        if response.status_code == 200:
+            path = self.fixture_path(url, params, data)
+            if path is not None:
+                with open(path, "wb") as f:
+                    f.write(response.content)
+                self.recorded += 1
+        return response
+
+    def fixture_path(self, url, params, data):
+        query = {k: v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+        query.update(params or {})
+        metodo = query.get("metodo")
+        if metodo == "consulta_catalogo":
+            pagina = (data or {}).get("pagina", 1)
+            return catalog_fixture_path(self.directory, query.get("id_sucursal", ""), query.get("familia", ""), pagina)
+        if metodo == "guardayMuestaImagenes":
+            return image_fixture_path(self.directory, query.get("prenda", ""))
+        return None
+
+
+def record(directory, stores, familias, max_images):
+    from motor_scraping import ScrapeEngine
+    from scraper_completo import fetch_image_urls
+
+    session = RecordingSession(directory)
+    engine = ScrapeEngine(session=session)
+    skus = []
+    for id_sucursal, nombre_sucursal, products in engine.scrape_stores(stores, familias):
+        print(f"Grabada {nombre_sucursal}: {len(products)} productos")
+        skus.extend(p.sku for p in products if p.sku)
+
+    for sku in skus[:max_images]:
+        try:
+            fetch_image_urls(sku, session=session)
+        except Exception as e:
+            print(f"Error al grabar imágenes de {sku}: {e}")
+
+    with open(os.path.join(directory, "stores.json"), "w", encoding="utf-8") as f:
+        json.dump(stores, f, indent=4, ensure_ascii=False)
+    with open(os.path.join(directory, "familias.json"), "w", encoding="utf-8") as f:
+        json.dump(familias, f, indent=4, ensure_ascii=False)
+    print(f"{session.recorded} respuestas grabadas en {directory}")
+
+
+def main():
+    from main_orchestrator import load_json_file, STORES_FILE
+    from scraper_completo import FAMILIAS
+
+    parser = argparse.ArgumentParser(description="Graba respuestas reales del catálogo como fixtures")
+    parser.add_argument("directory")
+    parser.add_argument("--stores", type=int, default=3, help="Número de sucursales de stores.json a grabar")
+    parser.add_argument("--familias", help="Lista separada por comas (por defecto, todas)")
+    parser.add_argument("--imagenes", type=int, default=50, help="SKUs a los que se les graban imágenes")
+    args = parser.parse_args()
+
+    stores_data = load_json_file(STORES_FILE)
+    if stores_data is None:
+        sys.exit(1)
+    stores = dict(list(stores_data.items())[:args.stores])
+    familias = args.familias.split(",") if args.familias else FAMILIAS
+    record(args.directory, stores, familias, args.imagenes)
+
+
+if __name__ == "__main__":
+    main()
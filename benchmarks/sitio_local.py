@@ -0,0 +1,264 @@
+"""
+Servidor local que sustituye al catálogo de Efectimundo, a OpenAI y al webhook de Slack
+para medir el sistema sin tocar servicios reales.
+
+- consulta_catalogo.php / guardayMuestaImagenes: responde con las fixtures grabadas por
+  grabar_fixtures.py o, sin directorio de fixtures, con páginas sintéticas.
+- POST /v1/chat/completions: respuesta al estilo de OpenAI (individual o en JSON por lote).
+- POST /slack: siempre 200 "ok".
+
+Latencia y errores configurables: cada petición al catálogo espera `latencia` segundos
+(más/menos `jitter`) y con probabilidad `error_rate` regresa 503 o 429 con Retry-After.
+
+Uso:
+    python benchmarks/sitio_local.py [--fixtures DIR] [--port 8800] [--latencia 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper_completo import PAGE_SIZE
+from bench_extractor import HEADERS
+from grabar_fixtures import catalog_fixture_path, image_fixture_path
+
+SYNTHETIC_ROWS_PER_FAMILY = 120
+SYNTHETIC_FAMILIES = ["CELULARES", "LAPTOP Y MINI LAPTOP", "CONSOLAS DE JUEGOS", "TABLETAS", "AUDIFONOS",
+                      "SMARTWATCH", "HERRAMIENTAS", "JOYERIA"]
+BATCH_ID_RE = re.compile(r"- id (\d+):")
+
+
+def synthetic_family_size(id_sucursal, familia, rows_per_family):
+    """Tamaño de la familia en la sucursal: variable y vacía en ~20% de las parejas."""
+    rng = random.Random(f"{id_sucursal}|{familia}|tamaño")
+    if rng.random() < 0.2:
+        return 0
+    return rng.randrange(rows_per_family // 2, rows_per_family * 3 // 2 + 1)
+
+
+def synthetic_row(id_sucursal, familia, n):
+    """
+    Fila con el formato del catálogo: la mayoría de los artículos a precio de lista del
+    modelo y alrededor de 5% con rebaja, distinta por sucursal.
+    """
+    rng = random.Random(f"{id_sucursal}|{familia}|{n}")
+    modelo = rng.randrange(60)
+    precio = 1500 + modelo * 125
+    if rng.random() < 0.05:
+        precio -= rng.choice((150, 300, 600))
+    descripcion = "Pantalla estrellada, equipo DAÑADO" if rng.random() < 0.03 else f"Equipo {n % 13} con cargador"
+    cells = [f"{id_sucursal}{zlib.crc32(familia.encode()) % 1000:03d}{n:05d}-1", "Sucursal", "ELECTRONICA", "USADO", familia,
+             "Samsung", f"Galaxy A{modelo}", descripcion, f"${precio + 500:,.2f}", f"${precio:,.2f}", "DISPONIBLE"]
+    return "<tr>" + "".join(f"<td class=\"text-center\">{c}</td>" for c in cells) + "</tr>"
+
+
+def synthetic_table(rows):
+    head = "<tr>" + "".join(f"<th>{h}</th>" for h in HEADERS) + "</tr>"
+    return f"<table class=\"table\"><thead>{head}</thead><tbody>{''.join(rows)}</tbody></table>"
+
+
+def fake_completion(body):
+    prompt = body["messages"][-1]["content"]
+    if body.get("response_format", {}).get("type") == "json_object":
+        ids = [int(i) for i in BATCH_ID_RE.findall(prompt)]
+        content = json.dumps({"veredictos": [
+            {"id": i, "respuesta": "Sí, margen suficiente para reventa (respuesta local)."} for i in ids
+        ]}, ensure_ascii=False)
+    else:
+        content = "Sí, margen suficiente para reventa (respuesta local)."
+    return {
+        "id": "chatcmpl-local",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "local"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class LocalSite:
+    def __init__(self, fixtures=None, latencia=0.0, jitter=0.0, error_rate=0.0,
+                 rows_per_family=SYNTHETIC_ROWS_PER_FAMILY, host="127.0.0.1", port=0, seed=None,
+                 familias=SYNTHETIC_FAMILIES):
+        self.fixtures = fixtures
+        # Familias que existen en cada sucursal sintética (también las no configuradas)
+        self.familias = list(familias)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rows_per_family = rows_per_family
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def catalog_url(self):
+        return f"{self.url}/catalogo/consulta_catalogo.php"
+
+    @property
+    def openai_base_url(self):
+        return f"{self.url}/v1"
+
+    @property
+    def slack_url(self):
+        return f"{self.url}/slack"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="sitio-local", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+            self.bytes_sent = 0
+
+    # --- Respuestas ---
+
+    def _read_fixture(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def catalog_page(self, id_sucursal, familia, pagina):
+        if self.fixtures:
+            body = self._read_fixture(catalog_fixture_path(self.fixtures, id_sucursal, familia, pagina))
+            return body if body is not None else json.dumps({"tabla": "", "rowCount": 0}).encode()
+        # familia vacía: todas las familias de la sucursal, una tras otra
+        familias = [familia] if familia else self.familias
+        sizes = [synthetic_family_size(id_sucursal, f, self.rows_per_family) for f in familias]
+        total = sum(sizes)
+        start = (pagina - 1) * PAGE_SIZE
+        rows = []
+        offset = 0
+        for f, size in zip(familias, sizes):
+            for n in range(max(start - offset, 0), min(size, start + PAGE_SIZE - offset)):
+                rows.append(synthetic_row(id_sucursal, f, n))
+            offset += size
+        tabla = synthetic_table(rows) if rows else ""
+        return json.dumps({"tabla": tabla, "rowCount": total}, ensure_ascii=False).encode()
+
+    def image_lookup(self, sku):
+        if self.fixtures:
+            body = self._read_fixture(image_fixture_path(self.fixtures, sku))
+            if body is not None:
+                return body
+            return json.dumps({"estatus": False}).encode()
+        return json.dumps({"estatus": True, "listaImagenes": [{"href": f"./imagenes/{sku}.jpg"}]}).encode()
+
+    def injected_error(self):
+        """Regresa (status, retry_after) si toca inyectar un error, o None."""
+        if self.error_rate and self.random.random() < self.error_rate:
+            return (429, "1") if self.random.random() < 0.2 else (503, "0")
+        return None
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body=b"", content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with site.lock:
+                    site.bytes_sent += len(body)
+
+            def do_POST(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+
+                if parts.path == "/slack":
+                    with site.lock:
+                        site.counts["slack"] += 1
+                    return self._send(200, b"ok", "text/plain")
+                if parts.path == "/v1/chat/completions":
+                    with site.lock:
+                        site.counts["openai"] += 1
+                    return self._send(200, json.dumps(fake_completion(json.loads(raw)), ensure_ascii=False).encode())
+
+                metodo = query.get("metodo", [""])[0]
+                kind = "catalogo" if metodo == "consulta_catalogo" else "imagenes"
+                with site.lock:
+                    site.counts[kind] += 1
+                if site.latencia or site.jitter:
+                    time.sleep(max(0.0, site.latencia + site.random.uniform(-site.jitter, site.jitter)))
+                error = site.injected_error()
+                if error is not None:
+                    status, retry_after = error
+                    with site.lock:
+                        site.counts[f"{kind}_{status}"] += 1
+                    return self._send(status, b"", headers={"Retry-After": retry_after})
+
+                if kind == "catalogo":
+                    form = parse_qs(raw.decode("utf-8"))
+                    body = site.catalog_page(
+                        query.get("id_sucursal", [""])[0],
+                        query.get("familia", [""])[0],
+                        int(form.get("pagina", ["1"])[0]),
+                    )
+                else:
+                    body = site.image_lookup(query.get("prenda", [""])[0])
+                return self._send(200, body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sustituto local del catálogo, OpenAI y Slack")
+    parser.add_argument("--fixtures", help="Directorio grabado con grabar_fixtures.py (por defecto, sintético)")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos por petición al catálogo")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503/429")
+    args = parser.parse_args()
+
+    site = LocalSite(args.fixtures, args.latencia, args.jitter, args.error_rate, port=args.port).start()
+    print(f"Catálogo: {site.catalog_url}")
+    print(f"OpenAI:   {site.openai_base_url}")
+    print(f"Slack:    {site.slack_url}")
+    try:
+        site.thread.join()
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Caché única de URLs de imágenes por SKU, compartida por scraper_completo y
+procesador_ofertas.
+
+- Tamaño acotado con desalojo LRU y TTL por entrada; los resultados vacíos (SKU sin
+  imágenes) se guardan con un TTL más corto.
+- Persistencia a prueba de caídas: cada alta se agrega a un journal (una línea JSON) y
+  periódicamente se compacta a `imagenes_cache.json` escribiendo a un temporal y
+  renombrando (os.replace), así nunca queda un archivo a medias.
+- Varios procesos pueden compartir los archivos (orquestador, `efectimundo.py
+  notificar`): el journal se escribe y se compacta bajo un bloqueo de archivo
+  (`imagenes_cache.json.lock`) y al compactar se une lo que otros procesos agregaron.
+- `prefetch` resuelve en paralelo, con la sesión HTTP compartida, todos los SKUs que
+  falten antes de empezar a enviar.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from metricas import registry
+
+IMAGENES_CACHE_FILE = "imagenes_cache.json"
+MAX_ENTRIES = int(os.getenv("IMAGENES_CACHE_MAX", "50000"))
+TTL = 7 * 24 * 3600           # segundos para SKUs con imágenes
+NEGATIVE_TTL = 6 * 3600       # segundos para SKUs sin imágenes
+COMPACT_EVERY = 500           # líneas de journal antes de compactar
+PREFETCH_WORKERS = 8
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ImageCache:
+    def __init__(self, path=IMAGENES_CACHE_FILE, max_entries=MAX_ENTRIES, ttl=TTL,
+                 negative_ttl=NEGATIVE_TTL, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.lock_path = path + ".lock"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.compact_every = compact_every
+        # sku -> (imagenes, timestamp)
+        self.entries = OrderedDict()
+        self.journal_lines = 0
+        self.lock = threading.RLock()
+        self.loaded = False
+
+    # --- Persistencia ---
+
+    @contextmanager
+    def _file_lock(self):
+        """Bloqueo exclusivo entre procesos sobre el journal y el archivo compactado."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_disk(self):
+        """[(sku, imagenes, ts)] del archivo compactado y luego del journal, en orden."""
+        items = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Advertencia: no se pudo leer {self.path}: {e}")
+                data = {}
+            if "entries" in data:
+                items.extend((sku, imagenes, ts) for sku, (imagenes, ts) in data["entries"].items())
+            else:
+                # Formato anterior: {sku: [urls]} sin fecha; se toma la del archivo
+                ts = os.path.getmtime(self.path)
+                items.extend((sku, imagenes, ts) for sku, imagenes in data.items())
+
+        journal_lines = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última línea truncada por una caída
+                        continue
+                    items.append((item["sku"], item["imagenes"], item["ts"]))
+                    journal_lines += 1
+        return items, journal_lines
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        items, self.journal_lines = self._read_disk()
+        for sku, imagenes, ts in items:
+            self.entries[sku] = (imagenes, ts)
+            self.entries.move_to_end(sku)
+        self._evict()
+
+    def _merge_disk(self):
+        """Une lo que otros procesos escribieron desde que se cargó; gana la entrada más nueva."""
+        for sku, imagenes, ts in self._read_disk()[0]:
+            current = self.entries.get(sku)
+            if current is None or current[1] < ts:
+                self.entries[sku] = (imagenes, ts)
+
+    def compact(self):
+        """Escribe el estado completo (unido con el de disco) de forma atómica y vacía el journal."""
+        with self.lock, self._file_lock():
+            self._compact()
+
+    def _compact(self):
+        self._load()
+        self._merge_disk()
+        self._evict()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 2, "entries": self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_lines = 0
+
+    def _append_journal(self, sku, imagenes, ts):
+        with self._file_lock():
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"sku": sku, "imagenes": imagenes, "ts": ts}) + "\n")
+            self.journal_lines += 1
+            if self.journal_lines >= self.compact_every:
+                self._compact()
+
+    # --- Acceso ---
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _is_fresh(self, imagenes, ts, now):
+        ttl = self.ttl if imagenes else self.negative_ttl
+        return now - ts < ttl
+
+    def get(self, sku):
+        """Lista de URLs (posiblemente vacía) si hay entrada vigente; None si no."""
+        with self.lock:
+            self._load()
+            entry = self.entries.get(sku)
+            if entry is None:
+                return None
+            imagenes, ts = entry
+            if not self._is_fresh(imagenes, ts, time.time()):
+                del self.entries[sku]
+                return None
+            self.entries.move_to_end(sku)
+            return imagenes
+
+    def __contains__(self, sku):
+        return self.get(sku) is not None
+
+    def set(self, sku, imagenes):
+        with self.lock:
+            self._load()
+            ts = time.time()
+            self.entries[sku] = (imagenes, ts)
+            self.entries.move_to_end(sku)
+            self._evict()
+            self._append_journal(sku, imagenes, ts)
+
+    def prefetch(self, skus, fetch=None, max_workers=PREFETCH_WORKERS):
+        """
+        Resuelve en paralelo los SKUs que no estén en caché y regresa {sku: imagenes}
+        para todos. Los errores de red no se cachean (se reintentan la próxima vez).
+        """
+        if fetch is None:
+            from scraper_completo import fetch_image_urls as fetch
+
+        result = {}
+        missing = []
+        for sku in dict.fromkeys(skus):
+            imagenes = self.get(sku)
+            if imagenes is None:
+                missing.append(sku)
+            else:
+                result[sku] = imagenes
+        lookups = registry.counter("image_cache_lookups_total", "Búsquedas en la caché de imágenes")
+        lookups.inc(len(result), result="hit")
+        lookups.inc(len(missing), result="miss")
+
+        def resolve(sku):
+            try:
+                return sku, fetch(sku)
+            except Exception as e:
+                print(f"Error al obtener imagen para SKU {sku}: {e}")
+                return sku, None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for sku, imagenes in executor.map(resolve, missing):
+                    if imagenes is None:
+                        result[sku] = []
+                    else:
+                        self.set(sku, imagenes)
+                        result[sku] = imagenes
+        return result
+
+
+def get_image_cache():
+    """Instancia compartida; el archivo se lee hasta el primer uso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
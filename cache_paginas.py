@@ -0,0 +1,147 @@
+"""
+Caché en disco de páginas del catálogo, por (sucursal, familia, página).
+
+La mayoría de las páginas llegan idénticas de un ciclo al siguiente. Por cada página se
+guarda un hash de su contenido (`tabla` + `rowCount`), el cuerpo comprimido y las filas
+ya extraídas; si la página recién descargada tiene el mismo hash, el motor reutiliza
+esas filas sin volver a recorrer el HTML y la marca como sin cambios (ver
+motor_scraping.StoreProducts).
+
+Se guarda en SQLite (paginas_cache.db) con tope de tamaño y desalojo por antigüedad:
+las páginas no confirmadas en MAX_AGE se borran y, si aun así se pasa del tope, se
+borran las confirmadas hace más tiempo. Las escrituras se acumulan y se hacen por
+lotes en `flush`.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from metricas import registry
+
+PAGE_CACHE_DB_FILE = "paginas_cache.db"
+MAX_BYTES = int(float(os.getenv("CACHE_PAGINAS_MAX_MB", "200")) * 2**20)
+MAX_AGE = float(os.getenv("CACHE_PAGINAS_MAX_HORAS", "48")) * 3600
+ENABLED = os.getenv("CACHE_PAGINAS", "1") != "0"
+FLUSH_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS paginas (
+    id_sucursal TEXT NOT NULL,
+    familia TEXT NOT NULL,
+    pagina INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    cuerpo BLOB NOT NULL,
+    encabezados TEXT NOT NULL,
+    columnas TEXT NOT NULL,
+    filas BLOB NOT NULL,
+    tamano INTEGER NOT NULL,
+    verificado REAL NOT NULL,
+    PRIMARY KEY (id_sucursal, familia, pagina)
+);
+CREATE INDEX IF NOT EXISTS idx_paginas_verificado ON paginas (verificado);
+"""
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def page_digest(data):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(data.get("rowCount", "")).encode())
+    digest.update(b"\0")
+    digest.update(data.get("tabla", "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PageCache:
+    def __init__(self, path=PAGE_CACHE_DB_FILE, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # Escrituras pendientes: páginas confirmadas y páginas nuevas o cambiadas
+        self.touched = {}
+        self.stored = {}
+        self.lookups = registry.counter("page_cache_lookups_total", "Búsquedas en la caché de páginas")
+
+    def lookup(self, id_sucursal, familia, pagina, digest, columns):
+        """
+        Regresa (encabezados, filas) si la página guardada tiene el mismo hash y se
+        extrajo con las mismas columnas; si no, None.
+        """
+        key = (str(id_sucursal), familia, int(pagina))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash, encabezados, columnas, filas FROM paginas "
+                "WHERE id_sucursal = ? AND familia = ? AND pagina = ?", key
+            ).fetchone()
+            if row is None or row[0] != digest or tuple(json.loads(row[2])) != tuple(columns):
+                self.lookups.inc(result="miss")
+                return None
+            self.touched[key] = time.time()
+            self.lookups.inc(result="hit")
+            pending = len(self.touched) + len(self.stored) >= FLUSH_EVERY
+        if pending:
+            self.flush()
+        return json.loads(row[1]), [tuple(r) for r in json.loads(zlib.decompress(row[3]))]
+
+    def store(self, id_sucursal, familia, pagina, digest, tabla, headers, columns, rows):
+        key = (str(id_sucursal), familia, int(pagina))
+        cuerpo = zlib.compress(tabla.encode("utf-8"), 6)
+        filas = zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8"), 6)
+        with self.lock:
+            self.stored[key] = (
+                digest, cuerpo, json.dumps(headers, ensure_ascii=False),
+                json.dumps(list(columns), ensure_ascii=False), filas, len(cuerpo) + len(filas)
+            )
+            pending = len(self.touched) + len(self.stored) >= FLUSH_EVERY
+        if pending:
+            self.flush()
+
+    def flush(self):
+        now = time.time()
+        with self.lock, self.conn:
+            touched, self.touched = self.touched, {}
+            stored, self.stored = self.stored, {}
+            self.conn.executemany(
+                "UPDATE paginas SET verificado = ? WHERE id_sucursal = ? AND familia = ? AND pagina = ?",
+                [(ts, *key) for key, ts in touched.items()]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO paginas (id_sucursal, familia, pagina, hash, cuerpo, encabezados, "
+                "columnas, filas, tamano, verificado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, *values, now) for key, values in stored.items()]
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM paginas WHERE verificado < ?", (now - self.max_age,))
+        total = self.conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM paginas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for rowid, tamano in self.conn.execute("SELECT rowid, tamano FROM paginas ORDER BY verificado"):
+            victims.append((rowid,))
+            excess -= tamano
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM paginas WHERE rowid = ?", victims)
+
+    def size_bytes(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM paginas").fetchone()[0]
+
+
+def get_page_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
@@ -0,0 +1,195 @@
+"""
+Entrega de notificaciones a Slack en segundo plano.
+
+Los mensajes se escriben primero en un outbox persistente (SQLite) y un hilo los va
+enviando bajo un token bucket, en lugar de dormir 3 minutos fijos entre envíos. Los
+errores 429 respetan Retry-After y los 5xx / de red se reintentan con backoff
+exponencial; lo que no se pudo enviar queda en disco y se retoma en el siguiente
+arranque. Así el scraping y la detección siguen corriendo mientras se vacía la cola.
+Un mensaje encolado con `not_before` (fuera del horario de envío) espera en el outbox
+hasta esa hora.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+import notificador_slack
+from limitador import TokenBucket
+from metricas import span
+
+OUTBOX_DB_FILE = "outbox_slack.db"
+MESSAGES_PER_MINUTE = float(os.getenv("SLACK_MESSAGES_PER_MINUTE", "6"))
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 5.0    # segundos, se duplica en cada intento
+BACKOFF_MAX = 600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    siguiente_intento REAL NOT NULL DEFAULT 0,
+    creado REAL NOT NULL,
+    enviado REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pendientes ON outbox (estado, siguiente_intento);
+"""
+
+_delivery = None
+_delivery_lock = threading.Lock()
+
+
+class SlackDelivery:
+    def __init__(self, path=OUTBOX_DB_FILE, messages_per_minute=MESSAGES_PER_MINUTE,
+                 post=None, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.bucket = TokenBucket(messages_per_minute / 60.0, capacity=1)
+        self.session = requests.Session()
+        self.custom_post = post is not None
+        self.post = post or (lambda payload: notificador_slack.post_slack_payload(payload, self.session))
+        self.max_attempts = max_attempts
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    # --- Outbox ---
+
+    def enqueue(self, payload, not_before=None):
+        """`not_before`: timestamp antes del cual no se envía (por omisión, ya)."""
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO outbox (payload, creado, siguiente_intento) VALUES (?, ?, ?)",
+                (json.dumps(payload), time.time(), not_before or 0)
+            )
+        self.wakeup.set()
+        return cur.lastrowid
+
+    def pending_count(self, deferred=True):
+        """Mensajes pendientes; con deferred=False sin los diferidos a otro horario."""
+        query = "SELECT COUNT(*) FROM outbox WHERE estado = 'pendiente'"
+        params = ()
+        if not deferred:
+            query += " AND NOT (intentos = 0 AND siguiente_intento > ?)"
+            params = (time.time(),)
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def _next_message(self):
+        """Regresa (id, payload, intentos) del siguiente mensaje listo, o los segundos a esperar."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, payload, intentos, siguiente_intento FROM outbox "
+                "WHERE estado = 'pendiente' ORDER BY siguiente_intento, id LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        message_id, payload, intentos, siguiente = row
+        wait = siguiente - time.time()
+        if wait > 0:
+            return wait
+        return message_id, json.loads(payload), intentos
+
+    def _mark(self, message_id, estado, intentos, siguiente_intento=0, error=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET estado = ?, intentos = ?, siguiente_intento = ?, error = ?, "
+                "enviado = CASE WHEN ? = 'enviado' THEN ? ELSE enviado END WHERE id = ?",
+                (estado, intentos, siguiente_intento, error, estado, time.time(), message_id)
+            )
+
+    # --- Envío ---
+
+    def _deliver(self, message_id, payload, intentos):
+        intentos += 1
+        retry_after = None
+        try:
+            with span("slack_send") as s:
+                response = self.post(payload)
+                s["status"] = response.status_code
+            status = response.status_code
+            if status == 200:
+                self._mark(message_id, "enviado", intentos)
+                print("Notificación de Slack enviada con éxito.")
+                return
+            error = f"{status} {response.text[:200]}"
+            if status == 429:
+                try:
+                    retry_after = float(response.headers.get("Retry-After", "0"))
+                except ValueError:
+                    retry_after = None
+                retry_after = retry_after or BACKOFF_BASE
+                self.bucket.penalize(retry_after)
+            elif status < 500:
+                # Error del payload o del webhook: reintentar no sirve
+                self._mark(message_id, "fallido", intentos, error=error)
+                print(f"Error al enviar notificación a Slack: {error}")
+                return
+        except Exception as e:
+            error = str(e)
+
+        if intentos >= self.max_attempts:
+            self._mark(message_id, "fallido", intentos, error=error)
+            print(f"No se pudo enviar la notificación a Slack tras {intentos} intentos: {error}")
+            return
+        espera = retry_after or min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (intentos - 1)))
+        self._mark(message_id, "pendiente", intentos, time.time() + espera, error)
+        print(f"Reintento de notificación {message_id} en {espera:.1f}s: {error}")
+
+    def _run(self):
+        while not self.stopping.is_set():
+            siguiente = self._next_message()
+            if siguiente is None or isinstance(siguiente, float):
+                self.wakeup.wait(timeout=siguiente if siguiente is not None else None)
+                self.wakeup.clear()
+                continue
+            wait = self.bucket.try_acquire()
+            if wait > 0:
+                # Un mensaje nuevo no adelanta el turno del token bucket: sólo stop() corta la espera
+                self.stopping.wait(wait)
+                continue
+            self._deliver(*siguiente)
+
+    def start(self):
+        if not notificador_slack.SLACK_WEBHOOK_URL and not self.custom_post:
+            print("Error: La URL del webhook de Slack no está configurada. Revisa tus variables de entorno.")
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="slack-delivery", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def wait_idle(self, timeout=None):
+        """
+        Espera a que el outbox quede sin pendientes (sin contar los diferidos a otro
+        horario). Regresa True si se vació.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while self.pending_count(deferred=False):
+            if limite is not None and time.monotonic() >= limite:
+                return False
+            time.sleep(0.2)
+        return True
+
+
+def get_delivery():
+    """Cola compartida por el proceso, con su hilo de envío ya iniciado."""
+    global _delivery
+    with _delivery_lock:
+        if _delivery is None:
+            _delivery = SlackDelivery().start()
+        return _delivery
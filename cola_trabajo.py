@@ -0,0 +1,484 @@
+"""
+Cola de trabajo durable para raspar con varios procesos (o varias máquinas).
+
+Un ciclo se reparte en tareas (sucursal, familia) guardadas en SQLite
+(cola_trabajo/cola.db). Cada worker toma una tarea con un lease de LEASE_SECONDS, la
+raspa con su propio ScrapeEngine y guarda el resultado como shard
+(cola_trabajo/shards/<ciclo>/<sucursal>__<familia>.jsonl.gz) antes de marcarla como
+hecha. El lease se renueva con cada página raspada; si un worker muere, su lease
+vence y la tarea vuelve a estar disponible. Una tarea con páginas fallidas cuenta como
+intento fallido; tras MAX_ATTEMPTS intentos queda fallida y la sucursal se entrega sin
+esa familia (marcada en failed_families, ver snapshot_skus).
+
+`scrape_sharded` es un sustituto de ScrapeEngine.scrape_stores para run_pipeline:
+abre el ciclo (o retoma el que quedó abierto con las mismas sucursales y familias,
+sin volver a pedir sus tareas hechas), arranca SCRAPER_PROCESOS workers locales y
+regresa cada sucursal, con sus shards unidos, en cuanto terminan todas sus tareas.
+
+Otros hosts se suman apuntando al mismo directorio, que debe estar en un sistema de
+archivos con bloqueos confiables para SQLite:
+
+    python cola_trabajo.py worker --dir /ruta/compartida [--hilos 4]
+
+Los workers no usan planificador ni caché de páginas: cada tarea es una sola familia
+y puede caer en cualquier worker.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+QUEUE_DIR = os.getenv("COLA_TRABAJO_DIR", "cola_trabajo")
+WORKER_PROCESSES = int(os.getenv("SCRAPER_PROCESOS", "0"))
+WORKER_THREADS = int(os.getenv("SCRAPER_HILOS_POR_PROCESO", "4"))
+LEASE_SECONDS = float(os.getenv("COLA_LEASE_SEGUNDOS", "120"))
+MAX_ATTEMPTS = 3
+# Un ciclo abierto más viejo que esto ya no se retoma: sus datos no sirven
+MAX_RESUME_AGE = float(os.getenv("COLA_RETOMAR_HORAS", "2")) * 3600
+POLL_INTERVAL = 0.5
+
+PENDIENTE = "pendiente"
+TOMADA = "tomada"
+HECHA = "hecha"
+FALLIDA = "fallida"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ciclos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    firma TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    creado REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tareas (
+    ciclo INTEGER NOT NULL,
+    id_sucursal TEXT NOT NULL,
+    nombre_sucursal TEXT NOT NULL,
+    familia TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_hasta REAL,
+    productos INTEGER,
+    error TEXT,
+    PRIMARY KEY (ciclo, id_sucursal, familia)
+);
+CREATE INDEX IF NOT EXISTS idx_tareas_estado ON tareas (ciclo, estado);
+"""
+
+
+class Task:
+    __slots__ = ("ciclo", "id_sucursal", "nombre_sucursal", "familia", "intentos")
+
+    def __init__(self, ciclo, id_sucursal, nombre_sucursal, familia, intentos):
+        self.ciclo = ciclo
+        self.id_sucursal = id_sucursal
+        self.nombre_sucursal = nombre_sucursal
+        self.familia = familia
+        self.intentos = intentos
+
+
+def cycle_signature(stores, familias):
+    payload = json.dumps([sorted(map(str, stores)), list(familias)], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class WorkQueue:
+    def __init__(self, directory=QUEUE_DIR, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+        # Autocommit: las transacciones se abren a mano con BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(os.path.join(directory, "cola.db"), timeout=30,
+                                    isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _transaction(self, fn):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def shard_path(self, ciclo, id_sucursal, familia):
+        name = f"{quote(str(id_sucursal), safe='')}__{quote(familia, safe='')}.jsonl.gz"
+        return os.path.join(self.directory, "shards", str(ciclo), name)
+
+    # --- Orquestador ---
+
+    def open_cycle(self, stores, familias):
+        """
+        Regresa (ciclo, retomado). Retoma el ciclo abierto con la misma firma si no es
+        demasiado viejo; cualquier otro ciclo abierto se abandona.
+        """
+        firma = cycle_signature(stores, familias)
+        now = time.time()
+
+        def run(conn):
+            abiertos = conn.execute(
+                "SELECT id, firma, creado FROM ciclos WHERE estado = 'abierto' ORDER BY id DESC"
+            ).fetchall()
+            for ciclo, firma_ciclo, creado in abiertos:
+                if firma_ciclo == firma and now - creado < MAX_RESUME_AGE:
+                    return ciclo, True
+            for ciclo, _, _ in abiertos:
+                conn.execute("UPDATE ciclos SET estado = 'abandonado' WHERE id = ?", (ciclo,))
+                conn.execute("DELETE FROM tareas WHERE ciclo = ?", (ciclo,))
+            ciclo = conn.execute(
+                "INSERT INTO ciclos (firma, estado, creado) VALUES (?, 'abierto', ?)", (firma, now)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO tareas (ciclo, id_sucursal, nombre_sucursal, familia, estado) VALUES (?, ?, ?, ?, ?)",
+                [(ciclo, str(id_sucursal), nombre, familia, PENDIENTE)
+                 for id_sucursal, nombre in stores.items() for familia in familias]
+            )
+            return ciclo, False
+
+        ciclo, resumed = self._transaction(run)
+        if not resumed:
+            self._remove_stale_shards(keep=ciclo)
+        return ciclo, resumed
+
+    def _remove_stale_shards(self, keep):
+        shards = os.path.join(self.directory, "shards")
+        for name in os.listdir(shards):
+            if name != str(keep):
+                shutil.rmtree(os.path.join(shards, name), ignore_errors=True)
+
+    def finished_stores(self, ciclo):
+        """Sucursales del ciclo sin tareas pendientes ni tomadas."""
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT id_sucursal FROM tareas WHERE ciclo = ? GROUP BY id_sucursal "
+                "HAVING SUM(estado IN (?, ?)) = 0", (ciclo, PENDIENTE, TOMADA)
+            )]
+
+    def counts(self, ciclo):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT estado, COUNT(*) FROM tareas WHERE ciclo = ? GROUP BY estado", (ciclo,)
+            ).fetchall())
+
+    def load_store(self, ciclo, id_sucursal):
+        """
+        (productos, {familia: productos}, familias fallidas) unidos desde los shards de
+        la sucursal.
+        """
+        from producto import Producto
+
+        with self.lock:
+            tasks = self.conn.execute(
+                "SELECT familia, estado FROM tareas WHERE ciclo = ? AND id_sucursal = ?",
+                (ciclo, str(id_sucursal))
+            ).fetchall()
+        products = []
+        by_family = {}
+        failed = []
+        for familia, estado in tasks:
+            family_products = []
+            if estado == HECHA:
+                with gzip.open(self.shard_path(ciclo, id_sucursal, familia), "rt", encoding="utf-8") as f:
+                    family_products = [Producto.from_dict(json.loads(line)) for line in f]
+            elif estado == FALLIDA:
+                failed.append(familia)
+            products.extend(family_products)
+            by_family[familia] = len(family_products)
+        return products, by_family, failed
+
+    def close_cycle(self, ciclo):
+        def run(conn):
+            conn.execute("UPDATE ciclos SET estado = 'cerrado' WHERE id = ?", (ciclo,))
+            conn.execute("DELETE FROM tareas WHERE ciclo = ?", (ciclo,))
+
+        self._transaction(run)
+        shutil.rmtree(os.path.join(self.directory, "shards", str(ciclo)), ignore_errors=True)
+
+    # --- Workers ---
+
+    def lease(self, worker):
+        """Toma la siguiente tarea disponible de un ciclo abierto, o None."""
+        now = time.time()
+
+        def run(conn):
+            while True:
+                row = conn.execute(
+                    "SELECT t.ciclo, t.id_sucursal, t.nombre_sucursal, t.familia, t.intentos FROM tareas t "
+                    "JOIN ciclos c ON c.id = t.ciclo WHERE c.estado = 'abierto' "
+                    "AND (t.estado = ? OR (t.estado = ? AND t.lease_hasta < ?)) "
+                    "ORDER BY t.ciclo, t.intentos, t.rowid LIMIT 1",
+                    (PENDIENTE, TOMADA, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                task = Task(*row)
+                if task.intentos >= self.max_attempts:
+                    # Lease vencido en el último intento: el worker murió con ella
+                    conn.execute(
+                        "UPDATE tareas SET estado = ?, error = 'lease vencido' "
+                        "WHERE ciclo = ? AND id_sucursal = ? AND familia = ?",
+                        (FALLIDA, task.ciclo, task.id_sucursal, task.familia)
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE tareas SET estado = ?, worker = ?, lease_hasta = ?, intentos = intentos + 1 "
+                    "WHERE ciclo = ? AND id_sucursal = ? AND familia = ?",
+                    (TOMADA, worker, now + self.lease_seconds, task.ciclo, task.id_sucursal, task.familia)
+                )
+                task.intentos += 1
+                return task
+
+        return self._transaction(run)
+
+    def extend(self, task, worker):
+        """Renueva el lease por otros lease_seconds. Regresa False si ya no es de este worker."""
+        def run(conn):
+            return conn.execute(
+                "UPDATE tareas SET lease_hasta = ? "
+                "WHERE ciclo = ? AND id_sucursal = ? AND familia = ? AND worker = ? AND estado = ?",
+                (time.time() + self.lease_seconds, task.ciclo, task.id_sucursal, task.familia, worker, TOMADA)
+            ).rowcount == 1
+
+        return self._transaction(run)
+
+    def complete(self, task, worker, products):
+        """
+        Escribe el shard y marca la tarea como hecha. Regresa False si el lease ya era
+        de otro worker (el shard se reescribe igual, con el mismo contenido).
+        """
+        path = self.shard_path(task.ciclo, task.id_sucursal, task.familia)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{quote(worker, safe='')}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5) as f:
+            for product in products:
+                f.write(json.dumps(product.to_dict(), ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp, path)
+
+        def run(conn):
+            return conn.execute(
+                "UPDATE tareas SET estado = ?, productos = ?, lease_hasta = NULL "
+                "WHERE ciclo = ? AND id_sucursal = ? AND familia = ? AND worker = ? AND estado = ?",
+                (HECHA, len(products), task.ciclo, task.id_sucursal, task.familia, worker, TOMADA)
+            ).rowcount == 1
+
+        return self._transaction(run)
+
+    def fail(self, task, worker, error):
+        def run(conn):
+            conn.execute(
+                "UPDATE tareas SET estado = CASE WHEN intentos >= ? THEN ? ELSE ? END, "
+                "error = ?, worker = NULL, lease_hasta = NULL "
+                "WHERE ciclo = ? AND id_sucursal = ? AND familia = ? AND worker = ? AND estado = ?",
+                (self.max_attempts, FALLIDA, PENDIENTE, str(error)[:500],
+                 task.ciclo, task.id_sucursal, task.familia, worker, TOMADA)
+            )
+
+        self._transaction(run)
+
+    def release(self, worker_prefix):
+        """Devuelve a pendientes las tareas tomadas por workers que ya se detuvieron."""
+        def run(conn):
+            return conn.execute(
+                "UPDATE tareas SET estado = ?, worker = NULL, lease_hasta = NULL, intentos = intentos - 1 "
+                "WHERE estado = ? AND worker LIKE ? || '%'", (PENDIENTE, TOMADA, worker_prefix)
+            ).rowcount
+
+        return self._transaction(run)
+
+    def has_open_work(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM tareas t JOIN ciclos c ON c.id = t.ciclo "
+                "WHERE c.estado = 'abierto' AND t.estado IN (?, ?) LIMIT 1", (PENDIENTE, TOMADA)
+            ).fetchone() is not None
+
+
+class LeaseHeartbeat:
+    """Avisos del motor (ver gestor_jobs.JobProgress) que renuevan el lease de la tarea."""
+
+    def __init__(self, queue, task, worker):
+        self.queue = queue
+        self.task = task
+        self.worker = worker
+        # Basta renovar unas cuantas veces por lease, no en cada página
+        self.interval = queue.lease_seconds / 4
+        self.renewed = time.monotonic()
+
+    def page_done(self, id_sucursal, familia, page_number, rows):
+        now = time.monotonic()
+        if now - self.renewed < self.interval:
+            return
+        self.renewed = now
+        if not self.queue.extend(self.task, self.worker):
+            print(f"Worker {self.worker}: el lease de {self.task.familia} de {self.task.nombre_sucursal} "
+                  f"ya es de otro worker.")
+
+    def family_done(self, id_sucursal, familia, products):
+        pass
+
+    def store_done(self, id_sucursal, products):
+        pass
+
+
+def run_task(queue, engine, task, worker):
+    """Raspa una tarea y la marca como hecha, o como intento fallido si alguna página falló."""
+    try:
+        products = []
+        failed = set()
+        for _, _, store_products in engine.scrape_stores(
+            {task.id_sucursal: task.nombre_sucursal}, [task.familia],
+            progress=LeaseHeartbeat(queue, task, worker)
+        ):
+            products.extend(store_products)
+            failed |= store_products.failed_families
+        if failed:
+            # El motor no lanza los errores de página: una familia incompleta no es hecha
+            print(f"Worker {worker}: páginas con error en {task.familia} de {task.nombre_sucursal}.")
+            queue.fail(task, worker, "páginas con error")
+        else:
+            queue.complete(task, worker, products)
+    except Exception as e:
+        print(f"Worker {worker}: error en {task.familia} de {task.nombre_sucursal}: {e}")
+        queue.fail(task, worker, e)
+
+
+def run_worker(directory=QUEUE_DIR, worker_id=None, threads=WORKER_THREADS, exit_when_idle=False):
+    """
+    Consume tareas hasta que se le detenga; con `exit_when_idle` termina cuando ya no
+    quedan tareas pendientes ni tomadas en ningún ciclo abierto.
+    """
+    import modelos_canonicos
+    from motor_scraping import ScrapeEngine, build_session
+
+    # Los modelos canónicos se resuelven en el orquestador al leer los shards; aquí no
+    # se debe escribir en modelos_canonicos.db con ids propios del proceso
+    modelos_canonicos._index = modelos_canonicos.CanonicalModelIndex(fuzzy=False)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(directory)
+    engine = ScrapeEngine(session=build_session())
+    print(f"Worker {worker_id} iniciado con {threads} hilos sobre {directory}.")
+
+    def loop(n):
+        name = f"{worker_id}.{n}"
+        while True:
+            task = queue.lease(name)
+            if task is None:
+                if exit_when_idle and not queue.has_open_work():
+                    return
+                time.sleep(POLL_INTERVAL)
+                continue
+            run_task(queue, engine, task, name)
+
+    loops = [threading.Thread(target=loop, args=(n,), daemon=True) for n in range(threads)]
+    for t in loops:
+        t.start()
+    for t in loops:
+        t.join()
+
+
+class WorkerPool:
+    """Procesos worker locales; `ensure` reemplaza los que murieron."""
+
+    def __init__(self, processes, directory=QUEUE_DIR, threads=WORKER_THREADS):
+        self.processes = processes
+        self.directory = directory
+        self.threads = threads
+        self.context = multiprocessing.get_context("spawn")
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}-"
+        self.workers = []
+
+    def _spawn(self, n):
+        process = self.context.Process(
+            target=run_worker, args=(self.directory, f"{self.prefix}{n}", self.threads, True),
+            name=f"scraper-{n}", daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self):
+        self.workers = [self._spawn(n) for n in range(self.processes)]
+        return self
+
+    def ensure(self):
+        for n, process in enumerate(self.workers):
+            if not process.is_alive() and process.exitcode not in (0, None):
+                print(f"Worker {process.name} terminó con código {process.exitcode}; se reinicia.")
+                self.workers[n] = self._spawn(n)
+
+    def stop(self):
+        for process in self.workers:
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers:
+            process.join()
+        if self.workers:
+            WorkQueue(self.directory).release(self.prefix)
+
+
+def scrape_sharded(stores, familias, progress=None, cancel=None, processes=WORKER_PROCESSES,
+                   directory=QUEUE_DIR):
+    """
+    Generador con la misma salida que ScrapeEngine.scrape_stores: (id_sucursal,
+    nombre_sucursal, productos) por sucursal terminada. Con cancel, los workers locales
+    se detienen y el ciclo queda abierto para retomarlo.
+    """
+    from motor_scraping import StoreProducts
+
+    queue = WorkQueue(directory)
+    ciclo, resumed = queue.open_cycle(stores, familias)
+    if resumed:
+        print(f"Retomando ciclo {ciclo} de la cola: {queue.counts(ciclo)}")
+    pool = WorkerPool(processes, directory).start()
+    pending = {str(id_sucursal): nombre for id_sucursal, nombre in stores.items()}
+    try:
+        while pending:
+            if cancel is not None and cancel.is_set():
+                print("Scraping cancelado; el ciclo queda abierto en la cola.")
+                return
+            ready = [id_sucursal for id_sucursal in queue.finished_stores(ciclo) if id_sucursal in pending]
+            if not ready:
+                pool.ensure()
+                time.sleep(POLL_INTERVAL)
+                continue
+            for id_sucursal in ready:
+                if cancel is not None and cancel.is_set():
+                    break
+                products, by_family, failed = queue.load_store(ciclo, id_sucursal)
+                if progress is not None:
+                    for familia, count in by_family.items():
+                        progress.family_done(id_sucursal, familia, count)
+                    progress.store_done(id_sucursal, len(products))
+                yield id_sucursal, pending.pop(id_sucursal), StoreProducts(products, failed_families=failed)
+        queue.close_cycle(ciclo)
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de scraping")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    worker = sub.add_parser("worker", help="Consume tareas de la cola")
+    worker.add_argument("--dir", default=QUEUE_DIR)
+    worker.add_argument("--hilos", type=int, default=WORKER_THREADS)
+    worker.add_argument("--id", help="Nombre del worker (por defecto, host-pid)")
+    worker.add_argument("--salir-sin-trabajo", action="store_true",
+                        help="Terminar cuando no queden tareas abiertas")
+    args = parser.parse_args()
+    run_worker(args.dir, args.id, args.hilos, args.salir_sin_trabajo)
+
+
+if __name__ == "__main__":
+    main()
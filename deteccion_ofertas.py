@@ -0,0 +1,152 @@
+"""
+Detección de ofertas vectorizada (NumPy).
+
+Recibe columnas (id de modelo, precio, id de sucursal) y en una sola pasada de
+ordenamiento calcula por modelo el precio dominante (moda) y su frecuencia, el margen
+de cada fila contra esa moda y aplica los filtros de frecuencia y margen. El resultado
+es una tabla de ofertas ya ordenada por margen que lleva el precio dominante, de modo
+que el envío nunca lo vuelve a calcular.
+
+Las reglas son las mismas que `procesador_ofertas.select_model_deals`, incluido el
+desempate de la moda: entre precios con la misma frecuencia gana el que apareció
+primero.
+
+Opcionalmente se puede pasar un precio de referencia externo por modelo (p. ej. la moda
+de la ventana de historial_precios); donde exista sustituye a la moda del ciclo.
+"""
+import numpy as np
+
+
+class DealTable:
+    """
+    Ofertas ordenadas por margen (descendente, estable).
+
+    rows: índice de cada oferta en las columnas de entrada.
+    model_dominant_price / model_dominant_freq: por id de modelo (NaN / 0 si el modelo
+    no tiene filas o no pasó el mínimo de 2 artículos).
+    """
+
+    __slots__ = ("rows", "model_ids", "store_ids", "prices", "dominant_prices", "margins",
+                 "model_dominant_price", "model_dominant_freq")
+
+    def __init__(self, rows, model_ids, store_ids, prices, dominant_prices, margins,
+                 model_dominant_price, model_dominant_freq):
+        self.rows = rows
+        self.model_ids = model_ids
+        self.store_ids = store_ids
+        self.prices = prices
+        self.dominant_prices = dominant_prices
+        self.margins = margins
+        self.model_dominant_price = model_dominant_price
+        self.model_dominant_freq = model_dominant_freq
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def dominant_prices(model_ids, prices, n_models):
+    """
+    Moda por modelo. Regresa (precio_dominante, frecuencia, tamaño) indexados por id de modelo.
+    """
+    n = len(prices)
+    dom_price = np.full(n_models, np.nan)
+    dom_freq = np.zeros(n_models, dtype=np.int64)
+    sizes = np.bincount(model_ids, minlength=n_models)
+    if n == 0:
+        return dom_price, dom_freq, sizes
+
+    # Grupos (modelo, precio) contiguos
+    order = np.lexsort((prices, model_ids))
+    sm = model_ids[order]
+    sp = prices[order]
+    starts = np.flatnonzero(np.r_[True, (sm[1:] != sm[:-1]) | (sp[1:] != sp[:-1])])
+    counts = np.diff(np.r_[starts, n])
+    g_model = sm[starts]
+    g_price = sp[starts]
+    g_first = np.minimum.reduceat(order, starts)
+
+    # Por modelo: mayor frecuencia y, en empate, el precio que apareció primero
+    best = np.lexsort((g_first, -counts, g_model))
+    b_model = g_model[best]
+    heads = best[np.r_[True, b_model[1:] != b_model[:-1]]]
+    dom_price[g_model[heads]] = g_price[heads]
+    dom_freq[g_model[heads]] = counts[heads]
+    return dom_price, dom_freq, sizes
+
+
+def detect_deals(model_ids, prices, store_ids=None, min_dominant_freq=3, min_profit=100.0, n_models=None,
+                 baseline_prices=None, baseline_freqs=None):
+    """
+    baseline_prices / baseline_freqs: opcionales, por id de modelo (NaN donde no hay
+    referencia). Un modelo con referencia se evalúa contra ella aunque en el ciclo
+    tenga un solo artículo.
+    """
+    model_ids = np.asarray(model_ids, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if store_ids is None:
+        store_ids = np.zeros(len(prices), dtype=np.int64)
+    else:
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+    if n_models is None:
+        n_models = int(model_ids.max()) + 1 if len(model_ids) else 0
+
+    dom_price, dom_freq, sizes = dominant_prices(model_ids, prices, n_models)
+    valid = (sizes >= 2) & (dom_freq >= min_dominant_freq)
+    dom_price[sizes < 2] = np.nan
+    if baseline_prices is not None:
+        known = ~np.isnan(baseline_prices)
+        dom_price = np.where(known, baseline_prices, dom_price)
+        dom_freq = np.where(known, baseline_freqs, dom_freq)
+        valid = np.where(known, dom_freq >= min_dominant_freq, valid)
+
+    row_dom = dom_price[model_ids]
+    margins = row_dom - prices
+    # NaN en modelos no válidos hace que las comparaciones den False
+    mask = valid[model_ids] & (prices < row_dom) & (margins >= min_profit)
+    rows = np.flatnonzero(mask)
+    rows = rows[np.argsort(-margins[rows], kind="stable")]
+
+    return DealTable(
+        rows, model_ids[rows], store_ids[rows], prices[rows], row_dom[rows], margins[rows],
+        dom_price, dom_freq
+    )
+
+
+def detect_grouped_deals(groups, min_dominant_freq=3, min_profit=100.0, baseline=None):
+    """
+    Atajo para Productos agrupados: {model_key: [Producto, ...]}; `baseline` opcional es
+    {model_key: (precio, frecuencia)} de referencia.
+
+    Regresa (dominantes, ofertas): dominantes es {model_key: precio_dominante o None};
+    ofertas es la lista de Productos ordenada por margen, con `margen` y
+    `precio_dominante` ya asignados.
+    """
+    keys = list(groups)
+    items = []
+    model_ids = []
+    for model_id, key in enumerate(keys):
+        group = groups[key]
+        items.extend(group)
+        model_ids.extend([model_id] * len(group))
+    prices = [p.precio for p in items]
+    store_ids = [p.store_id for p in items]
+
+    baseline_prices = baseline_freqs = None
+    if baseline:
+        baseline_prices = np.array([baseline.get(key, (np.nan, 0))[0] for key in keys], dtype=np.float64)
+        baseline_freqs = np.array([baseline.get(key, (np.nan, 0))[1] for key in keys], dtype=np.int64)
+
+    table = detect_deals(model_ids, prices, store_ids, min_dominant_freq, min_profit, n_models=len(keys),
+                         baseline_prices=baseline_prices, baseline_freqs=baseline_freqs)
+
+    dominantes = {
+        key: (None if np.isnan(precio) else float(precio))
+        for key, precio in zip(keys, table.model_dominant_price)
+    }
+    ofertas = []
+    for row, dominante, margen in zip(table.rows.tolist(), table.dominant_prices.tolist(), table.margins.tolist()):
+        p = items[row]
+        p.precio_dominante = dominante
+        p.margen = margen
+        ofertas.append(p)
+    return dominantes, ofertas
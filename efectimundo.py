@@ -0,0 +1,147 @@
+"""
+Punto de entrada único para corridas sueltas (cron) y para levantar el API.
+
+    python efectimundo.py raspar ID_SUCURSAL [--familias A,B] [--salida ARCHIVO.csv.gz]
+    python efectimundo.py detectar [SNAPSHOT ...] [--salida ofertas.json]
+    python efectimundo.py notificar [ofertas.json] [--espera SEGUNDOS]
+    python efectimundo.py servir [--host 0.0.0.0] [--port 5000]
+    python efectimundo.py replay [SNAPSHOT ...] [opciones de snapshots_corrida.py]
+
+`raspar` deja los productos de una sucursal en un snapshot (mismo formato y, por
+omisión, mismo nombre que el de cada corrida, ver snapshots_corrida), `detectar` lo
+convierte en un JSON de ofertas y `notificar` las manda por el outbox de Slack. Sin
+argumentos, `detectar` y `replay` toman el snapshot más reciente, sea de `raspar` o de
+un ciclo.
+
+Aquí sólo se importa argparse: cada subcomando importa lo que usa al ejecutarse y las
+cachés (imágenes, modelos canónicos, historial, análisis) se abren en su primer uso. Así
+`detectar` y `replay` no cargan requests, Slack ni OpenAI, y `servir` no carga el motor
+de scraping hasta que llega un job. benchmarks/bench_arranque.py mide el arranque de
+cada subcomando y falla si carga módulos que no le tocan.
+"""
+import argparse
+import json
+import sys
+
+STORES_FILE = "stores.json"
+DEALS_FILE = "ofertas.json"
+NOTIFY_WAIT = 900.0
+
+
+def scrape_one_store(args, parser):
+    from motor_scraping import get_engine
+    from scraper_completo import FAMILIAS
+    from snapshots_corrida import RunSnapshotWriter
+    from modelos_canonicos import get_model_index
+
+    with open(args.sucursales, encoding="utf-8") as f:
+        stores = json.load(f)
+    nombre = stores.get(args.id_sucursal)
+    if nombre is None:
+        parser.error(f"La sucursal {args.id_sucursal} no está en {args.sucursales}")
+    familias = args.familias.split(",") if args.familias else FAMILIAS
+
+    # Con el nombre de una corrida, `detectar` y `replay` lo toman sin argumentos
+    writer = RunSnapshotWriter(path=args.salida)
+    try:
+        for _, _, products in get_engine().scrape_stores({args.id_sucursal: nombre}, familias):
+            writer.write_store(products)
+    except BaseException:
+        writer.discard()
+        raise
+    get_model_index().flush()
+    writer.commit()
+
+
+def detect(args, parser):
+    from snapshots_corrida import list_snapshots, replay, SNAPSHOT_DIR
+    from procesador_ofertas import MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD
+    from historial_precios import BASELINE_MODE, ENABLED as HISTORY_ENABLED
+
+    paths = args.snapshots or list_snapshots()[-1:]
+    if not paths:
+        parser.error(f"No hay snapshots en {SNAPSHOT_DIR}/")
+    deals = replay(paths, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD,
+                   BASELINE_MODE if HISTORY_ENABLED else "snapshot")
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump([p.to_dict() for p in deals], f, indent=2, ensure_ascii=False)
+    print(f"Ofertas guardadas en {args.salida}")
+
+
+def notify(args, parser):
+    from producto import Producto
+    from procesador_ofertas import send_deals
+
+    with open(args.ofertas, encoding="utf-8") as f:
+        deals = [Producto.from_dict(item) for item in json.load(f)]
+    send_deals(deals)
+    if args.espera > 0:
+        # Lo encolado (y lo que hubiera quedado de corridas anteriores) sale antes de terminar
+        from cola_slack import get_delivery
+
+        delivery = get_delivery()
+        if not delivery.wait_idle(args.espera):
+            print(f"Quedan {delivery.pending_count()} mensajes en el outbox; se envían en la siguiente corrida.")
+
+
+def serve(args, parser):
+    from api_server import app
+
+    app.run(host=args.host, port=args.port)
+
+
+def replay(args, parser, extra):
+    from snapshots_corrida import main as replay_main
+
+    replay_main(extra)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scraper de ofertas de Efectimundo")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    raspar = sub.add_parser("raspar", help="Raspa una sucursal y guarda sus productos en un snapshot")
+    raspar.add_argument("id_sucursal")
+    raspar.add_argument("--familias", help="Lista separada por comas (por defecto, todas)")
+    raspar.add_argument("--sucursales", default=STORES_FILE, help="Archivo de sucursales")
+    raspar.add_argument("--salida", help="Archivo .csv.gz (por defecto, como corrida en snapshots_corrida/)")
+    raspar.set_defaults(handler=scrape_one_store)
+
+    detectar = sub.add_parser("detectar", help="Detecta ofertas en snapshots y las guarda en JSON")
+    detectar.add_argument("snapshots", nargs="*", help="Archivos .csv.gz (por defecto, la última corrida)")
+    detectar.add_argument("--salida", default=DEALS_FILE)
+    detectar.set_defaults(handler=detect)
+
+    notificar = sub.add_parser("notificar", help="Envía a Slack las ofertas de un JSON de detectar")
+    notificar.add_argument("ofertas", nargs="?", default=DEALS_FILE)
+    notificar.add_argument("--espera", type=float, default=NOTIFY_WAIT,
+                           help="Segundos máximos esperando a que se vacíe el outbox (0: sólo encolar)")
+    notificar.set_defaults(handler=notify)
+
+    servir = sub.add_parser("servir", help="Levanta el API")
+    servir.add_argument("--host", default="0.0.0.0")
+    servir.add_argument("--port", type=int, default=5000)
+    servir.set_defaults(handler=serve)
+
+    # Sus opciones (incluida --help) las interpreta snapshots_corrida.main
+    sub.add_parser("replay", add_help=False, help="Repite la detección sobre snapshots sin notificar")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+
+    # Las banderas de configuración se leen al importar cada módulo
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.comando == "replay":
+        return replay(args, parser, extra)
+    if extra:
+        parser.error(f"Argumentos no reconocidos: {' '.join(extra)}")
+    return args.handler(args, parser)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Extractor rápido para el fragmento HTML `tabla` que regresa consulta_catalogo.php.
+
+Sustituye a TableParser en la ruta caliente: los encabezados se leen una sola vez por
+familia (página 1), de cada fila sólo se extraen las columnas que usa el pipeline y los
+artículos dañados se descartan durante el recorrido, sin construir dicts intermedios.
+Las filas salen como tuplas en el orden de `columns`.
+"""
+import re
+from html import unescape
+
+# Columnas que consumen el pipeline, el snapshot y el mensaje de Slack
+PROJECTED_COLUMNS = (
+    "Prenda / Sku Lote",
+    "Marca",
+    "Modelo",
+    "Descripción",
+    "Tipo",
+    "Precio Promoción",
+)
+# Columnas donde se busca la palabra "dañado"
+DAMAGE_COLUMNS = ("Descripción", "Tipo")
+DAMAGE_WORD = "dañado"
+
+_ROW_RE = re.compile(r"<tr\b[^>]*>(.*?)</tr\s*>", re.S | re.I)
+_TD_RE = re.compile(r"<td\b[^>]*>(.*?)</td\s*>", re.S | re.I)
+_TH_RE = re.compile(r"<th\b[^>]*>(.*?)</th\s*>", re.S | re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _clean_cell(raw):
+    if "<" in raw:
+        raw = _TAG_RE.sub("", raw)
+    if "&" in raw:
+        raw = unescape(raw)
+    return raw.strip()
+
+
+def extract_headers(tabla):
+    return [_clean_cell(cell) for cell in _TH_RE.findall(tabla)]
+
+
+class TableExtractor:
+    """
+    Extractor con el esquema de una familia ya resuelto.
+
+    Se construye con `from_html` a partir de la página 1 y se reutiliza para las
+    páginas siguientes de la misma (sucursal, familia).
+    """
+
+    def __init__(self, headers, columns=PROJECTED_COLUMNS, skip_damaged=True):
+        self.headers = headers
+        self.columns = tuple(columns)
+        positions = {name: i for i, name in enumerate(headers)}
+        self.indices = tuple(positions.get(name) for name in self.columns)
+        self.damage_indices = tuple(
+            positions[name] for name in DAMAGE_COLUMNS if name in positions
+        ) if skip_damaged else ()
+        self.width = len(headers)
+
+    @classmethod
+    def from_html(cls, tabla, columns=PROJECTED_COLUMNS, skip_damaged=True):
+        return cls(extract_headers(tabla), columns, skip_damaged)
+
+    def rows(self, tabla):
+        """
+        Generador de filas proyectadas (tuplas) del fragmento, sin artículos dañados.
+        """
+        indices = self.indices
+        damage_indices = self.damage_indices
+        for row_html in _ROW_RE.findall(tabla):
+            cells = _TD_RE.findall(row_html)
+            if not cells:
+                # Fila de encabezados
+                continue
+            n = len(cells)
+            if damage_indices:
+                damaged = False
+                for i in damage_indices:
+                    if i >= n:
+                        continue
+                    text = cells[i]
+                    if "<" in text or "&" in text:
+                        text = _clean_cell(text)
+                    if DAMAGE_WORD in text.lower():
+                        damaged = True
+                        break
+                if damaged:
+                    continue
+            yield tuple(
+                _clean_cell(cells[i]) if i is not None and i < n else ""
+                for i in indices
+            )
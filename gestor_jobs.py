@@ -0,0 +1,206 @@
+"""
+Gestor de ejecuciones (jobs) del scraper para api_server.
+
+Sólo hay una ejecución en curso a la vez (single-flight): un disparo mientras otra
+corre regresa la misma. Cada job lleva su progreso por sucursal y familia, su
+throughput, se puede cancelar y queda en un historial acotado.
+
+Modos:
+- "una_vez": un solo ciclo de scraping + detección.
+- "programado": el bucle horario de main_orchestrator hasta que se cancele.
+"""
+import datetime
+import threading
+import time
+import uuid
+from collections import deque
+
+HISTORY_SIZE = 20
+MODOS = ("una_vez", "programado")
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class JobProgress:
+    """Recibe los avisos del motor de scraping (ver ScrapeEngine.scrape_stores)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cycles = 0
+        self.begin_cycle(0, 0)
+
+    def begin_cycle(self, stores_total, families_per_store):
+        with self.lock:
+            self.cycles += 1
+            self.cycle_started = time.time()
+            self.stores_total = stores_total
+            self.families_per_store = families_per_store
+            self.stores_done = 0
+            self.pages = 0
+            self.rows = 0
+            self.products = 0
+            # id_sucursal -> {familia: productos}
+            self.families = {}
+
+    def page_done(self, id_sucursal, familia, page_number, rows):
+        with self.lock:
+            self.pages += 1
+            self.rows += rows
+
+    def family_done(self, id_sucursal, familia, products):
+        with self.lock:
+            self.families.setdefault(id_sucursal, {})[familia] = products
+
+    def store_done(self, id_sucursal, products):
+        with self.lock:
+            self.stores_done += 1
+            self.products += products
+
+    def to_dict(self):
+        with self.lock:
+            elapsed = max(time.time() - self.cycle_started, 1e-6)
+            return {
+                "ciclo": self.cycles,
+                "sucursales_total": self.stores_total,
+                "sucursales_completadas": self.stores_done,
+                "familias_por_sucursal": self.families_per_store,
+                "paginas": self.pages,
+                "filas": self.rows,
+                "productos": self.products,
+                "paginas_por_segundo": round(self.pages / elapsed, 2),
+                "filas_por_segundo": round(self.rows / elapsed, 2),
+                "por_sucursal": {
+                    id_sucursal: {
+                        "familias_completadas": len(familias),
+                        "productos_por_familia": dict(familias),
+                    }
+                    for id_sucursal, familias in self.families.items()
+                },
+            }
+
+
+class Job:
+    def __init__(self, modo):
+        self.id = uuid.uuid4().hex[:12]
+        self.modo = modo
+        self.estado = "en_cola"
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.error = None
+        self.progress = JobProgress()
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    @property
+    def activo(self):
+        return self.estado in ("en_cola", "corriendo")
+
+    def to_dict(self, detalle=True):
+        def fecha(ts):
+            return datetime.datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+        data = {
+            "id": self.id,
+            "modo": self.modo,
+            "estado": self.estado,
+            "creado": fecha(self.creado),
+            "inicio": fecha(self.inicio),
+            "fin": fecha(self.fin),
+            "error": self.error,
+            "cancelacion_solicitada": self.cancel_event.is_set(),
+        }
+        if detalle:
+            data["progreso"] = self.progress.to_dict()
+        return data
+
+
+class JobManager:
+    def __init__(self, history_size=HISTORY_SIZE, run_once=None, run_scheduled=None):
+        self.lock = threading.Lock()
+        self.current = None
+        self.history = deque(maxlen=history_size)
+        self.jobs = {}
+        self.run_once = run_once or _run_once
+        self.run_scheduled = run_scheduled or _run_scheduled
+
+    def submit(self, modo="programado"):
+        """
+        Dispara una ejecución. Si ya hay una activa la regresa en lugar de crear otra.
+        Regresa (job, creado).
+        """
+        if modo not in MODOS:
+            raise ValueError(f"Modo inválido: {modo}. Opciones: {', '.join(MODOS)}")
+        with self.lock:
+            if self.current is not None and self.current.activo:
+                return self.current, False
+            job = Job(modo)
+            self.current = job
+            self.jobs[job.id] = job
+            self.history.append(job)
+            # Sólo se conservan los jobs del historial acotado
+            vigentes = {j.id for j in self.history}
+            for job_id in list(self.jobs):
+                if job_id not in vigentes:
+                    del self.jobs[job_id]
+            job.thread = threading.Thread(target=self._run, args=(job,), name=f"job-{job.id}", daemon=True)
+            job.thread.start()
+        return job, True
+
+    def _run(self, job):
+        job.estado = "corriendo"
+        job.inicio = time.time()
+        try:
+            if job.modo == "una_vez":
+                self.run_once(job.progress, job.cancel_event)
+            else:
+                self.run_scheduled(job.progress, job.cancel_event)
+            job.estado = "cancelado" if job.cancel_event.is_set() else "completado"
+        except Exception as e:
+            job.estado = "error"
+            job.error = str(e)
+            print(f"Error en job {job.id}: {e}")
+        finally:
+            job.fin = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.activo:
+            job.cancel_event.set()
+        return job
+
+    def list(self):
+        with self.lock:
+            return list(reversed(self.history))
+
+
+# main_orchestrator (y con él el motor de scraping) se importa hasta que corre un job,
+# así el API arranca sin cargarlo.
+def _run_once(progress, cancel):
+    from main_orchestrator import load_json_file, run_cycle, STORES_FILE
+    from scraper_completo import FAMILIAS
+
+    stores_data = load_json_file(STORES_FILE)
+    if stores_data is None:
+        raise RuntimeError(f"No se pudo leer {STORES_FILE}")
+    progress.begin_cycle(len(stores_data), len(FAMILIAS))
+    run_cycle(stores_data, FAMILIAS, progress=progress, cancel=cancel)
+
+
+def _run_scheduled(progress, cancel):
+    from main_orchestrator import main_orchestrator
+
+    main_orchestrator(progress=progress, cancel=cancel)
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
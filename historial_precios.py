@@ -0,0 +1,291 @@
+"""
+Historial de precios en columnas, sólo de anexado y particionado por día.
+
+Cada ciclo se anexan las observaciones (modelo canónico, sucursal, SKU, precio, hora)
+de todos los productos raspados. Cada día es un directorio con un archivo binario por
+columna:
+
+    historial_precios/AAAA-MM-DD/modelo.u4    id de modelos_canonicos
+                                 sucursal.u2  código estable de la sucursal (sucursales.json)
+                                 sku.u8       hash de 64 bits del SKU
+                                 precio.f8
+                                 ts.u4        segundos desde epoch
+
+Son arreglos planos de NumPy: se leen con memmap y las consultas sólo tocan las
+columnas y los días que necesitan. Si un anexado quedó a medias, las columnas se
+recortan a la más corta al leer.
+
+Consultas:
+- `rolling_prices(dias)`: moda (con su frecuencia) y mediana por modelo en la ventana.
+  Cada SKU de cada sucursal cuenta una vez por precio distinto que tuvo en la ventana
+  (no una vez por ciclo), así que la frecuencia de la moda son SKUs distintos, igual
+  que la moda del ciclo. Cada día se reduce por separado a (modelo, sucursal, SKU,
+  precio) distintos y luego se combinan: la memoria depende de los SKUs, no de las
+  observaciones.
+- `sku_history(sku)`: serie de precios de un SKU.
+
+Con BASELINE_OFERTAS=moda (o mediana) la detección de ofertas usa como precio de
+referencia el de la ventana de HISTORIAL_VENTANA_DIAS días en lugar de la moda del
+ciclo; los modelos sin historial siguen usando la del ciclo. Los días anteriores a
+HISTORIAL_DIAS_RETENCION se borran al abrir un día nuevo.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+HISTORY_DIR = "historial_precios"
+ENABLED = os.getenv("HISTORIAL_PRECIOS", "1") != "0"
+BASELINE_MODE = os.getenv("BASELINE_OFERTAS", "snapshot")   # snapshot | moda | mediana
+WINDOW_DAYS = int(os.getenv("HISTORIAL_VENTANA_DIAS", "7"))
+RETENTION_DAYS = int(os.getenv("HISTORIAL_DIAS_RETENCION", "90"))
+
+COLUMNS = {
+    "modelo": np.uint32,
+    "sucursal": np.uint16,
+    "sku": np.uint64,
+    "precio": np.float64,
+    "ts": np.uint32,
+}
+STORE_CODES_FILE = "sucursales.json"
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def sku_hash(sku):
+    return int.from_bytes(hashlib.blake2b(str(sku).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def partition_name(ts):
+    return datetime.date.fromtimestamp(ts).isoformat()
+
+
+class RollingPrice:
+    """frecuencia: SKUs con el precio de la moda; observaciones: parejas (SKU, precio) distintas."""
+    __slots__ = ("moda", "frecuencia", "mediana", "skus", "observaciones")
+
+    def __init__(self, moda, frecuencia, mediana, skus, observaciones):
+        self.moda = moda
+        self.frecuencia = frecuencia
+        self.mediana = mediana
+        self.skus = skus
+        self.observaciones = observaciones
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def price_counts(models, prices, counts=None):
+    """Reduce observaciones a grupos (modelo, precio, conteo), ordenados por modelo y precio."""
+    if len(models) == 0:
+        return models[:0], prices[:0], np.zeros(0, dtype=np.int64)
+    order = np.lexsort((prices, models))
+    sm = models[order]
+    sp = prices[order]
+    starts = np.flatnonzero(np.r_[True, (sm[1:] != sm[:-1]) | (sp[1:] != sp[:-1])])
+    if counts is None:
+        g_counts = np.diff(np.r_[starts, len(sm)])
+    else:
+        g_counts = np.add.reduceat(counts[order], starts)
+    return sm[starts], sp[starts], g_counts
+
+
+def distinct_observations(models, stores, skus, prices):
+    """Quita las repetidas: cada (modelo, sucursal, SKU, precio) queda una vez, en ese orden."""
+    if len(models) == 0:
+        return models[:0], stores[:0], skus[:0], prices[:0]
+    order = np.lexsort((prices, skus, stores, models))
+    sm, ss, sk, sp = models[order], stores[order], skus[order], prices[order]
+    keep = np.r_[True, (sm[1:] != sm[:-1]) | (ss[1:] != ss[:-1]) | (sk[1:] != sk[:-1]) | (sp[1:] != sp[:-1])]
+    return sm[keep], ss[keep], sk[keep], sp[keep]
+
+
+class PriceHistory:
+    def __init__(self, directory=HISTORY_DIR, retention_days=RETENTION_DAYS):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.store_codes_path = os.path.join(directory, STORE_CODES_FILE)
+        try:
+            with open(self.store_codes_path, encoding="utf-8") as f:
+                self.store_codes = json.load(f)
+        except FileNotFoundError:
+            self.store_codes = {}
+        self.store_names = {code: id_sucursal for id_sucursal, code in self.store_codes.items()}
+        self.current_partition = None
+
+    # --- Escritura ---
+
+    def _store_code(self, id_sucursal):
+        code = self.store_codes.get(id_sucursal)
+        if code is None:
+            code = self.store_codes[id_sucursal] = len(self.store_codes)
+            self.store_names[code] = id_sucursal
+            tmp = f"{self.store_codes_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.store_codes, f)
+            os.replace(tmp, self.store_codes_path)
+        return code
+
+    def append(self, id_sucursal, products, ts=None):
+        """Anexa las observaciones de una sucursal (Productos ya resueltos a modelo canónico)."""
+        if not products:
+            return
+        ts = int(ts if ts is not None else time.time())
+        n = len(products)
+        with self.lock:
+            partition = partition_name(ts)
+            path = os.path.join(self.directory, partition)
+            if partition != self.current_partition:
+                os.makedirs(path, exist_ok=True)
+                self.current_partition = partition
+                self.prune(ts)
+            columns = {
+                "modelo": np.fromiter((p.modelo_id for p in products), np.uint32, n),
+                "sucursal": np.full(n, self._store_code(str(id_sucursal)), np.uint16),
+                "sku": np.fromiter((sku_hash(p.sku) for p in products), np.uint64, n),
+                "precio": np.fromiter((p.precio for p in products), np.float64, n),
+                "ts": np.full(n, ts, np.uint32),
+            }
+            for name, values in columns.items():
+                with open(os.path.join(path, f"{name}.{np.dtype(COLUMNS[name]).str[1:]}"), "ab") as f:
+                    f.write(values.tobytes())
+
+    def prune(self, now=None):
+        cutoff = partition_name((now or time.time()) - self.retention_days * 86400)
+        for partition in self.partitions():
+            if partition < cutoff:
+                shutil.rmtree(os.path.join(self.directory, partition), ignore_errors=True)
+
+    # --- Lectura ---
+
+    def partitions(self, since=None):
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        )
+        return [name for name in names if since is None or name >= since]
+
+    def read(self, partition, names):
+        """{columna: memmap} de un día, recortadas al mismo número de filas."""
+        path = os.path.join(self.directory, partition)
+        files = {name: os.path.join(path, f"{name}.{np.dtype(COLUMNS[name]).str[1:]}") for name in names}
+        rows = min(
+            (os.path.getsize(f) // np.dtype(COLUMNS[name]).itemsize if os.path.exists(f) else 0)
+            for name, f in files.items()
+        )
+        if rows == 0:
+            return {name: np.zeros(0, COLUMNS[name]) for name in names}
+        return {name: np.memmap(f, dtype=COLUMNS[name], mode="r", shape=(rows,)) for name, f in files.items()}
+
+    def rolling_prices(self, days=WINDOW_DAYS, model_ids=None, now=None):
+        """
+        {modelo_id: RollingPrice} con las observaciones de los últimos `days` días antes
+        de `now` (por omisión, ahora).
+        """
+        until = now or time.time()
+        cutoff = until - days * 86400
+        wanted = None if model_ids is None else np.fromiter(model_ids, np.uint32)
+        names = ("modelo", "sucursal", "sku", "precio")
+        parts = []
+        last = partition_name(until)
+        for partition in self.partitions(since=partition_name(cutoff)):
+            if partition > last:
+                break
+            cols = self.read(partition, names + ("ts",))
+            mask = None
+            if len(cols["ts"]) and (cols["ts"][0] < cutoff or cols["ts"][-1] >= until):
+                mask = (cols["ts"] >= cutoff) & (cols["ts"] < until)
+            if wanted is not None:
+                in_set = np.isin(cols["modelo"], wanted)
+                mask = in_set if mask is None else mask & in_set
+            parts.append(distinct_observations(*(
+                np.asarray(cols[name] if mask is None else cols[name][mask]) for name in names
+            )))
+        if not parts:
+            return {}
+
+        models, stores, skus, prices = distinct_observations(
+            *(np.concatenate([part[i] for part in parts]) for i in range(len(names)))
+        )
+        if len(models) == 0:
+            return {}
+        # SKUs distintos por modelo (las filas vienen ordenadas por modelo, sucursal, SKU)
+        new_sku = np.r_[True, (models[1:] != models[:-1]) | (stores[1:] != stores[:-1]) | (skus[1:] != skus[:-1])]
+        sku_counts = np.add.reduceat(new_sku.astype(np.int64), np.flatnonzero(np.r_[True, models[1:] != models[:-1]]))
+
+        g_m, g_p, g_c = price_counts(models, prices)
+        starts = np.flatnonzero(np.r_[True, g_m[1:] != g_m[:-1]])
+        totals = np.add.reduceat(g_c, starts)
+        # Moda: mayor conteo y, en empate, el precio más bajo
+        best = np.lexsort((g_p, -g_c, g_m))
+        b_m = g_m[best]
+        heads = best[np.r_[True, b_m[1:] != b_m[:-1]]]
+        # Mediana (inferior): primer precio cuyo acumulado llega a la mitad de su modelo
+        cum = np.cumsum(g_c)
+        before = np.r_[0, cum[:-1]][starts]
+        medians = g_p[np.searchsorted(cum, before + (totals + 1) // 2)]
+
+        return {
+            int(model_id): RollingPrice(float(moda), int(frecuencia), float(mediana), int(n_skus), int(total))
+            for model_id, moda, frecuencia, mediana, n_skus, total in zip(
+                g_m[starts].tolist(), g_p[heads].tolist(), g_c[heads].tolist(),
+                medians.tolist(), sku_counts.tolist(), totals.tolist()
+            )
+        }
+
+    def sku_history(self, sku, id_sucursal=None, days=None, now=None):
+        """[(ts, id_sucursal, precio)] del SKU en orden cronológico."""
+        target = np.uint64(sku_hash(sku))
+        since = None
+        if days is not None:
+            since = partition_name((now or time.time()) - days * 86400)
+        store_code = None
+        if id_sucursal is not None:
+            store_code = self.store_codes.get(str(id_sucursal))
+            if store_code is None:
+                return []
+        history = []
+        for partition in self.partitions(since=since):
+            cols = self.read(partition, ("sku", "sucursal", "precio", "ts"))
+            rows = np.flatnonzero(cols["sku"] == target)
+            if store_code is not None and len(rows):
+                rows = rows[cols["sucursal"][rows] == store_code]
+            for row in rows.tolist():
+                history.append((int(cols["ts"][row]), self.store_names.get(int(cols["sucursal"][row])),
+                                float(cols["precio"][row])))
+        return history
+
+    def baseline(self, days=WINDOW_DAYS, mode=BASELINE_MODE, now=None):
+        """
+        {modelo_id: (precio, frecuencia)} para usar como precio dominante; con mediana la
+        frecuencia es el número de SKUs distintos. Vacío con BASELINE_OFERTAS=snapshot.
+        """
+        if mode not in ("moda", "mediana"):
+            return {}
+        return {
+            model_id: (stats.moda, stats.frecuencia) if mode == "moda" else (stats.mediana, stats.skus)
+            for model_id, stats in self.rolling_prices(days, now=now).items()
+        }
+
+
+def get_price_history():
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = PriceHistory()
+        return _history
+
+
+def history_baseline():
+    """Precios de referencia del historial si BASELINE_OFERTAS lo pide; si no, None."""
+    if not ENABLED or BASELINE_MODE not in ("moda", "mediana"):
+        return None
+    return get_price_history().baseline()
@@ -0,0 +1,180 @@
+"""
+Índice en memoria del último ciclo completado, para los endpoints de consulta de
+api_server (ofertas, precios de un modelo, inventario de una sucursal).
+
+El ciclo va llenando un IndexBuilder con los productos conforme llegan las sucursales
+(una fila por producto, no el Producto, que así se libera en cuanto el pipeline lo
+suelta); al terminar construye un CatalogIndex inmutable y lo publica cambiando una sola
+referencia, así las consultas nunca ven un índice a medias ni tocan disco. Como el
+índice no cambia, las respuestas ya serializadas (y comprimidas) se guardan por
+consulta hasta el siguiente intercambio.
+"""
+import gzip
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from deteccion_ofertas import detect_deals
+
+RENDER_CACHE_SIZE = 512
+GZIP_MIN_BYTES = 1024
+
+_index = None
+_versions = itertools.count(1)
+
+
+def product_row(p):
+    return {
+        "sku": p.sku,
+        "marca": p.marca,
+        "modelo": p.modelo,
+        "descripcion": p.descripcion,
+        "precio": p.precio,
+        "tienda": p.tienda,
+        "id_sucursal": p.id_sucursal,
+    }
+
+
+def deal_row(row, precio_dominante, margen):
+    return dict(row, precio_dominante=precio_dominante, margen=margen)
+
+
+def model_lookup_key(marca, modelo):
+    return (marca.strip().lower(), modelo.strip().lower())
+
+
+class CatalogIndex:
+    """
+    rows: una fila (ver product_row) por producto; model_keys / store_ids: la llave de
+    modelo y el id de sucursal de cada fila. Las filas se comparten entre el listado
+    por modelo y el de sucursal, y no se modifican.
+    baseline: {modelo_id: (precio, frecuencia)} de referencia del ciclo (el mismo que
+    usó el pipeline, ver PriceHistory.baseline); canonical_ids: {model_key: modelo_id}.
+    """
+
+    def __init__(self, rows, model_keys, store_ids, min_dominant_freq, min_profit, baseline=None,
+                 canonical_ids=None):
+        self.version = next(_versions)
+        self.built_at = time.time()
+
+        by_model = {}
+        model_ids = {}
+        for key, row in zip(model_keys, rows):
+            by_model.setdefault(key, []).append(row)
+        ids = [model_ids.setdefault(key, len(model_ids)) for key in model_keys]
+
+        baseline_prices = baseline_freqs = None
+        if baseline and canonical_ids:
+            baseline_prices = np.full(len(model_ids), np.nan)
+            baseline_freqs = np.zeros(len(model_ids))
+            for key, i in model_ids.items():
+                reference = baseline.get(canonical_ids.get(key))
+                if reference is not None:
+                    baseline_prices[i], baseline_freqs[i] = reference
+
+        # Misma detección que el pipeline, con la misma referencia del historial
+        table = detect_deals(
+            ids, [row["precio"] for row in rows], store_ids,
+            min_dominant_freq, min_profit, n_models=len(model_ids),
+            baseline_prices=baseline_prices, baseline_freqs=baseline_freqs
+        )
+        self.deals = [
+            deal_row(rows[row], dominante, margen)
+            for row, dominante, margen in zip(
+                table.rows.tolist(), table.dominant_prices.tolist(), table.margins.tolist()
+            )
+        ]
+        self.models = {}
+        for key, items in by_model.items():
+            dominante = table.model_dominant_price[model_ids[key]]
+            self.models[model_lookup_key(*key)] = {
+                "marca": key[0],
+                "modelo": key[1],
+                "precio_dominante": None if np.isnan(dominante) else float(dominante),
+                "precios": sorted(items, key=lambda r: r["precio"]),
+            }
+        self.stores = {}
+        for row in rows:
+            self.stores.setdefault(row["id_sucursal"], []).append(row)
+        self.total_products = len(rows)
+
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, request_key):
+        digest = hashlib.sha1(request_key.encode("utf-8")).hexdigest()[:16]
+        return f'W/"{self.version}-{digest}"'
+
+    def render(self, request_key, build):
+        """
+        Regresa (json_bytes, gzip_bytes o None) para la consulta, o None si `build`
+        no encontró nada. `build` sólo se llama la primera vez que se pide esa llave
+        en este índice.
+        """
+        with self._lock:
+            if request_key in self._rendered:
+                self._rendered.move_to_end(request_key)
+                return self._rendered[request_key]
+
+        result = build()
+        rendered = None
+        if result is not None:
+            body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+            compressed = gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_BYTES else None
+            rendered = (body, compressed)
+
+        with self._lock:
+            self._rendered[request_key] = rendered
+            while len(self._rendered) > RENDER_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+        return rendered
+
+
+class IndexBuilder:
+    """Acumula las filas de un ciclo mientras los productos fluyen hacia el pipeline."""
+
+    def __init__(self):
+        self.rows = []
+        self.model_keys = []
+        self.store_ids = []
+        self.canonical_ids = {}
+
+    def tee(self, store_results):
+        for id_sucursal, nombre_sucursal, products in store_results:
+            for p in products:
+                self.rows.append(product_row(p))
+                self.model_keys.append(p.model_key)
+                self.store_ids.append(p.store_id)
+                self.canonical_ids[p.model_key] = p.modelo_id
+            yield id_sucursal, nombre_sucursal, products
+
+    def build(self, min_dominant_freq, min_profit, baseline=None):
+        """`baseline`: la referencia con la que el pipeline evaluó el ciclo (aggregator.baseline)."""
+        return CatalogIndex(self.rows, self.model_keys, self.store_ids, min_dominant_freq, min_profit,
+                            baseline, self.canonical_ids)
+
+
+def publish_index(index):
+    """Intercambio atómico: las consultas en curso siguen con el índice anterior."""
+    global _index
+    _index = index
+    print(f"Índice de consultas v{index.version} publicado: {index.total_products} productos, {len(index.deals)} ofertas.")
+
+
+def get_index():
+    return _index
+
+
+def paginate(items, page, per_page):
+    start = (page - 1) * per_page
+    return {
+        "items": items[start:start + per_page],
+        "page": page,
+        "per_page": per_page,
+        "total": len(items),
+    }
@@ -0,0 +1,50 @@
+"""
+Token bucket para limitar la tasa de llamadas a servicios externos (OpenAI, Slack).
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    `rate` fichas por segundo con capacidad `capacity`. `acquire` bloquea hasta que hay
+    ficha; `penalize` vacía el bucket y lo congela `seconds` (p. ej. por un Retry-After).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Toma una ficha si hay; si no, regresa los segundos que faltan."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated = now
+            self.blocked_until = max(self.blocked_until, now + seconds)
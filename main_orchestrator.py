@@ -3,16 +3,18 @@ import json
 import datetime
 import time
 import os
+import threading
 
-# Importar funciones de los otros scripts
-from scraper_completo import scrape_store_for_families
-from procesador_ofertas import process_and_send_all_deals
+# Los demás scripts (motor, pipeline, numpy, Slack...) se importan dentro de run_cycle y
+# main_orchestrator: importar este módulo, p. ej. desde gestor_jobs, no los carga.
 
 # Archivos de configuración y estado
 STORES_FILE = "stores.json"
 # Horario de ejecución (en horas, formato 24h)
 START_HOUR = 7  # 7 AM
 END_HOUR = 20   # 8 PM
+# "horario": barrido completo cada hora; "continuo": sondeo adaptativo por (sucursal, familia)
+MODE = os.getenv("ORQUESTADOR_MODO", "horario")
 
 def load_json_file(filename):
     try:
@@ -29,7 +31,101 @@ def save_json_file(filename, data):
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=4)
 
-def main_orchestrator():
+# Tiendas donde se vio cada modelo en el ciclo anterior; permite emitir ofertas
+# de un modelo en cuanto esas tiendas terminan. Se comparte entre ciclos y jobs.
+expected_model_stores = {}
+
+def run_cycle(stores_data, familias=None, progress=None, cancel=None):
+    """
+    Un ciclo completo: raspar todas las tiendas en paralelo y, conforme llegan, agregar
+    por modelo y encolar las ofertas de los modelos que ya están completos.
+    `progress` recibe los avisos del motor (ver gestor_jobs.JobProgress); `cancel` es un
+    threading.Event que detiene el ciclo sin evaluar los modelos a medias.
+    Con PERFIL_CICLO_DIR definido se guarda un perfil cProfile del ciclo en ese directorio.
+    Con SCRAPER_PROCESOS > 0 el scraping se reparte en procesos worker a través de la
+    cola de trabajo (ver cola_trabajo); un ciclo interrumpido se retoma donde quedó.
+    Sin `familias` se piden todas las de scraper_completo.FAMILIAS.
+    """
+    from motor_scraping import get_engine
+    from scraper_completo import FAMILIAS
+    from pipeline_ofertas import run_pipeline
+    from snapshot_skus import get_snapshot_store
+    from cola_slack import get_delivery
+    from indice_consultas import IndexBuilder, publish_index
+    from procesador_ofertas import MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD
+    from metricas import span, profile_run
+    from modelos_canonicos import get_model_index
+    from historial_precios import get_price_history, ENABLED as HISTORY_ENABLED
+    from cola_trabajo import scrape_sharded, WORKER_PROCESSES
+    from snapshots_corrida import RunSnapshotWriter, ENABLED as RUN_SNAPSHOTS_ENABLED
+
+    if familias is None:
+        familias = FAMILIAS
+    # Arrancar el hilo de envío a Slack; retoma lo que haya quedado pendiente en el outbox
+    get_delivery()
+
+    # Los productos también alimentan el índice de consultas del API
+    index_builder = IndexBuilder()
+    if WORKER_PROCESSES > 0:
+        store_results = scrape_sharded(stores_data, familias, progress=progress, cancel=cancel)
+    else:
+        store_results = get_engine().scrape_stores(stores_data, familias, progress=progress, cancel=cancel)
+    # Snapshot de la corrida para poder repetir la detección fuera de línea
+    run_snapshot = RunSnapshotWriter() if RUN_SNAPSHOTS_ENABLED else None
+    if run_snapshot is not None:
+        store_results = run_snapshot.tee(store_results)
+    try:
+        with profile_run(), span("cycle") as s:
+            aggregator = run_pipeline(
+                index_builder.tee(store_results),
+                expected_stores=expected_model_stores,
+                snapshot=get_snapshot_store(),
+                cancel=cancel,
+                history=get_price_history() if HISTORY_ENABLED else None
+            )
+            s["rows"] = aggregator.total_products
+    except BaseException:
+        # Un ciclo que no terminó no deja snapshot (ni su archivo temporal abierto)
+        if run_snapshot is not None:
+            run_snapshot.discard()
+        raise
+    get_model_index().flush()
+    if cancel is not None and cancel.is_set():
+        if run_snapshot is not None:
+            run_snapshot.discard()
+        print("Ciclo cancelado.")
+        return aggregator
+    if run_snapshot is not None:
+        run_snapshot.commit()
+
+    expected_model_stores.clear()
+    expected_model_stores.update(aggregator.model_stores())
+    publish_index(index_builder.build(MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, aggregator.baseline))
+
+    print(f"\n--- Ciclo completado para todas las tiendas. Total de productos: {aggregator.total_products} ---")
+    if not aggregator.total_products:
+        print(f"No se encontraron datos en ninguna tienda.")
+    return aggregator
+
+def seconds_until_start(now):
+    next_start_time = now.replace(hour=START_HOUR, minute=0, second=0, microsecond=0)
+    if now.hour >= END_HOUR:
+        next_start_time += datetime.timedelta(days=1)
+    
+    sleep_seconds = (next_start_time - now).total_seconds()
+    if sleep_seconds < 0: # Should not happen if logic is correct, but for safety
+        sleep_seconds = 60 # Wait 1 minute if somehow time is negative
+    return sleep_seconds
+
+def main_orchestrator(progress=None, cancel=None):
+    """
+    Bucle programado: un ciclo por hora dentro del horario de operación, o sondeo
+    continuo con ORQUESTADOR_MODO=continuo (ver programador_sondeo). Con `cancel`
+    (threading.Event) las esperas se interrumpen y el bucle termina.
+    """
+    from scraper_completo import FAMILIAS
+    from programador_sondeo import run_continuous
+
     print("Iniciando orquestador principal...")
 
     # Cargar datos de sucursales
@@ -37,49 +133,31 @@ def main_orchestrator():
     if stores_data is None:
         return
 
-    # Definir las familias de productos a raspar
-    familias = ["CONSOLAS DE JUEGOS", "JUEGOS DE VIDEO", "ACCESORIOS DE CONSOLAS", 
-                "SMARTWATCH", "AUDIFONOS", "PROYECTORES", 
-                "LAPTOP Y MINI LAPTOP", "PC ESCRITORIO", "MONITORES", "TABLETAS", "CELULARES"]
+    # Las esperas se hacen sobre el evento para poder cancelarlas
+    cancel = cancel or threading.Event()
 
-    while True:
+    if MODE == "continuo":
+        run_continuous(stores_data, FAMILIAS, START_HOUR, END_HOUR, progress=progress, cancel=cancel)
+        return
+
+    while not cancel.is_set():
         now = datetime.datetime.now()
         if START_HOUR <= now.hour < END_HOUR:
             print(f"Ejecutando proceso a las {now.strftime('%H:%M:%S')}")
-            
-            all_scraped_products = []
-            for id_sucursal, nombre_sucursal in stores_data.items():
-                print(f"Procesando tienda: {nombre_sucursal} (ID: {id_sucursal})")
-
-                # Paso 1: Raspar datos de la tienda
-                scraped_data_from_store = scrape_store_for_families(id_sucursal, nombre_sucursal, familias)
-                all_scraped_products.extend(scraped_data_from_store)
-            
-            print(f"\n--- Scraping completado para todas las tiendas. Total de productos: {len(all_scraped_products)} ---")
-
-            # Paso 2: Procesar y enviar ofertas a Slack
-            if all_scraped_products:
-                process_and_send_all_deals(all_scraped_products)
-            else:
-                print(f"No se encontraron datos en ninguna tienda. Saltando procesamiento de ofertas.")
+            if progress is not None:
+                progress.begin_cycle(len(stores_data), len(FAMILIAS))
+            run_cycle(stores_data, FAMILIAS, progress=progress, cancel=cancel)
             
             # Esperar hasta el siguiente ciclo de ejecución (por ejemplo, 1 hora)
             print(f"Proceso completado para hoy. Esperando 1 hora para el próximo ciclo.")
-            time.sleep(3600) # Esperar 1 hora
+            cancel.wait(3600) # Esperar 1 hora
             
         else:
             print(f"Fuera del horario de operación ({START_HOUR}:00 - {END_HOUR}:00). Esperando... {now.strftime('%H:%M:%S')}")
             # Esperar hasta la hora de inicio
-            next_start_time = now.replace(hour=START_HOUR, minute=0, second=0, microsecond=0)
-            if now.hour >= END_HOUR:
-                next_start_time += datetime.timedelta(days=1)
-            
-            sleep_seconds = (next_start_time - now).total_seconds()
-            if sleep_seconds < 0: # Should not happen if logic is correct, but for safety
-                sleep_seconds = 60 # Wait 1 minute if somehow time is negative
-            
+            sleep_seconds = seconds_until_start(now)
             print(f"Esperando {int(sleep_seconds / 3600)} horas y {int((sleep_seconds % 3600) / 60)} minutos para el inicio de operaciones.")
-            time.sleep(sleep_seconds)
+            cancel.wait(sleep_seconds)
 
 if __name__ == "__main__":
-    main_orchestrator()
\ No newline at end of file
+    main_orchestrator()
@@ -0,0 +1,183 @@
+"""
+Instrumentación de la ruta caliente: spans de tiempo que alimentan histogramas y
+contadores, expuestos en formato de texto de Prometheus por `GET /metrics` de
+api_server.
+
+Uso:
+    with span("fetch", store=id_sucursal, family=familia) as s:
+        ...
+        s["status"] = 200
+        s["bytes"] = len(body)
+
+Cada span observa `efectimundo_<nombre>_seconds` con las etiquetas dadas (más las que
+se agreguen dentro del bloque) y, si trae "bytes" o "rows", suma esos contadores. Con
+METRICAS_SPANS_FILE definido, además se escribe cada span como una línea JSON.
+"""
+import cProfile
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+PREFIX = "efectimundo_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SPANS_FILE = os.getenv("METRICAS_SPANS_FILE")
+PROFILE_DIR = os.getenv("PERFIL_CICLO_DIR")
+
+_spans_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels_text(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [cuentas por bucket..., suma, total]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limit in enumerate(self.buckets):
+                if value <= limit:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for limit, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels_text(key + (('le', limit),))} {count}")
+                lines.append(f"{self.name}_bucket{_labels_text(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels_text(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels_text(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, help_text):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(PREFIX + name, help_text)
+            return self.metrics[name]
+
+    def counter(self, name, help_text):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(PREFIX + name, help_text)
+            return self.metrics[name]
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _write_span(name, duration, labels):
+    record = {"span": name, "segundos": round(duration, 6), "ts": time.time(), **labels}
+    with _spans_lock, open(SPANS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """
+    Mide el bloque. Dentro se pueden agregar etiquetas (p. ej. "status") y los valores
+    numéricos "bytes" / "rows", que van a contadores aparte.
+    """
+    extra = {}
+    start = time.perf_counter()
+    error = None
+    try:
+        yield extra
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        bytes_ = extra.pop("bytes", None)
+        rows = extra.pop("rows", None)
+        all_labels = {**labels, **extra}
+        if error is not None:
+            all_labels.setdefault("status", "error")
+        registry.histogram(f"{name}_seconds", f"Duración de {name} en segundos").observe(duration, **all_labels)
+        if bytes_ is not None:
+            registry.counter(f"{name}_bytes_total", f"Bytes procesados por {name}").inc(bytes_, **labels)
+        if rows is not None:
+            registry.counter(f"{name}_rows_total", f"Filas procesadas por {name}").inc(rows, **labels)
+        if SPANS_FILE:
+            _write_span(name, duration, {**all_labels, "bytes": bytes_, "rows": rows})
+
+
+def render_metrics():
+    return registry.render()
+
+
+@contextlib.contextmanager
+def profile_run(directory=None, label="ciclo"):
+    """
+    cProfile opcional alrededor de una ejecución; escribe <directory>/<label>-<fecha>.prof.
+    Sólo perfila el hilo que llama (el coordinador), no los hilos del pool.
+    """
+    directory = directory or PROFILE_DIR
+    if not directory:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        print(f"Perfil guardado en {path}")
@@ -0,0 +1,286 @@
+"""
+Índice de modelos canónicos: junta las variantes de captura de un mismo modelo
+("Galaxy A12", "GALAXY  A-12", "Galaxi A12") bajo un id estable.
+
+Cada (marca, modelo) crudo se normaliza (minúsculas, sin acentos, "+" a "plus" para
+que "S21+" no se junte con "S21", separadores a espacios, capacidades como
+"128 GB" -> "128gb", letra suelta pegada a su número: "a 12" -> "a12") y se
+resuelve así:
+
+1. Llave exacta: tokens normalizados ordenados. Si ya existe, ese es el modelo.
+2. Bloque: (marca, tokens con dígitos). Los tokens con número deben coincidir
+   exactamente, así "iPhone 12" y "iPhone 13" o "A12" y "M12" nunca se juntan.
+3. Dentro del bloque, mismo número de tokens alfabéticos y cada pareja igual o a una
+   edición de distancia (sólo tokens de 4+ letras): absorbe erratas como
+   "galaxi"/"galaxy" sin confundir "pro" con "plus".
+
+Las resoluciones crudo -> id se guardan en memoria y en SQLite (modelos_canonicos.db),
+así que cada variante se resuelve una sola vez entre corridas. El nombre que se
+muestra es la primera variante vista del modelo. Varios procesos pueden compartir la
+base (orquestador, workers, `raspar`, `replay`): los ids los asigna SQLite al dar de
+alta cada modelo, dentro de BEGIN IMMEDIATE y después de leer las altas de los demás.
+Si cambia la normalización (NORMALIZATION_VERSION) las resoluciones guardadas se
+descartan y se vuelven a resolver; los ids de los modelos se conservan.
+
+Con MODELOS_CANONICOS=0 sólo se juntan las variantes con la misma llave exacta y no se
+persiste nada. MODELOS_IGNORAR_CAPACIDAD=1 quita además los tokens de capacidad de la
+llave (agrupa 64gb con 128gb); por omisión se conservan porque cambian el precio.
+"""
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+MODEL_DB_FILE = "modelos_canonicos.db"
+ENABLED = os.getenv("MODELOS_CANONICOS", "1") != "0"
+IGNORE_CAPACITY = os.getenv("MODELOS_IGNORAR_CAPACIDAD", "0") == "1"
+FLUSH_EVERY = 500
+MIN_FUZZY_TOKEN = 4
+NORMALIZATION_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS canonicos (
+    id INTEGER PRIMARY KEY,
+    marca TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    marca_norm TEXT NOT NULL,
+    clave TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_canonicos_clave ON canonicos (marca_norm, clave);
+CREATE TABLE IF NOT EXISTS resoluciones (
+    marca TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    canonico INTEGER NOT NULL,
+    PRIMARY KEY (marca, modelo)
+);
+"""
+
+_PLUS_RE = re.compile(r"\+")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_CAPACITY_RE = re.compile(r"(\d+)\s*(gb|tb)\b")
+_WORD_DIGIT_RE = re.compile(r"([a-z]{2,})(\d)")
+_DIGIT_WORD_RE = re.compile(r"(\d)([a-z]{3,})")
+_LETTER_NUMBER_RE = re.compile(r"\b([a-z])\s+(\d)")
+_CAPACITY_TOKEN_RE = re.compile(r"\d+(gb|tb)")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = _PLUS_RE.sub(" plus ", text)
+    text = _NON_WORD_RE.sub(" ", text)
+    text = _CAPACITY_RE.sub(r"\1\2", text)
+    text = _WORD_DIGIT_RE.sub(r"\1 \2", text)
+    text = _DIGIT_WORD_RE.sub(r"\1 \2", text)
+    text = _LETTER_NUMBER_RE.sub(r"\1\2", text)
+    return text.split()
+
+
+def model_tokens(modelo):
+    """(tokens con dígitos, tokens alfabéticos), ambos ordenados."""
+    codes, words = [], []
+    for token in normalize_text(modelo):
+        if IGNORE_CAPACITY and _CAPACITY_TOKEN_RE.fullmatch(token):
+            continue
+        (codes if any(c.isdigit() for c in token) else words).append(token)
+    return tuple(sorted(codes)), tuple(sorted(words))
+
+
+def within_one_edit(a, b):
+    """True si a y b difieren en a lo más una inserción, borrado, cambio o transposición."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    return a[i:] == b[i + 1:]
+
+
+def similar_words(words, other):
+    if len(words) != len(other):
+        return False
+    for a, b in zip(words, other):
+        if a == b:
+            continue
+        if min(len(a), len(b)) < MIN_FUZZY_TOKEN or not within_one_edit(a, b):
+            return False
+    return True
+
+
+class CanonicalModelIndex:
+    def __init__(self, path=MODEL_DB_FILE, fuzzy=ENABLED):
+        self.path = path if fuzzy else None
+        self.fuzzy = fuzzy
+        self.lock = threading.Lock()
+        self.resolved = {}      # (marca, modelo) crudos -> (id, (marca, modelo) canónicos)
+        self.names = {}         # id -> (marca, modelo) canónicos
+        self.exact = {}         # (marca_norm, clave) -> id
+        self.blocks = {}        # (marca_norm, códigos) -> [(palabras, id)]
+        self.brands = {}        # marca_norm -> tokens, para erratas en la marca
+        self.pending_resolutions = []
+        self.next_id = 1        # sin base
+        self.loaded_id = 0      # id más alto leído de la base
+        self.conn = None
+        if self.path:
+            # Autocommit: las escrituras se hacen a mano con BEGIN IMMEDIATE (ver _write)
+            self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            # Cada alta es una transacción: con WAL el commit no espera a sincronizar el disco
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self._write(self._check_version)
+            self._load()
+
+    @staticmethod
+    def _check_version(conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] != NORMALIZATION_VERSION:
+            conn.execute("DELETE FROM resoluciones")
+            conn.execute(f"PRAGMA user_version = {NORMALIZATION_VERSION}")
+
+    def _load(self):
+        self._load_models()
+        for marca, modelo, model_id in self.conn.execute("SELECT marca, modelo, canonico FROM resoluciones"):
+            name = self.names.get(model_id)
+            if name is not None:
+                self.resolved[(marca, modelo)] = (model_id, name)
+
+    def _load_models(self):
+        """Agrega los modelos dados de alta (por este u otro proceso) desde la última lectura."""
+        for model_id, marca, modelo, marca_norm in self.conn.execute(
+            "SELECT id, marca, modelo, marca_norm FROM canonicos WHERE id > ? ORDER BY id", (self.loaded_id,)
+        ):
+            self._add(model_id, marca, modelo, marca_norm, model_tokens(modelo))
+            self.loaded_id = model_id
+
+    def _write(self, fn):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self.conn)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return result
+
+    def _add(self, model_id, marca, modelo, marca_norm, tokens):
+        codes, words = tokens
+        self.names[model_id] = (marca, modelo)
+        self.exact[(marca_norm, " ".join(codes + words))] = model_id
+        self.blocks.setdefault((marca_norm, codes), []).append((words, model_id))
+        self.brands.setdefault(marca_norm, tuple(marca_norm.split()))
+
+    def _brand(self, marca):
+        marca_norm = " ".join(normalize_text(marca))
+        if marca_norm in self.brands or not self.fuzzy:
+            return marca_norm
+        tokens = tuple(marca_norm.split())
+        for known, known_tokens in self.brands.items():
+            if similar_words(tokens, known_tokens):
+                return known
+        return marca_norm
+
+    def _match(self, marca_norm, tokens):
+        codes, words = tokens
+        model_id = self.exact.get((marca_norm, " ".join(codes + words)))
+        if model_id is not None or not self.fuzzy:
+            return model_id
+        for candidate, candidate_id in self.blocks.get((marca_norm, codes), ()):
+            if similar_words(words, candidate):
+                return candidate_id
+        return None
+
+    def _create(self, marca, modelo):
+        """Id del modelo, dándolo de alta si tampoco coincide con las altas de otros procesos."""
+        tokens = model_tokens(modelo)
+        if self.conn is None:
+            model_id = self.next_id
+            self.next_id += 1
+            self._add(model_id, marca, modelo, self._brand(marca), tokens)
+            return model_id
+
+        def insert(conn):
+            self._load_models()
+            marca_norm = self._brand(marca)
+            model_id = self._match(marca_norm, tokens)
+            if model_id is None:
+                model_id = conn.execute(
+                    "INSERT INTO canonicos (marca, modelo, marca_norm, clave) VALUES (?, ?, ?, ?)",
+                    (marca, modelo, marca_norm, " ".join(tokens[0] + tokens[1]))
+                ).lastrowid
+                self._add(model_id, marca, modelo, marca_norm, tokens)
+                self.loaded_id = model_id
+            return model_id
+
+        return self._write(insert)
+
+    def lookup(self, marca, modelo):
+        """(id, (marca, modelo) canónicos) si el modelo ya se conoce; no crea entradas."""
+        raw = (marca.strip(), modelo.strip())
+        hit = self.resolved.get(raw)
+        if hit is not None:
+            return hit
+        with self.lock:
+            model_id = self._match(self._brand(raw[0]), model_tokens(raw[1]))
+            return None if model_id is None else (model_id, self.names[model_id])
+
+    def resolve(self, marca, modelo):
+        """(id, (marca, modelo) canónicos); da de alta el modelo si no se parece a ninguno."""
+        raw = (marca, modelo)
+        hit = self.resolved.get(raw)
+        if hit is not None:
+            return hit
+        with self.lock:
+            hit = self.resolved.get(raw)
+            if hit is not None:
+                return hit
+            model_id = self._match(self._brand(marca), model_tokens(modelo))
+            if model_id is None:
+                model_id = self._create(marca, modelo)
+            hit = self.resolved[raw] = (model_id, self.names[model_id])
+            self.pending_resolutions.append((marca, modelo, model_id))
+            pending = len(self.pending_resolutions) >= FLUSH_EVERY
+        if pending:
+            self.flush()
+        return hit
+
+    def flush(self):
+        if self.conn is None:
+            return
+        with self.lock:
+            resolutions, self.pending_resolutions = self.pending_resolutions, []
+            if resolutions:
+                self._write(lambda conn: conn.executemany(
+                    "INSERT OR REPLACE INTO resoluciones (marca, modelo, canonico) VALUES (?, ?, ?)",
+                    resolutions
+                ))
+
+    def __len__(self):
+        return len(self.names)
+
+
+def get_model_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CanonicalModelIndex()
+                atexit.register(_index.flush)
+    return _index
+
+
+def resolve_model(marca, modelo):
+    return get_model_index().resolve(marca, modelo)
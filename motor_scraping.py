@@ -0,0 +1,460 @@
+"""
+Motor de scraping concurrente para el catálogo de Efectimundo.
+
+Reparte el trabajo en unidades (sucursal, familia, página) sobre un pool de hilos que
+comparte una sesión HTTP con conexiones keep-alive. Cada host tiene un límite de
+concurrencia adaptativo (AIMD): se reduce a la mitad ante 429/5xx o errores de red y
+sube de uno en uno mientras el servidor responda rápido.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scraper_completo import (
+    CATALOG_URL,
+    request_catalog_page,
+    total_pages_for,
+    build_store_products,
+)
+from extractor_tabla import TableExtractor, PROJECTED_COLUMNS
+from metricas import span
+from cache_paginas import page_digest, get_page_cache, ENABLED as PAGE_CACHE_ENABLED
+from planificador_consultas import (
+    StorePlan, ALL_FAMILIES, FAMILY_COLUMN, POR_FAMILIA, SONDEO, normalize_family, get_planner,
+    ENABLED as PLANNER_ENABLED
+)
+
+# Concurrencia global (tamaño del pool de hilos) y por host
+MAX_WORKERS = int(os.getenv("SCRAPER_MAX_WORKERS", "16"))
+PER_HOST_INITIAL = int(os.getenv("SCRAPER_PER_HOST_INITIAL", "4"))
+PER_HOST_MAX = int(os.getenv("SCRAPER_PER_HOST_MAX", "12"))
+PER_HOST_MIN = 1
+# Latencia (segundos) por debajo de la cual consideramos que el servidor va holgado
+TARGET_LATENCY = float(os.getenv("SCRAPER_TARGET_LATENCY", "1.5"))
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2.0  # segundos, se duplica en cada intento
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def build_session(pool_size=MAX_WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Sesión HTTP compartida por todo el proceso para reutilizar conexiones keep-alive.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+class AdaptiveLimiter:
+    """
+    Semáforo con límite variable para un host.
+
+    - Respuesta rápida (< target_latency): +1 al límite cada `limit` éxitos seguidos.
+    - Respuesta lenta (> 2 * target_latency): -1 al límite.
+    - 429 / 5xx / error de red: el límite se reduce a la mitad y, si hay Retry-After,
+      nadie vuelve a pedir hasta que pase ese tiempo.
+    """
+
+    def __init__(self, initial=PER_HOST_INITIAL, minimum=PER_HOST_MIN,
+                 maximum=PER_HOST_MAX, target_latency=TARGET_LATENCY):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.successes = 0
+        self.blocked_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait_for = self.blocked_until - time.monotonic()
+                if wait_for > 0:
+                    self._cond.wait(wait_for)
+                    continue
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                self._cond.wait()
+
+    def release(self, latency, ok, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            if not ok:
+                self.successes = 0
+                self.limit = max(self.minimum, self.limit // 2)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif latency > 2 * self.target_latency:
+                self.successes = 0
+                self.limit = max(self.minimum, self.limit - 1)
+            elif latency < self.target_latency:
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.successes = 0
+                    self.limit = min(self.maximum, self.limit + 1)
+            self._cond.notify_all()
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class StoreProducts(list):
+    """
+    Productos de una sucursal. `sin_cambios` es True cuando todas sus páginas llegaron
+    idénticas a las de la caché de páginas, es decir, la sucursal no cambió desde la
+    corrida anterior. `failed_families` son las familias con alguna página que no se
+    pudo obtener: sus productos pueden estar incompletos. `by_family` reparte los mismos
+    productos por familia pedida ({familia: [Producto]}; las omitidas no aparecen).
+    """
+
+    def __init__(self, products=(), sin_cambios=False, failed_families=(), by_family=None):
+        super().__init__(products)
+        self.sin_cambios = sin_cambios
+        self.failed_families = frozenset(failed_families)
+        self.by_family = by_family or {}
+
+
+class ScrapeEngine:
+    """
+    Ejecuta el scraping de varias sucursales y familias en paralelo.
+
+    La página 1 de cada (sucursal, familia) se pide primero; en cuanto regresa con
+    `rowCount` se encolan las páginas 2..N. Ningún hilo del pool espera a otro, la
+    coordinación se hace en el hilo que llama.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, session=None, limiter_factory=AdaptiveLimiter,
+                 planner=None, page_cache=None):
+        self.max_workers = max_workers
+        self.session = session or get_session()
+        # FetchPlanner opcional (ver planificador_consultas); sin él se pide familia por familia
+        self.planner = planner
+        # PageCache opcional (ver cache_paginas) para no volver a extraer páginas idénticas
+        self.page_cache = page_cache
+        self.limiter_factory = limiter_factory
+        self.limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def limiter_for(self, url):
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            if host not in self.limiters:
+                self.limiters[host] = self.limiter_factory()
+            return self.limiters[host]
+
+    def fetch_page(self, page_number, familia, id_sucursal):
+        """
+        Pide una página respetando el límite del host y reintentando 429/5xx.
+        Regresa el JSON de la respuesta o None.
+        """
+        limiter = self.limiter_for(CATALOG_URL)
+        for attempt in range(MAX_RETRIES + 1):
+            limiter.acquire()
+            start = time.monotonic()
+            response = None
+            try:
+                with span("fetch", store=id_sucursal, family=familia or "*") as s:
+                    response = request_catalog_page(self.session, page_number, familia, id_sucursal)
+                    s["status"] = response.status_code
+                    s["bytes"] = len(response.content)
+                latency = time.monotonic() - start
+                if response.status_code in RETRYABLE_STATUS:
+                    limiter.release(latency, ok=False, retry_after=_retry_after_seconds(response))
+                    error = f"HTTP {response.status_code}"
+                else:
+                    limiter.release(latency, ok=response.ok)
+                    response.raise_for_status()
+                    return response.json()
+            except requests.HTTPError as e:
+                print(f"Error al obtener página {page_number} de {familia} en sucursal {id_sucursal}: {e}")
+                return None
+            except Exception as e:
+                if response is None:
+                    limiter.release(time.monotonic() - start, ok=False)
+                    error = str(e)
+                else:
+                    print(f"Respuesta inválida en página {page_number} de {familia} en sucursal {id_sucursal}: {e}")
+                    return None
+
+            if attempt < MAX_RETRIES:
+                time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+        print(f"Error al obtener página {page_number} de {familia} en sucursal {id_sucursal}: {error}")
+        return None
+
+    def fetch_and_extract(self, page_number, familia, id_sucursal, extractor=None):
+        """
+        Pide una página y extrae sus filas en el mismo hilo del pool. En la página 1 se
+        construye el extractor de la familia; las siguientes reutilizan ese esquema. Sin
+        familia (todas juntas) se proyecta además la columna Familia para filtrar.
+        Regresa (data, extractor, filas, sin_cambios); sin_cambios indica que la página
+        era idéntica a la de la caché y sus filas salieron de ahí.
+        """
+        data = self.fetch_page(page_number, familia, id_sucursal)
+        if not data or not data.get("tabla"):
+            return data, extractor, [], False
+        columns = extractor.columns if extractor is not None else (
+            PROJECTED_COLUMNS + (FAMILY_COLUMN,) if familia == ALL_FAMILIES else PROJECTED_COLUMNS
+        )
+        cache = self.page_cache
+        if cache is not None:
+            digest = page_digest(data)
+            cached = cache.lookup(id_sucursal, familia, page_number, digest, columns)
+            if cached is not None:
+                headers, rows = cached
+                return data, extractor or TableExtractor(headers, columns), rows, True
+        with span("parse", store=id_sucursal, family=familia or "*") as s:
+            if extractor is None:
+                extractor = TableExtractor.from_html(data["tabla"], columns)
+            rows = list(extractor.rows(data["tabla"]))
+            s["rows"] = len(rows)
+        if cache is not None:
+            cache.store(id_sucursal, familia, page_number, digest, data["tabla"],
+                        extractor.headers, extractor.columns, rows)
+        return data, extractor, rows, False
+
+    def scrape_stores(self, stores, familias, progress=None, cancel=None):
+        """
+        Generador: recibe {id_sucursal: nombre_sucursal} y va regresando
+        (id_sucursal, nombre_sucursal, productos) conforme termina cada sucursal.
+
+        familias: lista común a todas las sucursales o {id_sucursal: familias} para pedir
+        a cada una sólo las suyas.
+
+        Con planificador, cada sucursal se pide familia por familia o toda junta (familia
+        vacía, filtrando aquí por `familias`) según su plan; las familias que suelen salir
+        vacías se saltan.
+
+        progress: objeto opcional con page_done(id_sucursal, familia, pagina, filas),
+        family_done(id_sucursal, familia, productos) y store_done(id_sucursal, productos).
+        cancel: threading.Event opcional; al activarse se descartan las páginas
+        pendientes y el generador termina sin regresar las sucursales incompletas.
+        """
+        planner = self.planner
+        if planner is not None:
+            planner.begin_run()
+        stores = list(stores.items())
+        # (id_sucursal, familia) -> páginas pendientes, extractor y filas por página;
+        # familia == ALL_FAMILIES es la consulta de todas las familias juntas
+        pending_pages = {}
+        family_extractors = {}
+        family_rows = {}
+        store_names = dict(stores)
+        store_products = {id_sucursal: [] for id_sucursal, _ in stores}
+        family_products = {id_sucursal: {} for id_sucursal, _ in stores}
+        plans = {}
+        units_left = {}
+        # id_sucursal -> {familia: rowCount} para el planificador; sin las que fallaron
+        observed = {}
+        # id_sucursal -> [páginas, páginas sin cambios]
+        page_stats = {id_sucursal: [0, 0] for id_sucursal, _ in stores}
+        # id_sucursal -> familias con alguna página fallida (o ALL_FAMILIES)
+        failed = {id_sucursal: set() for id_sucursal, _ in stores}
+
+        def family_done(id_sucursal, familia, products):
+            if progress is not None:
+                progress.family_done(id_sucursal, familia, products)
+
+        def start_per_family(id_sucursal, plan):
+            for familia in plan.omitidas:
+                family_done(id_sucursal, familia, 0)
+            for familia in plan.activas:
+                submit(id_sucursal, familia, 1)
+            return len(plan.activas)
+
+        def finish_family(id_sucursal, familia):
+            key = (id_sucursal, familia)
+            extractor = family_extractors.pop(key, None)
+            pages = family_rows.pop(key, {})
+            rows = [row for page in sorted(pages) for row in pages[page]]
+            pending_pages.pop(key, None)
+            if familia == ALL_FAMILIES:
+                finish_all_families(id_sucursal, extractor, rows)
+            else:
+                products = []
+                if extractor is not None and rows:
+                    products = build_store_products(extractor.columns, rows, id_sucursal, store_names[id_sucursal])
+                    store_products[id_sucursal].extend(products)
+                family_products[id_sucursal][familia] = products
+                family_done(id_sucursal, familia, len(products))
+            units_left[id_sucursal] -= 1
+            return units_left[id_sucursal] == 0
+
+        def finish_all_families(id_sucursal, extractor, rows):
+            by_family = {}
+            if extractor is not None:
+                i_familia = extractor.columns.index(FAMILY_COLUMN)
+                for row in rows:
+                    by_family.setdefault(normalize_family(row[i_familia]), []).append(row)
+            if ALL_FAMILIES in failed[id_sucursal]:
+                # Con alguna página perdida los conteos por familia salen cortos (y las
+                # familias de esas páginas, vacías): no se le pasan al planificador
+                observed.pop(id_sucursal, None)
+            if id_sucursal in observed:
+                # Una sola consulta observa todas las familias de la sucursal
+                for familia, matching in by_family.items():
+                    observed[id_sucursal][familia] = len(matching)
+            for familia in plans[id_sucursal].familias:
+                selected = by_family.get(normalize_family(familia), [])
+                if id_sucursal in observed:
+                    observed[id_sucursal].setdefault(normalize_family(familia), len(selected))
+                products = []
+                if selected:
+                    products = build_store_products(extractor.columns, selected, id_sucursal, store_names[id_sucursal])
+                    store_products[id_sucursal].extend(products)
+                family_products[id_sucursal][familia] = products
+                family_done(id_sucursal, familia, len(products))
+
+        def finish_store(id_sucursal):
+            pages, unchanged = page_stats.pop(id_sucursal)
+            errors = failed.pop(id_sucursal)
+            if ALL_FAMILIES in errors:
+                errors = (errors - {ALL_FAMILIES}) | set(plans[id_sucursal].familias)
+            products = StoreProducts(store_products.pop(id_sucursal),
+                                     sin_cambios=pages > 0 and unchanged == pages and not errors,
+                                     failed_families=errors, by_family=family_products.pop(id_sucursal))
+            if planner is not None and id_sucursal in observed:
+                planner.record(id_sucursal, observed.pop(id_sucursal))
+            if self.page_cache is not None:
+                self.page_cache.flush()
+            if progress is not None:
+                progress.store_done(id_sucursal, len(products))
+            return id_sucursal, store_names[id_sucursal], products
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+
+            def submit(id_sucursal, familia, page, extractor=None):
+                future = executor.submit(self.fetch_and_extract, page, familia, id_sucursal, extractor)
+                futures[future] = (id_sucursal, familia, page)
+
+            empty_stores = []
+            for id_sucursal, nombre_sucursal in stores:
+                store_familias = familias[id_sucursal] if isinstance(familias, dict) else familias
+                if planner is None:
+                    plan = StorePlan(id_sucursal, POR_FAMILIA, store_familias)
+                else:
+                    plan = planner.plan(id_sucursal, store_familias)
+                    observed[id_sucursal] = {}
+                plans[id_sucursal] = plan
+                if plan.familias:
+                    print(f"Procesando tienda: {nombre_sucursal} (ID: {id_sucursal}), consulta {plan.modo}")
+                if plan.modo == POR_FAMILIA:
+                    units_left[id_sucursal] = start_per_family(id_sucursal, plan)
+                else:
+                    units_left[id_sucursal] = 1
+                    submit(id_sucursal, ALL_FAMILIES, 1)
+                if units_left[id_sucursal] == 0:
+                    empty_stores.append(id_sucursal)
+
+            for id_sucursal in empty_stores:
+                yield finish_store(id_sucursal)
+
+            while futures:
+                if cancel is not None and cancel.is_set():
+                    for future in futures:
+                        future.cancel()
+                    print("Scraping cancelado; se descartan las páginas pendientes.")
+                    return
+                done, _ = wait(futures, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    id_sucursal, familia, page_number = futures.pop(future)
+                    key = (id_sucursal, familia)
+                    try:
+                        data, extractor, rows, unchanged = future.result()
+                    except Exception as e:
+                        print(f"Error al procesar {familia or 'todas las familias'} en {store_names[id_sucursal]}: {e}")
+                        data, extractor, rows, unchanged = None, None, [], False
+                    if progress is not None:
+                        progress.page_done(id_sucursal, familia, page_number, len(rows))
+
+                    if page_number == 1:
+                        plan = plans[id_sucursal]
+                        if familia == ALL_FAMILIES and planner is not None:
+                            keep = data is not None
+                            if data and data.get("tabla"):
+                                keep = planner.keep_all_families(plan, data.get("rowCount", 0), extractor.headers)
+                                if not keep and plan.modo != SONDEO and FAMILY_COLUMN in extractor.headers:
+                                    # Ya se había decidido pedir todas: se sigue y la
+                                    # próxima corrida replanea con el total nuevo
+                                    keep = True
+                            if not keep:
+                                # Error, sondeo que no conviene o sin columna Familia
+                                plan.modo = POR_FAMILIA
+                                units_left[id_sucursal] += start_per_family(id_sucursal, plan) - 1
+                                if units_left[id_sucursal] == 0:
+                                    yield finish_store(id_sucursal)
+                                continue
+
+                    stats = page_stats[id_sucursal]
+                    if data is None:
+                        failed[id_sucursal].add(familia)
+                    elif data.get("tabla"):
+                        stats[0] += 1
+                        stats[1] += unchanged
+
+                    if page_number == 1:
+                        if data is not None and familia != ALL_FAMILIES and id_sucursal in observed:
+                            observed[id_sucursal][normalize_family(familia)] = (
+                                int(data.get("rowCount", 0)) if data.get("tabla") else 0
+                            )
+                        if not data or not data.get("tabla"):
+                            print(f"No hay datos para {familia or 'ninguna familia'} en {store_names[id_sucursal]}.")
+                        else:
+                            family_extractors[key] = extractor
+                            family_rows[key] = {1: rows}
+                            pages = total_pages_for(data)
+                            pending_pages[key] = max(0, pages - 1)
+                            for page in range(2, pages + 1):
+                                submit(id_sucursal, familia, page, extractor)
+                    else:
+                        family_rows[key][page_number] = rows
+                        pending_pages[key] -= 1
+
+                    if pending_pages.get(key, 0) == 0 and finish_family(id_sucursal, familia):
+                        yield finish_store(id_sucursal)
+
+    def scrape_store(self, id_sucursal, nombre_sucursal, familias):
+        products = []
+        for _, _, store_products in self.scrape_stores({id_sucursal: nombre_sucursal}, familias):
+            products.extend(store_products)
+        return products
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ScrapeEngine(
+                planner=get_planner() if PLANNER_ENABLED else None,
+                page_cache=get_page_cache() if PAGE_CACHE_ENABLED else None,
+            )
+        return _engine
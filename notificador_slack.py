@@ -1,42 +1,25 @@
 import os
-import json
-import urllib.request
+import requests
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+# Slack admite hasta 50 bloques por mensaje: encabezado + 2 por oferta
+MAX_DIGEST_ITEMS = 24
 
-def send_slack_notification(payload):
+def post_slack_payload(payload, session=None, timeout=10):
     """
-    Envía un mensaje al webhook de Slack configurado con estructura de bloques.
+    Hace el POST al webhook y regresa la respuesta cruda (requests.Response), para que
+    la cola de envío pueda revisar status y Retry-After.
     """
-    if not SLACK_WEBHOOK_URL:
-        print("Error: La URL del webhook de Slack no está configurada. Revisa tus variables de entorno.")
-        return
-
-    try:
-        data = json.dumps(payload).encode("utf-8")
-
-        req = urllib.request.Request(
-            SLACK_WEBHOOK_URL,
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
-
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                print("Notificación de Slack enviada con éxito.")
-            else:
-                print(f"Error al enviar notificación a Slack: {response.status} {response.read().decode()}")
-
-    except Exception as e:
-        print(f"No se pudo enviar la notificación a Slack: {e}")
+    session = session or requests
+    return session.post(SLACK_WEBHOOK_URL, json=payload, timeout=timeout)
 
 def format_slack_message(product, comparison_data):
     """
-    Formatea el mensaje de la oferta para enviarlo a Slack usando blocks.
+    Formatea el mensaje de la oferta (un Producto) para enviarlo a Slack usando blocks.
     """
     blocks = []
 
@@ -44,24 +27,24 @@ def format_slack_message(product, comparison_data):
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": f""":iphone: *Oferta de {product['Marca']} {product['Modelo']} encontrada!*
-*Modelo:* {product['Modelo']}
-*Sucursal:* {product['Tienda']}
-*Descripción:* {product['Descripción']}
+            "text": f""":iphone: *Oferta de {product.marca} {product.modelo} encontrada!*
+*Modelo:* {product.modelo}
+*Sucursal:* {product.tienda}
+*Descripción:* {product.descripcion}
 *Prenda/Lote:* {comparison_data['product_id']}
-:moneybag: *Precio de sucursal:* {product['Precio Promoción']}
+:moneybag: *Precio de sucursal:* ${product.precio:,.2f}
 :moneybag: Precio dominante (modelo): ${comparison_data['precio_dominante']:,.2f}
 💵 *Margen estimado:* {comparison_data['margen']}"""
         }
     })
 
     # Agregar imagen si existe
-    imagenes = product.get("Imagenes", [])
+    imagenes = product.imagenes
     if imagenes and isinstance(imagenes[0], str) and imagenes[0].startswith("http"):
         blocks.append({
             "type": "image",
             "image_url": imagenes[0],
-            "alt_text": f"Imagen de {product['Marca']} {product['Modelo']}"
+            "alt_text": f"Imagen de {product.marca} {product.modelo}"
         })
 
     blocks.append({
@@ -76,4 +59,38 @@ def format_slack_message(product, comparison_data):
 
     blocks.append({ "type": "divider" })
 
-    return { "blocks": blocks }
\ No newline at end of file
+    return { "blocks": blocks }
+
+def format_slack_digest(deals, analisis_por_oferta, top_n):
+    """
+    Resumen con las `top_n` mejores ofertas (ya ordenadas por margen) en un solo mensaje.
+    Slack admite hasta 50 bloques por mensaje, así que top_n se limita a MAX_DIGEST_ITEMS.
+    """
+    seleccion = deals[:min(top_n, MAX_DIGEST_ITEMS)]
+    blocks = [{
+        "type": "header",
+        "text": {"type": "plain_text", "text": f"Top {len(seleccion)} ofertas de {len(deals)} encontradas"}
+    }]
+
+    for i, product in enumerate(seleccion, start=1):
+        section = {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"""*{i}. {product.marca} {product.modelo}* - {product.tienda}
+*Prenda/Lote:* {product.sku} | :moneybag: ${product.precio:,.2f} vs ${product.precio_dominante:,.2f} | 💵 *Margen:* ${product.margen:,.2f}
+🤖 {analisis_por_oferta.get(product.deal_id, '')}"""
+            }
+        }
+        # Miniatura si existe
+        imagenes = product.imagenes
+        if imagenes and isinstance(imagenes[0], str) and imagenes[0].startswith("http"):
+            section["accessory"] = {
+                "type": "image",
+                "image_url": imagenes[0],
+                "alt_text": f"Imagen de {product.marca} {product.modelo}"
+            }
+        blocks.append(section)
+        blocks.append({ "type": "divider" })
+
+    return { "blocks": blocks }
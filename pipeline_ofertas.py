@@ -0,0 +1,373 @@
+"""
+Pipeline en streaming scraping -> agregación por modelo -> detección de ofertas.
+
+Los productos entran tienda por tienda desde el motor de scraping. El agregador lleva
+un conteo de precios por (Marca, Modelo) y, en cuanto todas las tiendas donde se vio
+un modelo en el ciclo anterior ya reportaron, evalúa ese modelo y emite sus ofertas
+sin esperar al final del barrido. Al terminar, el resto de los modelos se evalúa de
+una vez.
+
+Un modelo evaluado sólo conserva en memoria su conteo de precios y los artículos que
+ya quedan por debajo del precio dominante menos el margen mínimo; el resto se escribe
+a un archivo temporal del ciclo. Si después llegan filas del modelo desde una tienda
+que no se esperaba, la moda puede moverse: se recuperan sus artículos y flush lo
+evalúa completo. Si no, al final se reevalúa desde el conteo. Así lo retenido crece
+con los modelos y las ofertas, no con las filas.
+
+Con un SnapshotStore (ver snapshot_skus) sólo se evalúan los modelos con SKUs nuevos,
+con precio cambiado o desaparecidos, y de ellos sólo se emiten las ofertas cuyo SKU
+cambió, salvo que haya cambiado el precio dominante del modelo.
+
+Con un PriceHistory (ver historial_precios) cada tienda se anexa al historial y, si
+BASELINE_OFERTAS lo pide, los modelos se evalúan contra el precio de la ventana de
+historial calculado al inicio del ciclo.
+"""
+import os
+import pickle
+import queue
+import tempfile
+import threading
+from collections import Counter
+
+from procesador_ofertas import (
+    select_model_deals, send_deals, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, SLACK_DIGEST_TOP_N
+)
+from deteccion_ofertas import detect_grouped_deals
+from producto import as_producto
+from metricas import span
+
+
+class ModelState:
+    __slots__ = ("conteo", "items", "stores", "emitted", "evaluated", "dirty", "changed_ids", "modelo_id",
+                 "released", "spilled", "pending_ids")
+
+    def __init__(self, modelo_id=None):
+        self.conteo = Counter()
+        self.items = []
+        self.stores = set()
+        self.emitted = set()
+        self.evaluated = False
+        self.dirty = False
+        self.changed_ids = set()
+        self.modelo_id = modelo_id
+        # True cuando `items` ya sólo tiene candidatos (ver ModelAggregator._release)
+        self.released = False
+        # Posiciones en ModelAggregator.spill de los artículos soltados
+        self.spilled = []
+        # Cambios que todavía no pasan por una evaluación (ver ModelAggregator.abandon)
+        self.pending_ids = set()
+
+
+class ModelAggregator:
+    """
+    Agregador en línea por (Marca, Modelo).
+
+    expected_stores: {model_key: set(id_sucursal)} aprendido del ciclo anterior
+    (ver `model_stores()`); con él se sabe cuándo un modelo ya está completo.
+    snapshot: SnapshotStore opcional para el modo incremental.
+    history / baseline: PriceHistory opcional donde se anexan las observaciones y
+    {modelo_id: (precio, frecuencia)} de referencia (ver PriceHistory.baseline).
+    """
+
+    def __init__(self, expected_stores=None, snapshot=None, history=None, baseline=None):
+        self.expected_stores = expected_stores or {}
+        self.snapshot = snapshot
+        self.history = history
+        self.baseline = baseline or {}
+        self.models = {}
+        self.reported_stores = set()
+        self.total_products = 0
+        self.spill = None
+
+    def _state(self, key, modelo_id=None):
+        state = self.models.get(key)
+        if state is None:
+            state = self.models[key] = ModelState(modelo_id)
+        return state
+
+    def add(self, product, changed=True):
+        state = self._state(product.model_key, product.modelo_id)
+        if state.released:
+            self._reopen(state)
+        state.conteo[product.precio] += 1
+        state.items.append(product)
+        state.stores.add(product.id_sucursal)
+        if changed:
+            state.dirty = True
+            state.changed_ids.add(product.deal_id)
+            state.pending_ids.add(product.deal_id)
+        self.total_products += 1
+
+    def add_store(self, id_sucursal, products):
+        """
+        Agrega los productos de una tienda; con snapshot registra el diff y marca como
+        sucios sólo los modelos afectados. Si el motor marcó la tienda como sin cambios
+        (todas sus páginas idénticas) el snapshot sólo actualiza el ciclo; si le fallaron
+        familias, no se da nada por desaparecido.
+        """
+        sin_cambios = getattr(products, "sin_cambios", False)
+        complete = not getattr(products, "failed_families", None)
+        products = [as_producto(p) for p in products]
+        if self.history is not None:
+            self.history.append(id_sucursal, products)
+        if self.snapshot is None:
+            for product in products:
+                self.add(product)
+            return
+
+        diff = None
+        if sin_cambios:
+            diff = self.snapshot.touch_store(id_sucursal, len(products))
+        if diff is None:
+            diff = self.snapshot.record_store(id_sucursal, products, complete)
+        changed = diff.changed_ids()
+        for product in products:
+            self.add(product, changed=product.deal_id in changed)
+        for key in diff.disappeared_models():
+            if key in self.models:
+                self.models[key].dirty = True
+        print(f"Diff sucursal {id_sucursal}: {len(diff.new)} nuevos, {len(diff.changed)} con cambio de precio, "
+              f"{len(diff.disappeared)} desaparecidos, {diff.unchanged} sin cambio.")
+
+    def _needs_evaluation(self, state):
+        return self.snapshot is None or state.dirty
+
+    def _evaluate(self, key):
+        state = self.models[key]
+        state.evaluated = True
+        state.pending_ids.clear()
+        deals = []
+        if self._needs_evaluation(state):
+            precio_dominante, ofertas = select_model_deals(
+                state.items, state.conteo, self.baseline.get(state.modelo_id)
+            )
+            deals = self._new_deals(key, precio_dominante, ofertas)
+        self._release(state)
+        return deals
+
+    def _release(self, state):
+        """
+        Suelta a disco los artículos que con el precio dominante actual no pueden ser
+        oferta; el conteo sigue completo, así que flush reevalúa el modelo con
+        select_model_deals.
+        """
+        baseline = self.baseline.get(state.modelo_id)
+        if baseline is not None:
+            precio_dominante = baseline[0]
+        elif state.conteo:
+            precio_dominante = state.conteo.most_common(1)[0][0]
+        else:
+            return
+        limite = precio_dominante - MIN_PROFIT_THRESHOLD
+        keep, drop = [], []
+        for p in state.items:
+            (keep if p.precio <= limite else drop).append(p)
+        if drop:
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile()
+            state.spilled.append(self.spill.seek(0, os.SEEK_END))
+            pickle.dump(drop, self.spill, pickle.HIGHEST_PROTOCOL)
+        state.items = keep
+        state.released = True
+
+    def _reopen(self, state):
+        """
+        Un modelo ya soltado recibe más filas (de una tienda que no se esperaba): con
+        ellas la moda puede subir y los artículos soltados volverse ofertas, así que se
+        recuperan todos y flush evalúa el modelo completo.
+        """
+        items = []
+        for offset in state.spilled:
+            self.spill.seek(offset)
+            items.extend(pickle.load(self.spill))
+        state.items = items + state.items
+        state.spilled = []
+        state.released = False
+
+    def _new_deals(self, key, precio_dominante, ofertas):
+        state = self.models[key]
+        if self.snapshot is not None:
+            precio_anterior = self.snapshot.get_dominant_price(key)
+            if precio_dominante is not None and precio_dominante != precio_anterior:
+                self.snapshot.set_dominant_price(key, precio_dominante)
+            else:
+                # Mismo precio dominante: sólo interesan los SKUs que cambiaron
+                ofertas = [p for p in ofertas if p.deal_id in state.changed_ids]
+
+        nuevas = []
+        for p in ofertas:
+            deal_id = p.deal_id
+            if deal_id not in state.emitted:
+                state.emitted.add(deal_id)
+                nuevas.append(p)
+        return nuevas
+
+    def store_done(self, id_sucursal):
+        """
+        Marca una tienda como reportada y regresa las ofertas de los modelos que
+        quedaron completos con ella.
+        """
+        self.reported_stores.add(str(id_sucursal))
+        deals = []
+        for key, state in self.models.items():
+            if state.evaluated:
+                continue
+            expected = self.expected_stores.get(key)
+            if expected and expected <= self.reported_stores:
+                deals.extend(self._evaluate(key))
+        return deals
+
+    def flush(self):
+        """
+        Fin del barrido: evalúa todos los modelos en una sola pasada vectorizada (los ya
+        emitidos sólo aportan ofertas nuevas) y libera los productos retenidos.
+        """
+        groups = {}
+        released = []
+        for key, state in self.models.items():
+            state.evaluated = True
+            state.pending_ids.clear()
+            if not self._needs_evaluation(state):
+                continue
+            if state.released:
+                released.append(key)
+            else:
+                groups[key] = state.items
+        baseline = {
+            key: self.baseline[self.models[key].modelo_id]
+            for key in groups if self.models[key].modelo_id in self.baseline
+        }
+        dominantes, ofertas = detect_grouped_deals(groups, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, baseline)
+
+        ofertas_por_modelo = {}
+        for p in ofertas:
+            ofertas_por_modelo.setdefault(p.model_key, []).append(p)
+
+        deals = []
+        for key, precio_dominante in dominantes.items():
+            deals.extend(self._new_deals(key, precio_dominante, ofertas_por_modelo.get(key, [])))
+        # Evaluados antes: la moda sale del conteo, los artículos son sólo candidatos
+        for key in released:
+            state = self.models[key]
+            precio_dominante, ofertas = select_model_deals(
+                state.items, state.conteo, self.baseline.get(state.modelo_id)
+            )
+            deals.extend(self._new_deals(key, precio_dominante, ofertas))
+        for state in self.models.values():
+            state.items = []
+            state.spilled = []
+        self._close_spill()
+        deals.sort(key=lambda p: p.margen, reverse=True)
+        return deals
+
+    def abandon(self):
+        """
+        Ciclo cancelado: el snapshot ya registró los SKUs nuevos o con cambio de las
+        tiendas reportadas, pero sus modelos no se evaluaron. Se olvidan esos SKUs para
+        que el siguiente ciclo los vuelva a ver como nuevos y no se pierdan sus ofertas.
+        """
+        self._close_spill()
+        if self.snapshot is None:
+            return
+        pending = [deal_id for state in self.models.values() for deal_id in state.pending_ids]
+        if pending:
+            self.snapshot.forget(pending)
+            print(f"Ciclo cancelado: {len(pending)} SKUs con cambios sin evaluar quedan para el siguiente ciclo.")
+
+    def _close_spill(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def model_stores(self):
+        return {key: set(state.stores) for key, state in self.models.items()}
+
+
+def stream_deals(store_results, aggregator, cancel=None):
+    """
+    Generador: consume (id_sucursal, nombre_sucursal, productos) y regresa tandas de
+    ofertas conforme se completan los modelos; la última tanda sale al final del barrido.
+    Si `cancel` está activo al terminar, no se evalúan los modelos incompletos y sus
+    cambios quedan pendientes en el snapshot (ver ModelAggregator.abandon).
+    """
+    for id_sucursal, nombre_sucursal, products in store_results:
+        with span("grouping", stage="sucursal", store=id_sucursal) as s:
+            aggregator.add_store(id_sucursal, products)
+            deals = aggregator.store_done(id_sucursal)
+            s["rows"] = len(products)
+        if deals:
+            print(f"{len(deals)} ofertas listas tras completar {nombre_sucursal}.")
+            yield deals
+
+    if cancel is not None and cancel.is_set():
+        aggregator.abandon()
+        return
+    with span("grouping", stage="final"):
+        deals = aggregator.flush()
+    if deals:
+        yield deals
+
+
+class DealSender:
+    """
+    Hilo consumidor que envía tandas de ofertas mientras el scraping sigue corriendo.
+    Con `collect` las junta y hace un solo envío al cerrar (el resumen del ciclo con
+    SLACK_DIGEST_TOP_N).
+    """
+
+    def __init__(self, send=send_deals, collect=False):
+        self.send = send
+        self.collect = collect
+        self.collected = []
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            deals = self.queue.get()
+            try:
+                if deals is None:
+                    if self.collected:
+                        self.send(self.collected)
+                    return
+                if self.collect:
+                    self.collected.extend(deals)
+                else:
+                    self.send(deals)
+            except Exception as e:
+                print(f"Error al enviar tanda de ofertas: {e}")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, deals):
+        self.queue.put(deals)
+
+    def close(self):
+        """Espera a que se envíe todo lo encolado y detiene el hilo."""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def run_pipeline(store_results, expected_stores=None, send=send_deals, snapshot=None, cancel=None, history=None,
+                 digest=None):
+    """
+    Ejecuta un ciclo completo en streaming. Regresa el aggregator para que el
+    llamador pueda guardar `model_stores()` como expectativa del siguiente ciclo.
+    Con `digest` (por omisión, si SLACK_DIGEST_TOP_N > 0) las ofertas del ciclo se
+    mandan en un solo envío al final en lugar de una tanda por tienda.
+    """
+    if digest is None:
+        digest = SLACK_DIGEST_TOP_N > 0
+    if snapshot is not None:
+        snapshot.begin_cycle()
+    # La referencia se toma antes de anexar este ciclo al historial
+    baseline = history.baseline() if history is not None else None
+    aggregator = ModelAggregator(expected_stores, snapshot, history, baseline)
+    sender = DealSender(send, collect=digest)
+    try:
+        for deals in stream_deals(store_results, aggregator, cancel):
+            sender.submit(deals)
+    finally:
+        sender.close()
+    return aggregator
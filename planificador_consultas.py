@@ -0,0 +1,194 @@
+"""
+Planificador de consultas al catálogo: decide, por sucursal, cómo pedir las familias
+con el menor número de peticiones.
+
+consulta_catalogo.php acepta `familia` vacía y entonces regresa todas las familias de
+la sucursal juntas (con la columna "Familia"). Con los tamaños aprendidos en corridas
+anteriores se compara:
+
+- por familia: una página 1 por familia más sus páginas siguientes;
+- todas: ceil(total / PAGE_SIZE) páginas, filtrando localmente por las familias
+  configuradas.
+
+Si todavía no se conoce el total de la sucursal (o ya es viejo) se sondea: se pide la
+página 1 sin familia y, con su rowCount, se decide si seguir así o pasar a por familia.
+
+Las parejas (sucursal, familia) que salieron vacías en las últimas N corridas no se
+piden en modo por familia; se vuelven a sondear cada REPROBE_EVERY corridas. En modo
+todas se observan todas las familias gratis y sus contadores se actualizan igual.
+
+Las estadísticas viven en SQLite (plan_consultas.db) entre corridas.
+"""
+import os
+import sqlite3
+import threading
+
+from scraper_completo import PAGE_SIZE
+
+PLAN_DB_FILE = "plan_consultas.db"
+ALL_FAMILIES = ""          # valor de `familia` que regresa todas las familias
+FAMILY_COLUMN = "Familia"
+EMPTY_RUNS_TO_SKIP = int(os.getenv("PLAN_CORRIDAS_VACIAS", "3"))
+REPROBE_EVERY = int(os.getenv("PLAN_RESONDEO_CADA", "6"))
+ENABLED = os.getenv("SCRAPER_PLANIFICADOR", "1") != "0"
+
+POR_FAMILIA = "por_familia"
+TODAS = "todas"
+SONDEO = "sondeo"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corridas (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    numero INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS familias (
+    id_sucursal TEXT NOT NULL,
+    familia TEXT NOT NULL,
+    filas INTEGER NOT NULL,
+    vacias_seguidas INTEGER NOT NULL,
+    ultima_corrida INTEGER NOT NULL,
+    PRIMARY KEY (id_sucursal, familia)
+);
+CREATE TABLE IF NOT EXISTS sucursales (
+    id_sucursal TEXT PRIMARY KEY,
+    total_todas INTEGER,
+    corrida_total INTEGER,
+    soporta_todas INTEGER NOT NULL DEFAULT 1
+);
+"""
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def normalize_family(familia):
+    return " ".join(familia.split()).upper()
+
+
+def pages_for(rows):
+    return max(1, (rows + PAGE_SIZE - 1) // PAGE_SIZE)
+
+
+class StorePlan:
+    __slots__ = ("id_sucursal", "modo", "activas", "omitidas", "costo_por_familia")
+
+    def __init__(self, id_sucursal, modo, activas, omitidas=(), costo_por_familia=0):
+        self.id_sucursal = id_sucursal
+        self.modo = modo
+        # Familias que se piden en modo por familia y las que se saltan por vacías
+        self.activas = list(activas)
+        self.omitidas = list(omitidas)
+        # Peticiones estimadas si se pidiera familia por familia
+        self.costo_por_familia = costo_por_familia
+
+    @property
+    def familias(self):
+        """Todas las familias configuradas; en modo todas también salen las omitidas."""
+        return self.activas + self.omitidas
+
+
+class FetchPlanner:
+    def __init__(self, path=PLAN_DB_FILE, empty_runs_to_skip=EMPTY_RUNS_TO_SKIP, reprobe_every=REPROBE_EVERY):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.empty_runs_to_skip = empty_runs_to_skip
+        self.reprobe_every = reprobe_every
+        row = self.conn.execute("SELECT numero FROM corridas WHERE id = 1").fetchone()
+        self.run = row[0] if row else 0
+
+    def begin_run(self):
+        with self.lock, self.conn:
+            self.run += 1
+            self.conn.execute(
+                "INSERT INTO corridas (id, numero) VALUES (1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET numero = excluded.numero",
+                (self.run,)
+            )
+        return self.run
+
+    def _due(self, last_run):
+        return self.run - last_run >= self.reprobe_every
+
+    def plan(self, id_sucursal, familias):
+        id_sucursal = str(id_sucursal)
+        with self.lock:
+            stats = {
+                familia: (filas, vacias, ultima)
+                for familia, filas, vacias, ultima in self.conn.execute(
+                    "SELECT familia, filas, vacias_seguidas, ultima_corrida FROM familias WHERE id_sucursal = ?",
+                    (id_sucursal,)
+                )
+            }
+            store = self.conn.execute(
+                "SELECT total_todas, corrida_total, soporta_todas FROM sucursales WHERE id_sucursal = ?",
+                (id_sucursal,)
+            ).fetchone()
+
+        activas, omitidas = [], []
+        costo = 0
+        for familia in familias:
+            filas, vacias, ultima = stats.get(normalize_family(familia), (None, 0, 0))
+            if vacias >= self.empty_runs_to_skip and not self._due(ultima):
+                omitidas.append(familia)
+                continue
+            activas.append(familia)
+            costo += pages_for(filas or 0)
+
+        total, corrida_total, soporta_todas = store if store else (None, 0, 1)
+        if len(activas) <= 1 or not soporta_todas:
+            modo = POR_FAMILIA
+        elif total is None or self._due(corrida_total):
+            modo = SONDEO
+        elif pages_for(total) < costo:
+            modo = TODAS
+        else:
+            modo = POR_FAMILIA
+
+        return StorePlan(id_sucursal, modo, activas, omitidas, costo)
+
+    def keep_all_families(self, plan, row_count, headers):
+        """
+        Tras la página 1 sin familia: registra el total y dice si conviene seguir en modo
+        todas (siempre False si la tabla no trae la columna Familia, porque entonces no
+        se puede filtrar localmente).
+        """
+        soporta = FAMILY_COLUMN in headers
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO sucursales (id_sucursal, total_todas, corrida_total, soporta_todas) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(id_sucursal) DO UPDATE SET "
+                "total_todas = excluded.total_todas, corrida_total = excluded.corrida_total, "
+                "soporta_todas = excluded.soporta_todas",
+                (plan.id_sucursal, int(row_count), self.run, int(soporta))
+            )
+        if not soporta:
+            print(f"La sucursal {plan.id_sucursal} no regresa la columna {FAMILY_COLUMN}; se pide por familia.")
+            return False
+        # La página 1 ya se pidió: sólo cuentan las que faltan
+        return pages_for(int(row_count)) - 1 < plan.costo_por_familia
+
+    def record(self, id_sucursal, family_rows):
+        """
+        family_rows: {familia: filas (rowCount)} observadas en esta corrida. Las familias
+        con error de red no se incluyen para no contarlas como vacías.
+        """
+        id_sucursal = str(id_sucursal)
+        with self.lock, self.conn:
+            for familia, filas in family_rows.items():
+                self.conn.execute(
+                    "INSERT INTO familias (id_sucursal, familia, filas, vacias_seguidas, ultima_corrida) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(id_sucursal, familia) DO UPDATE SET "
+                    "filas = excluded.filas, ultima_corrida = excluded.ultima_corrida, "
+                    "vacias_seguidas = CASE WHEN excluded.filas = 0 THEN familias.vacias_seguidas + 1 ELSE 0 END",
+                    (id_sucursal, normalize_family(familia), int(filas), 0 if filas else 1, self.run)
+                )
+
+
+def get_planner():
+    global _planner
+    with _planner_lock:
+        if _planner is None:
+            _planner = FetchPlanner()
+        return _planner
@@ -3,122 +3,139 @@ import time
 import re
 import os
 import json
-from collections import Counter
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from servicio_pse import clean_price_str
-from notificador_slack import send_slack_notification, format_slack_message
-from openai import OpenAI
-from scraper_completo import obtener_imagenes_efectimundo
-
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Lo pesado se importa donde se usa: la detección (NumPy) en process_and_send_all_deals
+# y Slack, el outbox, la caché de imágenes y OpenAI en send_deals. Así detectar sobre un
+# snapshot no carga el envío y enviar ofertas ya detectadas no carga NumPy.
+from producto import as_producto
+from metricas import span
 
 START_SEND_HOUR = 7
 END_SEND_HOUR = 20
 MIN_DOMINANT_FREQ = 3
 MIN_PROFIT_THRESHOLD = 100.0
-IMAGENES_CACHE_FILE = "imagenes_cache.json"
+# > 0: en lugar de un mensaje por oferta se manda un resumen con las N mejores
+SLACK_DIGEST_TOP_N = int(os.getenv("SLACK_DIGEST_TOP_N", "0"))
 
 def analyze_offer_with_openai(product_data, comparison_data):
-    prompt = f"""
-Analiza la siguiente oferta de un producto en distintas sucursales y determina si vale la pena comprarlo para reventa.
-Precio de sucursal: {product_data['Precio Promoción']}
-Precio dominante (más repetido): {comparison_data['precio_dominante']}
-Margen calculado: {comparison_data['margen']}
-¿Es una buena oportunidad? Responde con 'Sí' o 'No' y justifica brevemente (máx 20 palabras).
-"""
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-            temperature=0.5
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error OpenAI: {e}")
-        return "Análisis no disponible."
-
-def process_and_send_all_deals(all_scraped_products):
-    print(f"--- Procesando y enviando ofertas de todas las tiendas ---")
-    print(f"Total productos recibidos: {len(all_scraped_products)}")
-
-    # Agrupar por modelo
-    deals_by_model = {}
-    for product in all_scraped_products:
-        key = (product.get("Marca", "").strip(), product.get("Modelo", "").strip())
-        deals_by_model.setdefault(key, []).append(product)
-
-    final_deals_to_send = []
+    """
+    Análisis de una sola oferta; pasa por la caché de analisis_ofertas.
+    """
+    from analisis_ofertas import get_analyzer
+
+    return get_analyzer().analyze_one(
+        product_data.precio, comparison_data['precio_dominante'], product_data.margen or 0
+    )
+
+def select_model_deals(items, conteo, baseline=None):
+    """
+    Aplica las reglas de oferta a un modelo.
+    items: Productos del modelo; conteo: Counter de sus precios; baseline: (precio,
+    frecuencia) de referencia opcional que sustituye a la moda del conteo.
+    Regresa (precio_dominante, ofertas); las ofertas llevan margen y precio_dominante.
+    """
+    if baseline is not None:
+        precio_dominante, frecuencia = baseline
+    elif sum(conteo.values()) < 2:
+        return None, []
+    else:
+        precio_dominante, frecuencia = conteo.most_common(1)[0]
+    if frecuencia < MIN_DOMINANT_FREQ:
+        return precio_dominante, []
 
-    for model_key, items in deals_by_model.items():
-        if len(items) < 2:
-            continue
+    mejores_ofertas = []
+    for p in items:
+        if p.precio < precio_dominante:
+            margen = precio_dominante - p.precio
+            if margen >= MIN_PROFIT_THRESHOLD:
+                p.margen = margen
+                p.precio_dominante = precio_dominante
+                mejores_ofertas.append(p)
 
-        precios_promocion = [clean_price_str(p.get("Precio Promoción", "0")) for p in items]
-        conteo = Counter(precios_promocion)
-        precio_dominante, frecuencia = conteo.most_common(1)[0]
+    return precio_dominante, mejores_ofertas
 
-        if frecuencia < MIN_DOMINANT_FREQ:
-            continue
+def process_and_send_all_deals(all_scraped_products):
+    from deteccion_ofertas import detect_grouped_deals
+    from historial_precios import history_baseline
 
-        mejores_ofertas = []
-        for p in items:
-            precio = clean_price_str(p.get("Precio Promoción", "0"))
-            if precio < precio_dominante:
-                margen = precio_dominante - precio
-                if margen >= MIN_PROFIT_THRESHOLD:
-                    p["MargenCalculado"] = margen
-                    mejores_ofertas.append(p)
+    print(f"--- Procesando y enviando ofertas de todas las tiendas ---")
+    print(f"Total productos recibidos: {len(all_scraped_products)}")
 
-        final_deals_to_send.extend(mejores_ofertas)
+    with span("grouping", stage="completo") as s:
+        # Agrupar por modelo canónico
+        deals_by_model = {}
+        for product in all_scraped_products:
+            product = as_producto(product)
+            deals_by_model.setdefault(product.modelo_id, []).append(product)
 
+        # Moda, margen y filtros de todos los modelos en una sola pasada vectorizada
+        _, final_deals_to_send = detect_grouped_deals(
+            deals_by_model, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, baseline=history_baseline()
+        )
+        s["rows"] = len(all_scraped_products)
+
+    send_deals(final_deals_to_send)
+
+def next_send_time(now):
+    """None dentro del horario de envío; después de END_SEND_HOUR, cuándo abre el siguiente."""
+    if now.hour < END_SEND_HOUR:
+        return None
+    return (now + datetime.timedelta(days=1)).replace(hour=START_SEND_HOUR, minute=0, second=0, microsecond=0)
+
+def send_deals(final_deals_to_send):
+    """
+    Encola en el outbox de Slack una tanda de ofertas ya detectadas (con
+    precio_dominante calculado), ordenadas por margen. No bloquea: el hilo de
+    cola_slack las entrega respetando el límite de tasa.
+    """
     print(f"Ofertas válidas encontradas: {len(final_deals_to_send)}")
 
     if not final_deals_to_send:
         print("No hay ofertas que cumplan las condiciones.")
         return
 
-    final_deals_to_send.sort(key=lambda x: x["MargenCalculado"], reverse=True)
-
-    now = datetime.datetime.now()
-    end_of_day = now.replace(hour=END_SEND_HOUR, minute=0, second=0, microsecond=0)
-    if now.hour >= END_SEND_HOUR:
-        print("Fuera del horario permitido.")
+    final_deals_to_send.sort(key=lambda x: x.margen, reverse=True)
+
+    # Fuera de horario no se descartan: el snapshot ya las dio por vistas, así que
+    # esperan en el outbox a que abra el horario del día siguiente
+    not_before = next_send_time(datetime.datetime.now())
+    if not_before is not None:
+        print(f"Fuera del horario permitido; se envían a partir de {not_before:%Y-%m-%d %H:%M}.")
+        not_before = not_before.timestamp()
+
+    from notificador_slack import format_slack_message, format_slack_digest, MAX_DIGEST_ITEMS
+    from cola_slack import get_delivery
+    from cache_imagenes import get_image_cache
+    from analisis_ofertas import get_analyzer
+
+    # Resolver en paralelo las imágenes de todas las ofertas antes de empezar a enviar
+    imagenes_cache = get_image_cache()
+    with span("image_prefetch") as s:
+        imagenes_por_sku = imagenes_cache.prefetch([p.sku for p in final_deals_to_send if p.sku])
+        s["rows"] = len(imagenes_por_sku)
+    # Y el análisis IA de todas (memoizado y concurrente), para no calcularlo entre esperas
+    with span("analysis") as s:
+        analisis_por_oferta = get_analyzer().analyze_all(final_deals_to_send)
+        s["rows"] = len(final_deals_to_send)
+    for producto in final_deals_to_send:
+        producto.imagenes = imagenes_por_sku.get(producto.sku, [])
+
+    delivery = get_delivery()
+    if SLACK_DIGEST_TOP_N > 0:
+        delivery.enqueue(format_slack_digest(final_deals_to_send, analisis_por_oferta, SLACK_DIGEST_TOP_N),
+                         not_before)
+        print(f"Resumen con {min(SLACK_DIGEST_TOP_N, MAX_DIGEST_ITEMS, len(final_deals_to_send))} ofertas encolado.")
         return
 
-    tiempo_restante = (end_of_day - now).total_seconds()
-    intervalo_envio = 180  # 3 minutos fijos entre envíos
-
-    # Cargar caché si existe
-    if os.path.exists(IMAGENES_CACHE_FILE):
-        with open(IMAGENES_CACHE_FILE, "r") as f:
-            imagenes_cache = json.load(f)
-    else:
-        imagenes_cache = {}
-
     for i, producto in enumerate(final_deals_to_send):
-        print(f"Enviando {i+1}/{len(final_deals_to_send)}: {producto.get('Marca')} {producto.get('Modelo')}")
-
-        model_key = (producto.get("Marca", ""), producto.get("Modelo", ""))
-        precios_para_modelo = [
-            clean_price_str(p.get("Precio Promoción", "0")) for p in deals_by_model.get(model_key, [])
-        ]
-        conteo = Counter(precios_para_modelo)
-        precio_dominante, _ = conteo.most_common(1)[0]
-
-        product_id = producto.get("Prenda / Sku Lote", "N/A")
-        margen = producto.get("MargenCalculado", 0)
-
-        # Buscar imágenes si no están en caché
-        if product_id in imagenes_cache:
-            producto["Imagenes"] = imagenes_cache[product_id]
-        else:
-            imagenes = obtener_imagenes_efectimundo(product_id)
-            imagenes_cache[product_id] = imagenes
-            producto["Imagenes"] = imagenes
+        print(f"Encolando {i+1}/{len(final_deals_to_send)}: {producto.marca} {producto.modelo}")
+
+        precio_dominante = producto.precio_dominante
+        product_id = producto.sku or "N/A"
+        margen = producto.margen or 0
 
         comparison_data = {
             "precio_dominante": precio_dominante,
@@ -126,17 +143,9 @@ def process_and_send_all_deals(all_scraped_products):
             "product_id": product_id
         }
 
-        ai_analysis = analyze_offer_with_openai(producto, comparison_data)
-        comparison_data["openai_analysis"] = ai_analysis
+        comparison_data["openai_analysis"] = analisis_por_oferta[producto.deal_id]
 
         payload = format_slack_message(producto, comparison_data)
-        send_slack_notification(payload)
-
-        if i < len(final_deals_to_send) - 1:
-            time.sleep(intervalo_envio)
-
-    # Guardar caché actualizado al final
-    with open(IMAGENES_CACHE_FILE, "w") as f:
-        json.dump(imagenes_cache, f, indent=2)
+        delivery.enqueue(payload, not_before)
 
-    print("Proceso completado.")
+    print(f"Proceso completado. Mensajes pendientes en el outbox: {delivery.pending_count()}")
@@ -0,0 +1,99 @@
+"""
+Registro compacto de producto que viaja por todo el pipeline.
+
+Sustituye a los dicts con llaves de encabezado: el precio se normaliza a float una sola
+vez al ingresar, las cadenas repetidas (marca, modelo, tienda) se internan y cada
+sucursal recibe un id entero pequeño. El modelo se resuelve una vez contra el índice de
+modelos canónicos (modelos_canonicos.py): `model_key` es la (marca, modelo) canónica y
+`modelo_id` su id, de modo que las variantes de captura caen en el mismo grupo.
+"""
+import sys
+import threading
+
+from servicio_pse import clean_price_str
+from modelos_canonicos import resolve_model
+
+# Encabezado del catálogo -> atributo del registro
+HEADER_FIELDS = {
+    "Prenda / Sku Lote": "sku",
+    "Marca": "marca",
+    "Modelo": "modelo",
+    "Descripción": "descripcion",
+    "Precio Promoción": "precio",
+    "Tienda": "tienda",
+    "ID_Sucursal": "id_sucursal",
+    "Imagenes": "imagenes",
+    "MargenCalculado": "margen",
+    "PrecioDominante": "precio_dominante",
+}
+
+_store_ids = {}
+_store_ids_lock = threading.Lock()
+
+
+def store_index(id_sucursal):
+    """Id entero pequeño y estable (durante el proceso) para una sucursal."""
+    id_sucursal = str(id_sucursal)
+    store_id = _store_ids.get(id_sucursal)
+    if store_id is None:
+        with _store_ids_lock:
+            store_id = _store_ids.setdefault(id_sucursal, len(_store_ids))
+    return store_id
+
+
+class Producto:
+    __slots__ = (
+        "sku", "marca", "modelo", "descripcion", "precio",
+        "tienda", "id_sucursal", "store_id", "imagenes",
+        "margen", "precio_dominante", "modelo_id", "model_key",
+    )
+
+    def __init__(self, sku, marca, modelo, descripcion, precio, tienda, id_sucursal, imagenes=None):
+        self.sku = sku
+        self.marca = sys.intern(marca.strip())
+        self.modelo = sys.intern(modelo.strip())
+        self.descripcion = descripcion
+        self.precio = precio
+        self.tienda = sys.intern(tienda)
+        self.id_sucursal = sys.intern(str(id_sucursal))
+        self.store_id = store_index(self.id_sucursal)
+        self.imagenes = imagenes if imagenes is not None else []
+        self.margen = None
+        self.precio_dominante = None
+        self.modelo_id, self.model_key = resolve_model(self.marca, self.modelo)
+
+    @property
+    def deal_id(self):
+        return (self.sku, self.id_sucursal)
+
+    @classmethod
+    def from_dict(cls, product):
+        """Construye el registro desde un dict con los encabezados del catálogo."""
+        precio = product.get("Precio Promoción", "0")
+        if isinstance(precio, str):
+            precio = clean_price_str(precio)
+        producto = cls(
+            product.get("Prenda / Sku Lote", ""),
+            product.get("Marca", ""),
+            product.get("Modelo", ""),
+            product.get("Descripción", ""),
+            float(precio),
+            product.get("Tienda", ""),
+            product.get("ID_Sucursal", ""),
+            product.get("Imagenes") or [],
+        )
+        # Ofertas ya detectadas (ver to_dict) conservan su margen y precio de referencia
+        producto.margen = product.get("MargenCalculado")
+        producto.precio_dominante = product.get("PrecioDominante")
+        return producto
+
+    def to_dict(self):
+        """Dict con los encabezados originales, para JSON y código externo."""
+        return {header: getattr(self, field) for header, field in HEADER_FIELDS.items()}
+
+    def __repr__(self):
+        return f"Producto({self.sku!r}, {self.marca!r}, {self.modelo!r}, {self.precio!r}, {self.tienda!r})"
+
+
+def as_producto(product):
+    return product if isinstance(product, Producto) else Producto.from_dict(product)
@@ -0,0 +1,367 @@
+"""
+Programador de sondeo continuo por (sucursal, familia), en lugar del barrido completo
+cada hora.
+
+Cada pareja lleva una prioridad aprendida:
+
+- cambio: promedio móvil (EMA) de los sondeos en que su contenido cambió (SKUs o
+  precios distintos al sondeo anterior);
+- ofertas: EMA de las ofertas nuevas que salieron de ella por sondeo;
+- costo: páginas que cuesta pedirla (por sus filas del último sondeo).
+
+El presupuesto global (SONDEO_PETICIONES_HORA) se reparte en tasas de sondeo
+proporcionales a la prioridad, con intervalos acotados a [SONDEO_MIN_MINUTOS,
+SONDEO_MAX_MINUTOS]: las parejas calientes se piden seguido y las frías rara vez. Cada
+tick (SONDEO_TICK_SEGUNDOS) se piden las parejas vencidas que caben en la cubeta de
+peticiones del tick, así la carga queda pareja a lo largo del horario de operación.
+
+El primer tick es un barrido completo que llena el catálogo en memoria; después cada
+sondeo reemplaza sólo sus parejas y se evalúan los modelos que tocaron las parejas
+que cambiaron, contra el catálogo completo. Una oferta se envía una vez mientras siga
+con el mismo precio. Este modo no usa snapshot_skus: el diff es por pareja. Una pareja
+con páginas fallidas conserva su catálogo y sus estadísticas anteriores y se reintenta
+tras SONDEO_MIN_MINUTOS. Con BASELINE_OFERTAS del historial, los precios de referencia
+se recalculan al cambiar el día. Tampoco escribe snapshots de corrida (ver
+snapshots_corrida): el catálogo cambia por parejas y no hay un ciclo completo que guardar.
+El índice de consultas de api_server (indice_consultas) se reconstruye del catálogo
+completo tras el barrido inicial y cada tick con cambios.
+
+Las estadísticas viven en SQLite (programa_sondeo.db) entre reinicios.
+"""
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from planificador_consultas import pages_for
+
+SCHEDULE_DB_FILE = "programa_sondeo.db"
+REQUESTS_PER_HOUR = float(os.getenv("SONDEO_PETICIONES_HORA", "6000"))
+TICK_SECONDS = float(os.getenv("SONDEO_TICK_SEGUNDOS", "60"))
+MIN_INTERVAL = float(os.getenv("SONDEO_MIN_MINUTOS", "10")) * 60
+MAX_INTERVAL = float(os.getenv("SONDEO_MAX_MINUTOS", "360")) * 60
+# Peso de una oferta nueva frente a un cambio y prioridad mínima de cualquier pareja
+DEAL_WEIGHT = 2.0
+PRIORITY_FLOOR = 0.05
+EMA_ALPHA = 0.3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parejas (
+    id_sucursal TEXT NOT NULL,
+    familia TEXT NOT NULL,
+    cambio REAL NOT NULL,
+    ofertas REAL NOT NULL,
+    filas INTEGER NOT NULL,
+    firma TEXT,
+    sondeos INTEGER NOT NULL,
+    ultima REAL NOT NULL,
+    PRIMARY KEY (id_sucursal, familia)
+);
+"""
+
+
+def content_signature(products):
+    digest = hashlib.blake2b(digest_size=16)
+    for sku, precio in sorted((p.sku, p.precio) for p in products):
+        digest.update(f"{sku}\0{precio!r}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PairStats:
+    __slots__ = ("cambio", "ofertas", "filas", "firma", "sondeos", "ultima", "intervalo")
+
+    def __init__(self, cambio=1.0, ofertas=0.0, filas=0, firma=None, sondeos=0, ultima=0.0):
+        # Sin historia se asume caliente para que se pida pronto
+        self.cambio = cambio
+        self.ofertas = ofertas
+        self.filas = filas
+        self.firma = firma
+        self.sondeos = sondeos
+        self.ultima = ultima
+        self.intervalo = MIN_INTERVAL
+
+    @property
+    def priority(self):
+        return PRIORITY_FLOOR + self.cambio + DEAL_WEIGHT * self.ofertas
+
+    @property
+    def cost(self):
+        return pages_for(self.filas)
+
+    @property
+    def due(self):
+        return self.ultima + self.intervalo
+
+
+class PollScheduler:
+    def __init__(self, pairs, path=SCHEDULE_DB_FILE, requests_per_hour=REQUESTS_PER_HOUR,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        """pairs: iterable de (id_sucursal, familia) a sondear."""
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        stored = {
+            (id_sucursal, familia): PairStats(*values)
+            for id_sucursal, familia, *values in self.conn.execute(
+                "SELECT id_sucursal, familia, cambio, ofertas, filas, firma, sondeos, ultima FROM parejas"
+            )
+        }
+        self.stats = {(str(s), f): stored.get((str(s), f)) or PairStats() for s, f in pairs}
+        self.tokens = 0.0
+        self.refilled = time.time()
+        self.rebalance()
+
+    def rebalance(self):
+        """
+        Reparte el presupuesto: tasa_i = λ·prioridad_i con Σ costo_i·tasa_i = presupuesto.
+        Las parejas que topan en el intervalo mínimo o máximo se fijan y λ se recalcula
+        con el resto.
+        """
+        budget = self.requests_per_hour / 3600.0
+        free = dict(self.stats)
+        fixed_cost = 0.0
+        for _ in range(len(free) + 1):
+            weight = sum(s.priority * s.cost for s in free.values())
+            if not free or weight <= 0:
+                break
+            scale = max(budget - fixed_cost, 0.0) / weight
+            clamped = {}
+            for key, s in free.items():
+                rate = scale * s.priority
+                interval = 1.0 / rate if rate > 0 else self.max_interval
+                if interval <= self.min_interval or interval >= self.max_interval:
+                    clamped[key] = min(max(interval, self.min_interval), self.max_interval)
+                else:
+                    s.intervalo = interval
+            if not clamped:
+                break
+            for key, interval in clamped.items():
+                s = free.pop(key)
+                s.intervalo = interval
+                fixed_cost += s.cost / interval
+
+    def planned_requests_per_hour(self):
+        return sum(s.cost * 3600.0 / s.intervalo for s in self.stats.values())
+
+    def take_due(self, now=None):
+        """Parejas vencidas, las más atrasadas primero, hasta agotar la cubeta del tick."""
+        now = now or time.time()
+        self.tokens = min(
+            self.tokens + (now - self.refilled) * self.requests_per_hour / 3600.0,
+            max(self.requests_per_hour * TICK_SECONDS / 3600.0, 1.0)
+        )
+        self.refilled = now
+        due = sorted((s.due, key) for key, s in self.stats.items() if s.due <= now)
+        taken = []
+        for _, key in due:
+            cost = self.stats[key].cost
+            if cost > self.tokens and taken:
+                break
+            self.tokens -= cost
+            taken.append(key)
+            if self.tokens <= 0:
+                break
+        return taken
+
+    def record(self, key, products, now=None):
+        """
+        Actualiza la pareja tras sondearla; regresa True si su contenido cambió. Las
+        ofertas que salgan de ella se suman después con `add_deals`.
+        """
+        now = now or time.time()
+        s = self.stats[key]
+        firma = content_signature(products)
+        changed = firma != s.firma
+        if s.sondeos:
+            s.cambio += EMA_ALPHA * (float(changed) - s.cambio)
+            s.ofertas -= EMA_ALPHA * s.ofertas
+        s.firma = firma
+        s.filas = len(products)
+        s.sondeos += 1
+        s.ultima = now
+        return changed
+
+    def record_error(self, key, now=None):
+        """Sondeo con páginas fallidas: no cuenta como sondeo y se reintenta tras el intervalo mínimo."""
+        now = now or time.time()
+        s = self.stats[key]
+        s.ultima = max(s.ultima, now + self.min_interval - s.intervalo)
+
+    def add_deals(self, key, new_deals):
+        """Ofertas que se atribuyen a una pareja después de registrar su sondeo."""
+        s = self.stats[key]
+        if s.sondeos > 1:
+            s.ofertas += EMA_ALPHA * new_deals
+
+    def save(self):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO parejas (id_sucursal, familia, cambio, ofertas, filas, firma, sondeos, ultima) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(key[0], key[1], s.cambio, s.ofertas, s.filas, s.firma, s.sondeos, s.ultima)
+                 for key, s in self.stats.items()]
+            )
+
+
+class ContinuousCatalog:
+    """
+    Catálogo en memoria por pareja y detección incremental sobre los modelos tocados.
+    """
+
+    def __init__(self, send, history=None, baseline=None):
+        self.send = send
+        self.history = history
+        self.baseline = baseline
+        self.pairs = {}        # (id_sucursal, familia) -> [Producto]
+        self.sent = {}         # deal_id -> precio con el que se envió
+
+    def update(self, key, products):
+        """Reemplaza la pareja; regresa los modelos que tenía antes o tiene ahora."""
+        previous = self.pairs.get(key, [])
+        self.pairs[key] = products
+        if self.history is not None and products:
+            self.history.append(key[0], products)
+        return {p.modelo_id for p in previous} | {p.modelo_id for p in products}
+
+    def evaluate(self, model_ids):
+        """Evalúa los modelos contra el catálogo completo; envía y regresa las ofertas nuevas."""
+        from deteccion_ofertas import detect_grouped_deals
+        from procesador_ofertas import MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD
+
+        if not model_ids:
+            return []
+        groups = {}
+        for products in self.pairs.values():
+            for p in products:
+                if p.modelo_id in model_ids:
+                    groups.setdefault(p.modelo_id, []).append(p)
+        baseline = None
+        if self.baseline:
+            baseline = {key: self.baseline[key] for key in groups if key in self.baseline}
+        _, deals = detect_grouped_deals(groups, MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, baseline)
+
+        current = {p.deal_id for p in deals}
+        for products in groups.values():
+            for p in products:
+                if p.deal_id not in current:
+                    self.sent.pop(p.deal_id, None)
+        new = [p for p in deals if self.sent.get(p.deal_id) != p.precio]
+        for p in new:
+            self.sent[p.deal_id] = p.precio
+        if new:
+            self.send(new)
+        return new
+
+    def build_index(self, store_names):
+        """Índice de consultas del catálogo completo, con la misma referencia que `evaluate`."""
+        from indice_consultas import IndexBuilder
+        from procesador_ofertas import MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD
+
+        builder = IndexBuilder()
+        for _ in builder.tee((key[0], store_names[key[0]], products) for key, products in self.pairs.items()):
+            pass
+        return builder.build(MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD, self.baseline)
+
+
+def in_window(now, start_hour, end_hour):
+    return start_hour <= now.hour < end_hour
+
+
+def run_continuous(stores, familias, start_hour, end_hour, progress=None, cancel=None, engine=None,
+                   send=None, history=None, scheduler=None):
+    """
+    Bucle de sondeo continuo dentro del horario [start_hour, end_hour). Termina cuando
+    se activa `cancel` (threading.Event).
+    """
+    from motor_scraping import ScrapeEngine, get_session
+    from cache_paginas import get_page_cache, ENABLED as PAGE_CACHE_ENABLED
+    from procesador_ofertas import send_deals
+    from historial_precios import get_price_history, history_baseline, ENABLED as HISTORY_ENABLED
+    from modelos_canonicos import get_model_index
+    from indice_consultas import publish_index
+
+    cancel = cancel or threading.Event()
+    stores = {str(k): v for k, v in stores.items()}
+    # Sin planificador: aquí cada sondeo ya es un subconjunto elegido de familias
+    engine = engine or ScrapeEngine(session=get_session(),
+                                    page_cache=get_page_cache() if PAGE_CACHE_ENABLED else None)
+    scheduler = scheduler or PollScheduler((s, f) for s in stores for f in familias)
+    if history is None and HISTORY_ENABLED:
+        history = get_price_history()
+    catalog = ContinuousCatalog(send or send_deals, history)
+    baseline_day = None
+    warm = False
+    stale_index = True
+    print(f"Sondeo continuo: {len(scheduler.stats)} parejas, presupuesto {scheduler.requests_per_hour:.0f} pet/h, "
+          f"plan {scheduler.planned_requests_per_hour():.0f} pet/h.")
+
+    while not cancel.is_set():
+        now = datetime.datetime.now()
+        if not in_window(now, start_hour, end_hour):
+            cancel.wait(TICK_SECONDS)
+            continue
+
+        if now.date() != baseline_day:
+            # La ventana del historial avanza con el día
+            catalog.baseline = history_baseline()
+            baseline_day = now.date()
+            stale_index = True
+
+        tick_start = time.time()
+        # El primer tick llena el catálogo con un barrido completo
+        due = list(scheduler.stats) if not warm else scheduler.take_due(tick_start)
+        if due:
+            # Una sola consulta con las familias vencidas de cada sucursal; los productos
+            # de cada pareja salen del reparto por familia del resultado
+            due_families = {}
+            for id_sucursal, familia in due:
+                due_families.setdefault(id_sucursal, []).append(familia)
+            if progress is not None:
+                progress.begin_cycle(len(due_families), len(familias))
+
+            touched = set()
+            changed_pairs = []
+            group = {id_sucursal: stores[id_sucursal] for id_sucursal in due_families}
+            for id_sucursal, _, results in engine.scrape_stores(group, due_families, progress=progress, cancel=cancel):
+                for familia in due_families[id_sucursal]:
+                    key = (id_sucursal, familia)
+                    if familia in results.failed_families:
+                        # Un sondeo incompleto no reemplaza la pareja ni cuenta como cambio
+                        scheduler.record_error(key)
+                        continue
+                    products = list(results.by_family.get(familia, ()))
+                    models = catalog.update(key, products)
+                    if scheduler.record(key, products):
+                        changed_pairs.append(key)
+                        touched |= models
+            if cancel.is_set():
+                break
+
+            if warm:
+                new = catalog.evaluate(touched)
+                deal_pairs = {}
+                owners = {(p.sku, p.id_sucursal): key for key in changed_pairs for p in catalog.pairs[key]}
+                for p in new:
+                    key = owners.get(p.deal_id)
+                    if key is not None:
+                        deal_pairs[key] = deal_pairs.get(key, 0) + 1
+                for key, count in deal_pairs.items():
+                    scheduler.add_deals(key, count)
+                print(f"Tick: {len(due)} parejas, {len(changed_pairs)} con cambios, {len(new)} ofertas nuevas.")
+            else:
+                # Tras el barrido inicial se evalúa todo una vez
+                catalog.evaluate({p.modelo_id for products in catalog.pairs.values() for p in products})
+                warm = True
+            if changed_pairs or stale_index:
+                publish_index(catalog.build_index(stores))
+                stale_index = False
+            scheduler.rebalance()
+            scheduler.save()
+            get_model_index().flush()
+
+        cancel.wait(max(0.0, TICK_SECONDS - (time.time() - tick_start)))
@@ -6,49 +6,42 @@ from html.parser import HTMLParser
 import os
 import requests
 
-# Sistema de caché simple en JSON
-CACHE_FILE = "imagenes_cache.json"
-
-def load_image_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_image_cache(cache):
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f)
-
-def is_sku_cached(sku):
-    return sku in image_cache
-
-def load_cached_sku(sku):
-    return image_cache.get(sku, [])
-
-# def cache_sku(sku, image_urls):  # <-- Desactivado para posprocesamiento
-    image_cache[sku] = image_urls
-    save_image_cache(image_cache)
-
-def obtener_imagenes_efectimundo(sku):
-    url = "https://efectimundo.com.mx/catalogo/consulta_catalogo.php"
+from servicio_pse import clean_price_str
+from producto import Producto
+from metricas import span
+
+def fetch_image_urls(sku, session=None):
+    """
+    Consulta las imágenes de un SKU. A diferencia de obtener_imagenes_efectimundo,
+    los errores de red se propagan para que la caché no los guarde como "sin imágenes".
+    """
+    if session is None:
+        from motor_scraping import get_session
+        session = get_session()
     params = {
         "metodo": "guardayMuestaImagenes",
         "prenda": sku
     }
+    with span("image_lookup") as s:
+        response = session.post(CATALOG_URL, params=params, timeout=5)
+        s["status"] = response.status_code
+        s["bytes"] = len(response.content)
+    response.raise_for_status()
+    data = response.json()
+
+    if data.get("estatus") and "listaImagenes" in data:
+        return [
+            "https://efectimundo.com.mx/catalogo" + ruta["href"].lstrip(".")
+            for ruta in data["listaImagenes"]
+            if isinstance(ruta, dict) and "href" in ruta
+        ]
+    return []
 
+def obtener_imagenes_efectimundo(sku):
     try:
-        response = requests.post(url, params=params, timeout=5)
-        data = response.json()
-
-        if data.get("estatus") and "listaImagenes" in data:
-            return [
-                "https://efectimundo.com.mx/catalogo" + ruta["href"].lstrip(".")
-                for ruta in data["listaImagenes"]
-                if isinstance(ruta, dict) and "href" in ruta
-            ]
+        return fetch_image_urls(sku)
     except Exception as e:
         print(f"Error al obtener imagen para SKU {sku}: {e}")
-
     return []
 
 class TableParser(HTMLParser):
@@ -91,86 +84,79 @@ class TableParser(HTMLParser):
         elif self.in_td:
             self.current_row.append(data.strip())
 
-def fetch_page_data(page_number, familia, id_sucursal):
+CATALOG_URL = os.getenv("CATALOG_URL", "https://efectimundo.com.mx/catalogo/consulta_catalogo.php")
+# Familias de productos a raspar
+FAMILIAS = ["CONSOLAS DE JUEGOS", "JUEGOS DE VIDEO", "ACCESORIOS DE CONSOLAS", 
+            "SMARTWATCH", "AUDIFONOS", "PROYECTORES", 
+            "LAPTOP Y MINI LAPTOP", "PC ESCRITORIO", "MONITORES", "TABLETAS", "CELULARES"]
+CATALOG_HEADERS = {
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Accept-Language': 'es-419,es;q=0.6',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'Origin': 'https://efectimundo.com.mx',
+    'Pragma': 'no-cache',
+    'Referer': 'https://efectimundo.com.mx/catalogo/catalogo.php',
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)',
+    'X-Requested-With': 'XMLHttpRequest'
+}
+PAGE_SIZE = 50
+REQUEST_TIMEOUT = 20  # segundos
+
+def catalog_page_url(familia, id_sucursal):
     familia_encoded = urllib.parse.quote(familia)
-    url = f'https://efectimundo.com.mx/catalogo/consulta_catalogo.php?metodo=consulta_catalogo&salida=res&id_sucursal={id_sucursal}&ramo=&familia={familia_encoded}&tipo=&prenda=&marca=&modelo=&descripcion=&col_order='
-    headers = {
-        'Accept': 'application/json, text/javascript, */*; q=0.01',
-        'Accept-Language': 'es-419,es;q=0.6',
-        'Cache-Control': 'no-cache',
-        'Connection': 'keep-alive',
-        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'Origin': 'https://efectimundo.com.mx',
-        'Pragma': 'no-cache',
-        'Referer': 'https://efectimundo.com.mx/catalogo/catalogo.php',
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)',
-        'X-Requested-With': 'XMLHttpRequest'
-    }
-    data = urllib.parse.urlencode({'pagina': page_number}).encode('utf-8')
-    req = urllib.request.Request(url, data=data, headers=headers)
-    try:
-        with urllib.request.urlopen(req) as response:
-            response_content = response.read().decode('utf-8')
-            parsed_json = json.loads(response_content)
-            return parsed_json
-    except Exception as e:
-        print(f"Error al obtener página {page_number} de {familia} en sucursal {id_sucursal}: {e}")
-        return None
+    return f'{CATALOG_URL}?metodo=consulta_catalogo&salida=res&id_sucursal={id_sucursal}&ramo=&familia={familia_encoded}&tipo=&prenda=&marca=&modelo=&descripcion=&col_order='
+
+def request_catalog_page(session, page_number, familia, id_sucursal, timeout=REQUEST_TIMEOUT):
+    """
+    Hace el POST de una página del catálogo con la sesión dada y regresa la respuesta
+    cruda (requests.Response) para que el llamador pueda revisar el status.
+    """
+    return session.post(
+        catalog_page_url(familia, id_sucursal),
+        data={'pagina': page_number},
+        headers=CATALOG_HEADERS,
+        timeout=timeout
+    )
+
+def total_pages_for(initial_data):
+    total_items = int(initial_data.get('rowCount', 0))
+    return (total_items + PAGE_SIZE - 1) // PAGE_SIZE
+
+def parse_table(tabla):
+    """
+    Parser original basado en TableParser; la ruta caliente usa extractor_tabla.
+    """
+    parser = TableParser()
+    parser.feed(tabla)
+    return parser.headers, parser.rows
+
+def build_store_products(columns, rows, id_sucursal, nombre_sucursal):
+    """
+    Convierte filas proyectadas por TableExtractor (ya sin artículos dañados) en
+    registros Producto; el precio se parsea aquí y sólo aquí. Las imágenes se buscan
+    en el posprocesamiento, sólo para las ofertas (ver procesador_ofertas).
+    """
+    positions = {name: i for i, name in enumerate(columns)}
+    i_sku = positions["Prenda / Sku Lote"]
+    i_marca = positions["Marca"]
+    i_modelo = positions["Modelo"]
+    i_descripcion = positions["Descripción"]
+    i_precio = positions["Precio Promoción"]
+
+    return [
+        Producto(
+            row[i_sku], row[i_marca], row[i_modelo], row[i_descripcion],
+            clean_price_str(row[i_precio]), nombre_sucursal, id_sucursal
+        )
+        for row in rows
+    ]
 
 def scrape_store_for_families(id_sucursal, nombre_sucursal, familias):
-    all_products_from_store = []
-    for familia in familias:
-        all_rows = []
-        headers = []
-
-        print(f"Procesando {familia} en {nombre_sucursal} ({id_sucursal})")
-
-        try:
-            initial_data = fetch_page_data(1, familia, id_sucursal)
-            if not initial_data or not initial_data.get('tabla'):
-                print(f"No hay datos para {familia} en {nombre_sucursal}.")
-                continue
-
-            total_pages = int(initial_data.get('pag_final', 1))
-            page_size = 50
-            total_items = int(initial_data.get('rowCount', 0))
-            pages = (total_items + page_size - 1) // page_size
-
-            parser = TableParser()
-            parser.feed(initial_data['tabla'])
-            headers = parser.headers
-            all_rows.extend(parser.rows)
-
-            for page_num in range(2, pages + 1):
-                data = fetch_page_data(page_num, familia, id_sucursal)
-                if data and data.get("tabla"):
-                    parser = TableParser()
-                    parser.feed(data["tabla"])
-                    all_rows.extend(parser.rows)
-
-            for row in all_rows:
-                product_dict = {headers[j]: item for j, item in enumerate(row)}
-                descripcion = product_dict.get("Descripción", "").lower()
-                tipo = product_dict.get("Tipo", "").lower()
-                if "dañado" in descripcion or "dañado" in tipo:
-                    continue
-
-                sku = product_dict.get("Prenda / Sku Lote", "")
-                if is_sku_cached(sku):
-                    imagenes = load_cached_sku(sku)
-                else:
-# imagenes = obtener_imagenes_efectimundo(sku)  # <-- Desactivado para posprocesamiento
-# cache_sku(sku, imagenes)  # <-- Desactivado para posprocesamiento
-                    product_dict["Imagenes"] = []
-
-                    product_dict["Tienda"] = nombre_sucursal
-                    product_dict["ID_Sucursal"] = id_sucursal
-                    all_products_from_store.append(product_dict)
-
-        except Exception as e:
-            print(f"Error al procesar {familia} en {nombre_sucursal}: {e}")
-
-    return all_products_from_store
-
-# Inicializar caché global
-image_cache = load_image_cache()
+    """
+    Raspa todas las familias de una sucursal. Las familias y las páginas 2..N se piden
+    en paralelo a través del motor concurrente (ver motor_scraping).
+    """
+    from motor_scraping import get_engine
+    return get_engine().scrape_store(id_sucursal, nombre_sucursal, familias)
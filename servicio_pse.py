@@ -1,8 +1,3 @@
-import os
-import json
-import urllib.request
-import urllib.parse
-import datetime
 import re
 from dotenv import load_dotenv
 
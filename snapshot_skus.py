@@ -0,0 +1,194 @@
+"""
+Almacén persistente (SQLite) del último estado visto de cada SKU por sucursal.
+
+Cada ciclo se registra como un diff contra el ciclo anterior: SKUs nuevos, con precio
+cambiado y desaparecidos. El pipeline usa ese diff para evaluar sólo los modelos
+afectados y no volver a analizar ni notificar ofertas que ya se enviaron.
+"""
+import datetime
+import sqlite3
+import threading
+
+SNAPSHOT_DB_FILE = "snapshots_skus.db"
+
+_store = None
+_store_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS skus (
+    sku TEXT NOT NULL,
+    id_sucursal TEXT NOT NULL,
+    marca TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    precio REAL NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    ciclo INTEGER NOT NULL,
+    PRIMARY KEY (sku, id_sucursal)
+);
+CREATE INDEX IF NOT EXISTS idx_skus_sucursal_ciclo ON skus (id_sucursal, ciclo);
+CREATE INDEX IF NOT EXISTS idx_skus_modelo ON skus (marca, modelo);
+CREATE TABLE IF NOT EXISTS modelos (
+    marca TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    precio_dominante REAL,
+    PRIMARY KEY (marca, modelo)
+);
+CREATE TABLE IF NOT EXISTS ciclos (
+    ciclo INTEGER PRIMARY KEY AUTOINCREMENT,
+    inicio TEXT NOT NULL
+);
+"""
+
+
+class StoreDiff:
+    """Resultado de registrar una sucursal en el ciclo actual."""
+
+    __slots__ = ("new", "changed", "disappeared", "unchanged")
+
+    def __init__(self):
+        self.new = []           # (sku, id_sucursal)
+        self.changed = []       # (sku, id_sucursal)
+        self.disappeared = []   # (sku, id_sucursal, marca, modelo) con el modelo canónico
+        self.unchanged = 0
+
+    def changed_ids(self):
+        return set(self.new) | set(self.changed)
+
+    def disappeared_models(self):
+        return {(marca, modelo) for _, _, marca, modelo in self.disappeared}
+
+
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.cycle = None
+        self.now = None
+
+    def begin_cycle(self):
+        self.now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            cur = self.conn.execute("INSERT INTO ciclos (inicio) VALUES (?)", (self.now,))
+            self.cycle = cur.lastrowid
+        return self.cycle
+
+    def record_store(self, id_sucursal, products, complete=True):
+        """
+        Registra los productos de una sucursal en el ciclo actual y regresa su StoreDiff.
+        Los SKUs de esta sucursal que no llegaron en este ciclo se borran como desaparecidos,
+        salvo con `complete=False` (alguna página falló): entonces se conservan con su
+        ciclo anterior y se resuelven en el siguiente ciclo completo, para no darlos por
+        nuevos cuando vuelvan.
+        """
+        if self.cycle is None:
+            self.begin_cycle()
+        id_sucursal = str(id_sucursal)
+        diff = StoreDiff()
+
+        with self.lock, self.conn:
+            previous = {
+                sku: precio for sku, precio in self.conn.execute(
+                    "SELECT sku, precio FROM skus WHERE id_sucursal = ?", (id_sucursal,)
+                )
+            }
+            rows = []
+            for product in products:
+                sku = product.sku
+                precio = product.precio
+                if sku not in previous:
+                    diff.new.append((sku, id_sucursal))
+                elif previous[sku] != precio:
+                    diff.changed.append((sku, id_sucursal))
+                else:
+                    diff.unchanged += 1
+                rows.append((
+                    sku, id_sucursal, *product.model_key,
+                    precio, self.now, self.now, self.cycle
+                ))
+
+            self.conn.executemany(
+                """
+                INSERT INTO skus (sku, id_sucursal, marca, modelo, precio, first_seen, last_seen, ciclo)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sku, id_sucursal) DO UPDATE SET
+                    marca = excluded.marca,
+                    modelo = excluded.modelo,
+                    precio = excluded.precio,
+                    last_seen = excluded.last_seen,
+                    ciclo = excluded.ciclo
+                """,
+                rows
+            )
+
+            if not complete:
+                return diff
+            diff.disappeared = self.conn.execute(
+                "SELECT sku, id_sucursal, marca, modelo FROM skus WHERE id_sucursal = ? AND ciclo != ?",
+                (id_sucursal, self.cycle)
+            ).fetchall()
+            self.conn.execute(
+                "DELETE FROM skus WHERE id_sucursal = ? AND ciclo != ?", (id_sucursal, self.cycle)
+            )
+
+        return diff
+
+    def touch_store(self, id_sucursal, expected):
+        """
+        Atajo para una sucursal cuyas páginas llegaron todas idénticas (ver cache_paginas):
+        sólo se marca el ciclo en sus SKUs. Si el snapshot no tiene exactamente `expected`
+        SKUs de la sucursal (p. ej. se borró la base) regresa None y hay que usar
+        record_store.
+        """
+        if self.cycle is None:
+            self.begin_cycle()
+        id_sucursal = str(id_sucursal)
+        with self.lock, self.conn:
+            count = self.conn.execute(
+                "SELECT COUNT(*) FROM skus WHERE id_sucursal = ?", (id_sucursal,)
+            ).fetchone()[0]
+            if count != expected:
+                return None
+            self.conn.execute(
+                "UPDATE skus SET last_seen = ?, ciclo = ? WHERE id_sucursal = ?",
+                (self.now, self.cycle, id_sucursal)
+            )
+        diff = StoreDiff()
+        diff.unchanged = expected
+        return diff
+
+    def forget(self, deal_ids):
+        """Borra (sku, id_sucursal): en el siguiente ciclo esos SKUs cuentan como nuevos."""
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM skus WHERE sku = ? AND id_sucursal = ?", deal_ids)
+
+    def get_dominant_price(self, model_key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT precio_dominante FROM modelos WHERE marca = ? AND modelo = ?", model_key
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_dominant_price(self, model_key, precio_dominante):
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO modelos (marca, modelo, precio_dominante) VALUES (?, ?, ?)
+                ON CONFLICT (marca, modelo) DO UPDATE SET precio_dominante = excluded.precio_dominante
+                """,
+                (model_key[0], model_key[1], precio_dominante)
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def get_snapshot_store():
+    """Instancia compartida por el proceso (orquestador y jobs del API)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore()
+        return _store
@@ -0,0 +1,210 @@
+"""
+Snapshot por corrida y modo replay.
+
+Cada ciclo escribe el conjunto de productos normalizado a un CSV comprimido
+(snapshots_corrida/corrida-AAAAmmdd-HHMMSS.csv.gz), sucursal por sucursal conforme
+llegan, y lo publica con un rename atómico al terminar el ciclo; un ciclo cancelado
+o que falla no deja snapshot. Se conservan los SNAPSHOTS_CORRIDA_MAX más recientes.
+El modo continuo (ORQUESTADOR_MODO=continuo, ver programador_sondeo) no tiene ciclos
+completos y no escribe snapshots; `efectimundo.py raspar` sirve para tomar uno suelto.
+
+El replay lee uno o más snapshots en bloques (sin cargar el CSV completo como texto),
+repite la detección de process_and_send_all_deals con parámetros propios y entrega las
+ofertas a un notificador de prueba que sólo imprime; no toca Slack, OpenAI ni las
+imágenes:
+
+    python snapshots_corrida.py ARCHIVO [ARCHIVO ...] [--min-frecuencia 3] [--min-margen 100]
+                                [--baseline snapshot|moda|mediana] [--top 20] [--mensajes]
+                                [--unir] [--json SALIDA]
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import time
+
+SNAPSHOT_DIR = "snapshots_corrida"
+ENABLED = os.getenv("SNAPSHOTS_CORRIDA", "1") != "0"
+MAX_SNAPSHOTS = int(os.getenv("SNAPSHOTS_CORRIDA_MAX", "48"))
+CHUNK_ROWS = 20000
+FIELDS = ("sku", "marca", "modelo", "descripcion", "precio", "tienda", "id_sucursal")
+NAME_FORMAT = "corrida-%Y%m%d-%H%M%S.csv.gz"
+
+
+class RunSnapshotWriter:
+    def __init__(self, directory=SNAPSHOT_DIR, started=None, max_snapshots=MAX_SNAPSHOTS, path=None):
+        """`path` fija el archivo de salida en lugar del nombre por hora de inicio."""
+        if path is None:
+            started = started or datetime.datetime.now()
+            path = os.path.join(directory, started.strftime(NAME_FORMAT))
+        else:
+            directory = os.path.dirname(path) or "."
+        self.directory = directory
+        self.max_snapshots = max_snapshots
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.tmp = f"{self.path}.tmp"
+        self.raw = gzip.open(self.tmp, "wb", compresslevel=5)
+        self.file = io.TextIOWrapper(self.raw, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDS)
+        self.rows = 0
+
+    def write_store(self, products):
+        self.writer.writerows(
+            (p.sku, p.marca, p.modelo, p.descripcion, repr(p.precio), p.tienda, p.id_sucursal)
+            for p in products
+        )
+        self.rows += len(products)
+
+    def tee(self, store_results):
+        for id_sucursal, nombre_sucursal, products in store_results:
+            self.write_store(products)
+            yield id_sucursal, nombre_sucursal, products
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp, self.path)
+        print(f"Snapshot de la corrida: {self.path} ({self.rows} productos)")
+        snapshots = list_snapshots(self.directory)
+        for old in snapshots[:max(len(snapshots) - self.max_snapshots, 0)]:
+            os.remove(old)
+        return self.path
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.tmp)
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("corrida-") and name.endswith(".csv.gz")
+    )
+
+
+def snapshot_time(path):
+    """Hora de inicio de la corrida según el nombre del archivo, o su mtime."""
+    try:
+        return datetime.datetime.strptime(os.path.basename(path), NAME_FORMAT).timestamp()
+    except ValueError:
+        return os.path.getmtime(path)
+
+
+def read_snapshot(path, chunk_rows=CHUNK_ROWS):
+    """Generador de listas de Productos de a lo más `chunk_rows`, leídas en streaming."""
+    from producto import Producto
+
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = tuple(next(reader, ()))
+        if header != FIELDS:
+            raise ValueError(f"{path} no es un snapshot de corrida (encabezado {header!r})")
+        chunk = []
+        for sku, marca, modelo, descripcion, precio, tienda, id_sucursal in reader:
+            chunk.append(Producto(sku, marca, modelo, descripcion, float(precio), tienda, id_sucursal))
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class DryRunNotifier:
+    """Sustituto de send_deals: imprime las mejores ofertas y, si se pide, el mensaje de Slack."""
+
+    def __init__(self, top=20, messages=False):
+        self.top = top
+        self.messages = messages
+        self.deals = []
+
+    def __call__(self, deals):
+        self.deals.extend(deals)
+        for producto in deals[:self.top]:
+            print(f"  {producto.marca} {producto.modelo} | {producto.tienda} ({producto.id_sucursal}) | "
+                  f"${producto.precio:,.2f} vs ${producto.precio_dominante:,.2f} | margen ${producto.margen:,.2f}")
+            if self.messages:
+                from notificador_slack import format_slack_message
+
+                payload = format_slack_message(producto, {
+                    "precio_dominante": producto.precio_dominante,
+                    "margen": f"${producto.margen:,.2f}",
+                    "product_id": producto.sku or "N/A",
+                    "openai_analysis": "(replay: sin análisis)",
+                })
+                print(json.dumps(payload, ensure_ascii=False, indent=2))
+        if len(deals) > self.top:
+            print(f"  ... y {len(deals) - self.top} más")
+
+
+def replay(paths, min_dominant_freq, min_profit, baseline_mode="snapshot", notifier=None):
+    """
+    Detección sobre los productos de `paths` (un solo conjunto). Regresa las ofertas
+    ordenadas por margen, con margen y precio_dominante asignados.
+    """
+    from deteccion_ofertas import detect_grouped_deals
+
+    started = time.perf_counter()
+    groups = {}
+    total = 0
+    for path in paths:
+        for chunk in read_snapshot(path):
+            for product in chunk:
+                groups.setdefault(product.modelo_id, []).append(product)
+            total += len(chunk)
+    loaded = time.perf_counter()
+
+    baseline = None
+    if baseline_mode != "snapshot":
+        from historial_precios import get_price_history
+        # Sólo historial anterior a la corrida, como lo habría visto el ciclo
+        baseline = get_price_history().baseline(mode=baseline_mode, now=min(snapshot_time(p) for p in paths))
+    _, deals = detect_grouped_deals(groups, min_dominant_freq, min_profit, baseline)
+    detected = time.perf_counter()
+
+    print(f"{', '.join(os.path.basename(p) for p in paths)}: {total} productos, {len(groups)} modelos, "
+          f"{len(deals)} ofertas (lectura {loaded - started:.2f}s, detección {detected - loaded:.2f}s)")
+    if notifier is not None:
+        notifier(deals)
+    return deals
+
+
+def main(argv=None):
+    from procesador_ofertas import MIN_DOMINANT_FREQ, MIN_PROFIT_THRESHOLD
+
+    parser = argparse.ArgumentParser(description="Repite la detección de ofertas sobre snapshots de corrida")
+    parser.add_argument("snapshots", nargs="*", help="Archivos .csv.gz (por defecto, el más reciente)")
+    parser.add_argument("--min-frecuencia", type=int, default=MIN_DOMINANT_FREQ)
+    parser.add_argument("--min-margen", type=float, default=MIN_PROFIT_THRESHOLD)
+    parser.add_argument("--baseline", choices=("snapshot", "moda", "mediana"), default="snapshot")
+    parser.add_argument("--top", type=int, default=20, help="Ofertas a mostrar por snapshot")
+    parser.add_argument("--mensajes", action="store_true", help="Imprimir el mensaje de Slack de cada oferta mostrada")
+    parser.add_argument("--unir", action="store_true", help="Tratar todos los snapshots como un solo catálogo")
+    parser.add_argument("--json", help="Archivo donde guardar las ofertas")
+    args = parser.parse_args(argv)
+
+    paths = args.snapshots or list_snapshots()[-1:]
+    if not paths:
+        parser.error(f"No hay snapshots en {SNAPSHOT_DIR}/")
+    notifier = DryRunNotifier(args.top, args.mensajes)
+    runs = [paths] if args.unir else [[p] for p in paths]
+    results = []
+    for run in runs:
+        deals = replay(run, args.min_frecuencia, args.min_margen, args.baseline, notifier)
+        results.append({
+            "snapshots": [os.path.basename(p) for p in run],
+            "ofertas": [p.to_dict() for p in deals],
+        })
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
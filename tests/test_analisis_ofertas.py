@@ -0,0 +1,118 @@
+"""
+Pruebas del análisis de ofertas (analisis_ofertas.py) contra un cliente falso local
+con la forma de `chat.completions.create` del SDK de OpenAI.
+
+    python -m pytest tests
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analisis_ofertas import OfferAnalyzer, prompt_key, NO_DISPONIBLE
+
+
+def deal(sku, precio, precio_dominante=1000.0):
+    return SimpleNamespace(sku=sku, deal_id=(sku, "101"), precio=precio,
+                           precio_dominante=precio_dominante, margen=precio_dominante - precio)
+
+
+class FakeClient:
+    """
+    Responde "Sí <precio>" a los prompts individuales y, en modo JSON, un veredicto por
+    id del lote; `batch_reply` sustituye la respuesta de los lotes.
+    """
+
+    def __init__(self, batch_reply=None):
+        self.batch_reply = batch_reply
+        self.calls = []
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, temperature, response_format=None):
+        prompt = messages[0]["content"]
+        with self.lock:
+            self.calls.append("lote" if response_format else "individual")
+        if response_format:
+            if self.batch_reply is not None:
+                content = self.batch_reply
+            else:
+                content = json.dumps({"veredictos": [
+                    {"id": int(i), "respuesta": f"Sí {precio}"}
+                    for i, precio in re.findall(r"- id (\d+): precio de sucursal \$([\d,]+\.\d\d)", prompt)
+                ]})
+        else:
+            content = "Sí " + re.search(r"Precio de sucursal: \$([\d,.]+)", prompt).group(1)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class OfferAnalyzerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="analisis_")
+        self.cache_path = os.path.join(self.directory, "analisis_cache.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def analyzer(self, client, **kwargs):
+        return OfferAnalyzer(client=client, cache_path=self.cache_path, requests_per_minute=60000, **kwargs)
+
+    def test_cache_hit_skips_the_call(self):
+        client = FakeClient()
+        deals = [deal("a", 800.0), deal("b", 850.0)]
+        first = self.analyzer(client).analyze_all(deals)
+        self.assertEqual(first, {("a", "101"): "Sí 800.00", ("b", "101"): "Sí 850.00"})
+        self.assertEqual(len(client.calls), 2)
+        # Otra instancia lee la caché persistida; la misma llave en otra sucursal también
+        other_store = SimpleNamespace(**dict(vars(deals[0]), deal_id=("a", "102")))
+        again = self.analyzer(client).analyze_all(deals + [other_store])
+        self.assertEqual(again[("a", "102")], "Sí 800.00")
+        self.assertEqual(len(client.calls), 2)
+
+    def test_expired_entry_is_requested_again(self):
+        client = FakeClient()
+        analyzer = self.analyzer(client, ttl=0.05)
+        analyzer.analyze_all([deal("a", 800.0)])
+        self.assertIsNotNone(analyzer.cached(prompt_key(800.0, 1000.0, 200.0)))
+        time.sleep(0.1)
+        self.assertIsNone(analyzer.cached(prompt_key(800.0, 1000.0, 200.0)))
+        analyzer.analyze_all([deal("a", 800.0)])
+        self.assertEqual(client.calls, ["individual", "individual"])
+
+    def test_batch_verdicts_map_back_to_deals(self):
+        client = FakeClient()
+        deals = [deal(f"s{i}", 700.0 + i) for i in range(5)]
+        result = self.analyzer(client, batch_size=3).analyze_all(deals)
+        self.assertEqual(client.calls, ["lote", "lote"])
+        self.assertEqual(result, {p.deal_id: f"Sí {p.precio:,.2f}" for p in deals})
+
+    def test_malformed_batch_falls_back_to_single_calls(self):
+        for reply in ("no es json", json.dumps({"veredictos": [{"id": 7, "respuesta": "Sí"}, {"id": 0}]})):
+            client = FakeClient(batch_reply=reply)
+            if os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+            deals = [deal("a", 800.0), deal("b", 850.0)]
+            result = self.analyzer(client, batch_size=10).analyze_all(deals)
+            self.assertEqual(client.calls, ["lote", "individual", "individual"])
+            self.assertEqual(result, {("a", "101"): "Sí 800.00", ("b", "101"): "Sí 850.00"})
+
+    def test_client_error_is_not_cached(self):
+        def fail(**kwargs):
+            raise RuntimeError("sin red")
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=fail)))
+        analyzer = self.analyzer(client)
+        self.assertEqual(analyzer.analyze_all([deal("a", 800.0)]), {("a", "101"): NO_DISPONIBLE})
+        self.assertIsNone(analyzer.cached(prompt_key(800.0, 1000.0, 200.0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Pruebas de la cola de trabajo (cola_trabajo.py): leases que vencen y se renuevan,
+intentos máximos, tareas con páginas fallidas y ciclos retomados.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modelos_canonicos
+from cola_trabajo import WorkQueue, run_task, PENDIENTE, TOMADA, HECHA, FALLIDA
+from motor_scraping import StoreProducts
+from producto import Producto
+
+STORES = {"101": "Sucursal 101", "102": "Sucursal 102"}
+FAMILIAS = ["CELULARES", "TABLETAS"]
+
+
+def product(sku, id_sucursal="101"):
+    return Producto(sku, "Marca", "Modelo", "Artículo", 1000.0, STORES[id_sucursal], id_sucursal)
+
+
+class FakeEngine:
+    """Sustituto de ScrapeEngine: una sola sucursal con los productos y familias fallidas dados."""
+
+    def __init__(self, products=(), failed_families=(), error=None):
+        self.products = list(products)
+        self.failed_families = failed_families
+        self.error = error
+
+    def scrape_stores(self, stores, familias, progress=None):
+        if self.error is not None:
+            raise self.error
+        for id_sucursal, nombre in stores.items():
+            progress.page_done(id_sucursal, familias[0], 1, len(self.products))
+            yield id_sucursal, nombre, StoreProducts(self.products, failed_families=self.failed_families)
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="cola_trabajo_")
+        self.previous_index = modelos_canonicos._index
+        # Sin base: las pruebas no deben escribir en modelos_canonicos.db
+        modelos_canonicos._index = modelos_canonicos.CanonicalModelIndex(fuzzy=False)
+
+    def tearDown(self):
+        modelos_canonicos._index = self.previous_index
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def queue(self, **kwargs):
+        queue = WorkQueue(self.directory, **kwargs)
+        self.addCleanup(queue.conn.close)
+        return queue
+
+    def state(self, queue, task):
+        return queue.conn.execute(
+            "SELECT estado, intentos FROM tareas WHERE ciclo = ? AND id_sucursal = ? AND familia = ?",
+            (task.ciclo, task.id_sucursal, task.familia)
+        ).fetchone()
+
+    def test_expired_lease_goes_to_another_worker(self):
+        queue = self.queue(lease_seconds=0.05)
+        queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        self.assertIsNone(queue.lease("b"))
+        time.sleep(0.1)
+        retaken = queue.lease("b")
+        self.assertEqual((retaken.id_sucursal, retaken.familia, retaken.intentos), ("101", "CELULARES", 2))
+        # El worker original ya no puede renovar ni cerrar la tarea
+        self.assertFalse(queue.extend(task, "a"))
+        self.assertFalse(queue.complete(task, "a", [product("P1")]))
+        self.assertTrue(queue.complete(retaken, "b", [product("P1")]))
+        self.assertEqual(self.state(queue, task), (HECHA, 2))
+
+    def test_extend_keeps_the_lease(self):
+        queue = self.queue(lease_seconds=0.2)
+        queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        for _ in range(3):
+            time.sleep(0.1)
+            self.assertTrue(queue.extend(task, "a"))
+        self.assertIsNone(queue.lease("b"))
+        self.assertEqual(self.state(queue, task), (TOMADA, 1))
+
+    def test_fails_after_max_attempts(self):
+        queue = self.queue(max_attempts=2)
+        ciclo, _ = queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        queue.fail(task, "a", "error")
+        self.assertEqual(self.state(queue, task), (PENDIENTE, 1))
+        task = queue.lease("a")
+        queue.fail(task, "a", "error")
+        self.assertEqual(self.state(queue, task), (FALLIDA, 2))
+        self.assertIsNone(queue.lease("a"))
+        self.assertEqual(queue.finished_stores(ciclo), ["101"])
+        self.assertEqual(queue.load_store(ciclo, "101"), ([], {"CELULARES": 0}, ["CELULARES"]))
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        queue = self.queue(lease_seconds=0.05, max_attempts=1)
+        queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        time.sleep(0.1)
+        self.assertIsNone(queue.lease("b"))
+        self.assertEqual(self.state(queue, task), (FALLIDA, 1))
+
+    def test_page_errors_count_as_failed_attempt(self):
+        queue = self.queue(max_attempts=2)
+        ciclo, _ = queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        run_task(queue, FakeEngine([product("P1")], failed_families={"CELULARES"}), task, "a")
+        self.assertEqual(self.state(queue, task), (PENDIENTE, 1))
+        task = queue.lease("a")
+        run_task(queue, FakeEngine(error=RuntimeError("sin red")), task, "a")
+        self.assertEqual(self.state(queue, task), (FALLIDA, 2))
+        products, _, failed = queue.load_store(ciclo, "101")
+        self.assertEqual((products, failed), ([], ["CELULARES"]))
+
+    def test_completed_task_loads_its_shard(self):
+        queue = self.queue()
+        ciclo, _ = queue.open_cycle({"101": STORES["101"]}, ["CELULARES"])
+        task = queue.lease("a")
+        run_task(queue, FakeEngine([product("P1"), product("P2")]), task, "a")
+        products, by_family, failed = queue.load_store(ciclo, "101")
+        self.assertEqual([p.sku for p in products], ["P1", "P2"])
+        self.assertEqual((by_family, failed), ({"CELULARES": 2}, []))
+
+    def test_resume_keeps_finished_tasks(self):
+        queue = self.queue()
+        ciclo, resumed = queue.open_cycle(STORES, FAMILIAS)
+        self.assertFalse(resumed)
+        done = queue.lease("a")
+        queue.complete(done, "a", [product("P1", done.id_sucursal)])
+        taken = queue.lease("a")
+        # El orquestador se cae con una tarea tomada; al volver retoma el mismo ciclo
+        self.assertEqual(queue.release("a"), 1)
+        self.assertEqual(self.queue().open_cycle(dict(reversed(list(STORES.items()))), FAMILIAS), (ciclo, True))
+        self.assertEqual(self.state(queue, taken), (PENDIENTE, 0))
+        remaining = set()
+        while True:
+            task = queue.lease("b")
+            if task is None:
+                break
+            remaining.add((task.id_sucursal, task.familia))
+            queue.complete(task, "b", [])
+        self.assertEqual(len(remaining), 3)
+        self.assertNotIn((done.id_sucursal, done.familia), remaining)
+        products, _, _ = queue.load_store(ciclo, done.id_sucursal)
+        self.assertEqual([p.sku for p in products], ["P1"])
+
+    def test_other_cycle_abandons_the_open_one(self):
+        queue = self.queue()
+        ciclo, _ = queue.open_cycle(STORES, FAMILIAS)
+        task = queue.lease("a")
+        queue.complete(task, "a", [product("P1", task.id_sucursal)])
+        nuevo, resumed = queue.open_cycle(STORES, ["CELULARES"])
+        self.assertFalse(resumed)
+        self.assertNotEqual(nuevo, ciclo)
+        self.assertEqual(queue.counts(ciclo), {})
+        self.assertEqual(queue.counts(nuevo), {PENDIENTE: 2})
+        self.assertFalse(os.path.exists(os.path.dirname(queue.shard_path(ciclo, "101", "CELULARES"))))
+
+
+if __name__ == "__main__":
+    unittest.main()
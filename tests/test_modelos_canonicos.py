@@ -0,0 +1,121 @@
+"""
+Pruebas del índice de modelos canónicos (modelos_canonicos.py): normalización,
+distancia de una edición, bloqueo por tokens con dígitos, absorción de erratas y
+persistencia de los ids entre instancias.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelos_canonicos import CanonicalModelIndex, normalize_text, within_one_edit
+
+
+class NormalizeTextTest(unittest.TestCase):
+    def test_separators_accents_and_case(self):
+        self.assertEqual(normalize_text("GALAXY  A-12"), ["galaxy", "a12"])
+        self.assertEqual(normalize_text("Teléfono_Básico"), ["telefono", "basico"])
+
+    def test_capacity_and_glued_tokens(self):
+        self.assertEqual(normalize_text("iPhone12 128 GB"), ["iphone", "12", "128gb"])
+        self.assertEqual(normalize_text("Redmi 9Pro"), ["redmi", "9", "pro"])
+
+    def test_plus_is_kept_as_a_word(self):
+        self.assertEqual(normalize_text("Galaxy S21+"), ["galaxy", "s21", "plus"])
+        self.assertEqual(normalize_text("Galaxy S21+"), normalize_text("Galaxy S21 Plus"))
+        self.assertNotEqual(normalize_text("Galaxy S21+"), normalize_text("Galaxy S21"))
+
+
+class WithinOneEditTest(unittest.TestCase):
+    def test_one_edit(self):
+        for a, b in (("galaxy", "galaxy"), ("galaxy", "galaxi"), ("galaxy", "galax"),
+                     ("galaxy", "gaalxy"), ("note", "notes")):
+            self.assertTrue(within_one_edit(a, b), (a, b))
+            self.assertTrue(within_one_edit(b, a), (b, a))
+
+    def test_more_than_one_edit(self):
+        for a, b in (("galaxy", "gelaxi"), ("galaxy", "gala"), ("pro", "plus"), ("abcd", "badc")):
+            self.assertFalse(within_one_edit(a, b), (a, b))
+
+
+class CanonicalModelIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="modelos_canonicos_")
+        self.path = os.path.join(self.directory, "modelos_canonicos.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def index(self, **kwargs):
+        index = CanonicalModelIndex(self.path, **kwargs)
+        self.addCleanup(index.conn.close)
+        return index
+
+    def model_id(self, index, marca, modelo):
+        return index.resolve(marca, modelo)[0]
+
+    def test_capture_variants_share_an_id(self):
+        index = self.index()
+        base = self.model_id(index, "Samsung", "Galaxy A12")
+        for marca, modelo in (("SAMSUNG", "GALAXY  A-12"), ("Samsung", "Galaxi A12"), ("Samsumg", "Galaxy A 12")):
+            self.assertEqual(self.model_id(index, marca, modelo), base, modelo)
+        self.assertEqual(index.resolve("samsung", "galaxi a12")[1], ("Samsung", "Galaxy A12"))
+
+    def test_digit_tokens_block_matches(self):
+        index = self.index()
+        ids = {self.model_id(index, marca, modelo) for marca, modelo in (
+            ("Samsung", "Galaxy A12"), ("Samsung", "Galaxy M12"),
+            ("Apple", "iPhone 12"), ("Apple", "iPhone 13"),
+        )}
+        self.assertEqual(len(ids), 4)
+
+    def test_short_words_are_not_fuzzy(self):
+        index = self.index()
+        self.assertNotEqual(self.model_id(index, "Xiaomi", "Redmi 9 Pro"),
+                            self.model_id(index, "Xiaomi", "Redmi 9 Plus"))
+
+    def test_plus_model_is_separate(self):
+        index = self.index()
+        s21 = self.model_id(index, "Samsung", "Galaxy S21")
+        plus = self.model_id(index, "Samsung", "Galaxy S21+")
+        self.assertNotEqual(s21, plus)
+        self.assertEqual(self.model_id(index, "Samsung", "Galaxy S21 Plus"), plus)
+
+    def test_ids_persist_across_instances(self):
+        first = self.index()
+        a12 = self.model_id(first, "Samsung", "Galaxy A12")
+        iphone = self.model_id(first, "Apple", "iPhone 12")
+        first.flush()
+
+        second = self.index()
+        self.assertEqual(second.lookup("Samsung", "Galaxi A12"), (a12, ("Samsung", "Galaxy A12")))
+        self.assertEqual(self.model_id(second, "Apple", "iPhone 12"), iphone)
+        # Un alta de la segunda instancia la ve la primera sin reabrir la base
+        m12 = self.model_id(second, "Samsung", "Galaxy M12")
+        self.assertEqual(self.model_id(first, "Samsung", "Galaxy M12"), m12)
+        self.assertEqual(len({a12, iphone, m12}), 3)
+
+    def test_stale_resolutions_are_discarded(self):
+        first = self.index()
+        s21 = self.model_id(first, "Samsung", "Galaxy S21")
+        first.flush()
+        # Resolución guardada con la normalización anterior, que juntaba "S21+" con "S21"
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.execute("INSERT INTO resoluciones VALUES ('Samsung', 'Galaxy S21+', ?)", (s21,))
+            conn.execute("PRAGMA user_version = 1")
+        conn.close()
+
+        second = self.index()
+        self.assertNotEqual(self.model_id(second, "Samsung", "Galaxy S21+"), s21)
+        self.assertEqual(self.model_id(second, "Samsung", "Galaxy S21"), s21)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Pruebas del agregador en streaming (pipeline_ofertas.py): la evaluación temprana y la
+liberación de artículos no deben cambiar las ofertas respecto a evaluar todo al final, y
+en modo resumen un ciclo manda un solo mensaje aunque sus ofertas salgan en varias tandas.
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analisis_ofertas
+import cache_imagenes
+import cola_slack
+import modelos_canonicos
+import pipeline_ofertas
+import procesador_ofertas
+from pipeline_ofertas import ModelAggregator, run_pipeline
+from producto import Producto
+
+MODEL_KEY = ("Marca", "Modelo X")
+
+
+def product(sku, precio, id_sucursal, modelo=MODEL_KEY[1]):
+    return Producto(sku, MODEL_KEY[0], modelo, "Artículo", precio, f"Sucursal {id_sucursal}", id_sucursal)
+
+
+def stores():
+    return [
+        ("1", [product("a", 1000.0, "1"), product("b", 1000.0, "1"), product("d", 850.0, "1")]),
+        ("2", [product("c", 1000.0, "2"), product("e", 1000.0, "2")]),
+        # Tienda que no tenía el modelo en el ciclo anterior: sube la moda a 1200
+        ("3", [product(f"n{i}", 1200.0, "3") for i in range(6)]),
+    ]
+
+
+def run(aggregator):
+    """{sku: margen} de todas las ofertas emitidas, tempranas y del flush."""
+    deals = []
+    for id_sucursal, products in stores():
+        aggregator.add_store(id_sucursal, products)
+        deals.extend(aggregator.store_done(id_sucursal))
+    deals.extend(aggregator.flush())
+    return {p.sku: p.margen for p in deals}
+
+
+class ModelAggregatorTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_index = modelos_canonicos._index
+        modelos_canonicos._index = modelos_canonicos.CanonicalModelIndex(fuzzy=False)
+
+    def tearDown(self):
+        modelos_canonicos._index = self.previous_index
+
+    def test_unexpected_store_after_early_evaluation_keeps_deals(self):
+        early = ModelAggregator(expected_stores={MODEL_KEY: {"1", "2"}})
+        expected = {"d": 350.0, "a": 200.0, "b": 200.0, "c": 200.0, "e": 200.0}
+        self.assertEqual(run(ModelAggregator()), expected)
+        self.assertEqual(run(early), expected)
+        self.assertIsNone(early.spill)
+
+    def test_early_deal_is_not_repeated_at_flush(self):
+        aggregator = ModelAggregator(expected_stores={MODEL_KEY: {"1", "2"}})
+        first, second = stores()[:2]
+        aggregator.add_store(*first)
+        self.assertEqual(aggregator.store_done("1"), [])
+        aggregator.add_store(*second)
+        self.assertEqual([p.sku for p in aggregator.store_done("2")], ["d"])
+        state = aggregator.models[MODEL_KEY]
+        self.assertTrue(state.released)
+        self.assertEqual([p.sku for p in state.items], ["d"])
+        self.assertEqual(aggregator.flush(), [])
+
+
+class FakeDelivery:
+    def __init__(self):
+        self.payloads = []
+
+    def enqueue(self, payload, not_before=None):
+        self.payloads.append(payload)
+
+    def pending_count(self, deferred=True):
+        return len(self.payloads)
+
+
+class FakeImageCache:
+    def prefetch(self, skus):
+        return {}
+
+
+class FakeAnalyzer:
+    def analyze_all(self, deals):
+        return {p.deal_id: "Sí" for p in deals}
+
+
+class DigestTest(unittest.TestCase):
+    def setUp(self):
+        self.delivery = FakeDelivery()
+        patches = [
+            mock.patch.object(modelos_canonicos, "_index", modelos_canonicos.CanonicalModelIndex(fuzzy=False)),
+            mock.patch.object(cola_slack, "_delivery", self.delivery),
+            mock.patch.object(cache_imagenes, "_cache", FakeImageCache()),
+            mock.patch.object(analisis_ofertas, "_analyzer", FakeAnalyzer()),
+            mock.patch.object(procesador_ofertas, "END_SEND_HOUR", 24),
+            mock.patch.object(procesador_ofertas, "SLACK_DIGEST_TOP_N", 10),
+            mock.patch.object(pipeline_ofertas, "SLACK_DIGEST_TOP_N", 10),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def store_results(self):
+        # Cada modelo se completa con una tienda distinta: dos tandas tempranas y el flush
+        for id_sucursal, modelo in (("1", "Modelo X"), ("2", "Modelo Y"), ("3", "Modelo Z")):
+            products = [product(f"{modelo}-{i}", 1000.0, id_sucursal, modelo) for i in range(3)]
+            products.append(product(f"{modelo}-oferta", 800.0, id_sucursal, modelo))
+            yield id_sucursal, f"Sucursal {id_sucursal}", products
+
+    def test_multi_batch_cycle_enqueues_one_digest(self):
+        batches = []
+        run_pipeline(self.store_results(), {("Marca", "Modelo X"): {"1"}, ("Marca", "Modelo Y"): {"2"}},
+                     send=batches.append, digest=False)
+        self.assertEqual(len(batches), 3)
+
+        run_pipeline(self.store_results(), {("Marca", "Modelo X"): {"1"}, ("Marca", "Modelo Y"): {"2"}})
+        self.assertEqual(len(self.delivery.payloads), 1)
+        texto = json.dumps(self.delivery.payloads[0], ensure_ascii=False)
+        for modelo in ("Modelo X", "Modelo Y", "Modelo Z"):
+            self.assertIn(modelo, texto)
+
+
+if __name__ == "__main__":
+    unittest.main()
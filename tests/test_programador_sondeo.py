@@ -0,0 +1,113 @@
+"""
+Pruebas del sondeo continuo (programador_sondeo.py): cada tick pide todas sus parejas
+en una sola llamada al motor y reparte los resultados por pareja, y el barrido inicial
+publica el índice de consultas del catálogo completo.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import historial_precios
+import indice_consultas
+import modelos_canonicos
+from motor_scraping import StoreProducts
+from producto import Producto
+from programador_sondeo import PollScheduler, run_continuous
+
+STORES = {"101": "Sucursal 101", "102": "Sucursal 102"}
+FAMILIAS = ["CELULARES", "TABLETAS"]
+
+
+def product(sku, precio, id_sucursal, modelo):
+    return Producto(sku, "Marca", modelo, "Artículo", precio, STORES[id_sucursal], id_sucursal)
+
+
+def catalog():
+    """{(id_sucursal, familia): [Producto]}: una oferta de celular en la 101."""
+    return {
+        ("101", "CELULARES"): [product("c1", 1000.0, "101", "Cel"), product("c2", 800.0, "101", "Cel")],
+        ("102", "CELULARES"): [product("c3", 1000.0, "102", "Cel"), product("c4", 1000.0, "102", "Cel")],
+        ("101", "TABLETAS"): [product("t1", 3000.0, "101", "Tab")],
+        ("102", "TABLETAS"): [product("t2", 3000.0, "102", "Tab")],
+    }
+
+
+class FakeEngine:
+    """
+    Sustituto de ScrapeEngine que regresa `catalog()` por pareja y anota cada llamada;
+    las parejas de `failed` salen con páginas fallidas.
+    """
+
+    def __init__(self, failed=()):
+        self.failed = set(failed)
+        self.calls = []
+
+    def scrape_stores(self, stores, familias, progress=None, cancel=None):
+        self.calls.append((dict(stores), familias))
+        pairs = catalog()
+        for id_sucursal, nombre in stores.items():
+            store_familias = familias[id_sucursal] if isinstance(familias, dict) else familias
+            by_family = {familia: pairs[(id_sucursal, familia)] for familia in store_familias}
+            failed = {familia for familia in store_familias if (id_sucursal, familia) in self.failed}
+            products = [p for familia in store_familias for p in by_family[familia]]
+            yield id_sucursal, nombre, StoreProducts(products, failed_families=failed, by_family=by_family)
+
+
+class RunContinuousTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="programador_sondeo_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        patches = [
+            mock.patch.object(modelos_canonicos, "_index", modelos_canonicos.CanonicalModelIndex(fuzzy=False)),
+            mock.patch.object(historial_precios, "ENABLED", False),
+            mock.patch.object(indice_consultas, "_index", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_warm_sweep(self, engine):
+        """Corre sólo el barrido inicial; regresa (ofertas enviadas, planificador)."""
+        cancel = threading.Event()
+        sent = []
+
+        def send(deals):
+            # La primera oferta termina el bucle al final del tick
+            sent.extend(deals)
+            cancel.set()
+
+        scheduler = PollScheduler(((s, f) for s in STORES for f in FAMILIAS),
+                                  path=os.path.join(self.directory, "programa_sondeo.db"))
+        self.addCleanup(scheduler.conn.close)
+        run_continuous(STORES, FAMILIAS, 0, 24, cancel=cancel, engine=engine, send=send, scheduler=scheduler)
+        return sent, scheduler
+
+    def test_tick_is_one_engine_call_routed_by_pair(self):
+        engine = FakeEngine(failed={("102", "TABLETAS")})
+        _, scheduler = self.run_warm_sweep(engine)
+        self.assertEqual(engine.calls, [(STORES, {"101": FAMILIAS, "102": FAMILIAS})])
+        self.assertEqual(scheduler.stats[("101", "CELULARES")].filas, 2)
+        self.assertEqual(scheduler.stats[("101", "TABLETAS")].filas, 1)
+        self.assertEqual(scheduler.stats[("102", "CELULARES")].sondeos, 1)
+        # La pareja fallida no cuenta como sondeo ni afecta a las demás de su sucursal
+        self.assertEqual(scheduler.stats[("102", "TABLETAS")].sondeos, 0)
+
+    def test_warm_sweep_publishes_the_index(self):
+        sent, _ = self.run_warm_sweep(FakeEngine())
+        self.assertEqual([p.sku for p in sent], ["c2"])
+        index = indice_consultas.get_index()
+        self.assertIsNotNone(index)
+        self.assertEqual(index.total_products, 6)
+        self.assertEqual([(row["sku"], row["margen"]) for row in index.deals], [("c2", 200.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()